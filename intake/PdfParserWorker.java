@@ -0,0 +1,122 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+
+import com.itextpdf.text.Document;
+import com.itextpdf.text.pdf.PdfReader;
+import com.itextpdf.text.pdf.PdfSmartCopy;
+import com.itextpdf.text.pdf.PdfStamper;
+import org.codehaus.jackson.map.ObjectMapper;
+
+/*
+ * Extensions to PdfParser, used by intake.pdfparser and intake.pdfworkers.
+ *
+ * Adds one command to those supported by PdfParser:
+ *
+ *     concat_optimized file1 file2 ... destFileName
+ *
+ * which flattens the form fields of each file, removes duplicate
+ * resources (fonts, images) across files and compresses object streams.
+ *
+ * It is compiled once, at build time, with `make pdfparser.worker`:
+ *
+ *     javac -cp intake/pdfparser.jar -d intake/pdfparser_classes intake/PdfParserWorker.java
+ *
+ * Run with arguments, it runs a single command and exits:
+ *
+ *     java -cp intake/pdfparser.jar:intake/pdfparser_classes PdfParserWorker concat_optimized a.pdf b.pdf out.pdf
+ *
+ * Run without arguments, it stays running as a worker. It reads one JSON
+ * array of arguments per line from stdin, runs them with stdout and
+ * stderr captured, and writes a framed response:
+ *
+ *     RESULT <stdout byte count> <stderr byte count>\n<stdout><stderr>
+ *
+ * The single argument "ping" is answered with "pong" and is used as a
+ * health check.
+ */
+public class PdfParserWorker {
+
+    public static void main(String[] argv) throws Exception {
+        if (argv.length > 0) {
+            runCommand(argv);
+        } else {
+            serve();
+        }
+    }
+
+    static void runCommand(String[] args) throws Exception {
+        if (args[0].equals("ping")) {
+            System.out.print("pong");
+        } else if (args[0].equals("concat_optimized")) {
+            concatOptimized(args);
+        } else {
+            PdfParser.main(args);
+        }
+    }
+
+    static void concatOptimized(String[] args) throws Exception {
+        if (args.length < 3) {
+            System.err.println(
+                "Usage: pdfparser concat_optimized file1 file2 ... destFileName");
+            return;
+        }
+        Document document = new Document();
+        PdfSmartCopy copy = new PdfSmartCopy(
+            document, new FileOutputStream(args[args.length - 1]));
+        copy.setFullCompression();
+        document.open();
+        for (int i = 1; i < args.length - 1; i++) {
+            PdfReader reader = new PdfReader(args[i]);
+            ByteArrayOutputStream flattened = new ByteArrayOutputStream();
+            PdfStamper stamper = new PdfStamper(reader, flattened);
+            stamper.setFormFlattening(true);
+            stamper.close();
+            reader.close();
+            PdfReader flatReader = new PdfReader(flattened.toByteArray());
+            copy.addDocument(flatReader);
+            copy.freeReader(flatReader);
+            flatReader.close();
+        }
+        document.close();
+    }
+
+    static void serve() throws Exception {
+        ObjectMapper mapper = new ObjectMapper();
+        BufferedReader in = new BufferedReader(
+            new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        PrintStream realOut = System.out;
+        PrintStream realErr = System.err;
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            ByteArrayOutputStream out = new ByteArrayOutputStream();
+            ByteArrayOutputStream err = new ByteArrayOutputStream();
+            try {
+                String[] args = mapper.readValue(line, String[].class);
+                System.setOut(new PrintStream(out, true, "UTF-8"));
+                System.setErr(new PrintStream(err, true, "UTF-8"));
+                runCommand(args);
+            } catch (Throwable error) {
+                error.printStackTrace(new PrintStream(err, true, "UTF-8"));
+            } finally {
+                System.out.flush();
+                System.err.flush();
+                System.setOut(realOut);
+                System.setErr(realErr);
+            }
+            byte[] outBytes = out.toByteArray();
+            byte[] errBytes = err.toByteArray();
+            String header = "RESULT " + outBytes.length + " " + errBytes.length + "\n";
+            realOut.write(header.getBytes(StandardCharsets.UTF_8));
+            realOut.write(outBytes);
+            realOut.write(errBytes);
+            realOut.flush();
+        }
+    }
+}
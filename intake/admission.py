@@ -0,0 +1,186 @@
+import os
+import time
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionError(Exception):
+    """Raised when there is no capacity for more pdf work.
+    `retry_after` is a suggested number of seconds to wait
+    """
+
+    def __init__(self, message, retry_after=10):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HostSemaphore:
+    """A semaphore shared by every process on the host, built from
+    `flock`ed files in `directory`.
+
+    Each of the `slots` lock files can be held by one caller at a time.
+    Callers waiting for a slot hold one of `max_waiting` queue lock files,
+    so that the queue is bounded across processes. If the queue is full,
+    or a slot doesn't free up within `timeout` seconds, AdmissionError is
+    raised. Locks are released by the OS if a process dies.
+
+    Whoever holds a slot or queue file also holds an exclusive lock on a
+    matching `.held` file. The metrics only take shared locks on those,
+    so counting never makes a slot look taken to `acquire`
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, directory, slots=2, max_waiting=10, timeout=20,
+            retry_after=10):
+        self.directory = directory
+        self.slots = slots
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.retry_after = retry_after
+        # counters for this process
+        self.stats = {
+            'admitted': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+        }
+
+    def _lock_path(self, kind, index, suffix='lock'):
+        return os.path.join(
+            self.directory, '{}-{}.{}'.format(kind, index, suffix))
+
+    def _try_lock(self, kind, count):
+        """Tries to lock any one of `count` files, returning a pair of
+        open file descriptors for the lock file and its `.held` file,
+        or None if they are all locked
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        for index in range(count):
+            fd = os.open(self._lock_path(kind, index), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            held = os.open(
+                self._lock_path(kind, index, 'held'), os.O_RDWR | os.O_CREAT)
+            # only waits for a metrics probe to finish
+            fcntl.flock(held, fcntl.LOCK_EX)
+            return fd, held
+        return None
+
+    def _count_locked(self, kind, count):
+        locked = 0
+        for index in range(count):
+            path = self._lock_path(kind, index, 'held')
+            if not os.path.exists(path):
+                continue
+            fd = os.open(path, os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                locked += 1
+            finally:
+                os.close(fd)
+        return locked
+
+    def get_queue_depth(self):
+        """The number of callers on this host waiting for a slot
+        """
+        return self._count_locked('queue', self.max_waiting)
+
+    def get_active(self):
+        """The number of slots currently in use on this host
+        """
+        return self._count_locked('slot', self.slots)
+
+    def _release(self, fds):
+        for fd in reversed(fds):
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def acquire(self):
+        """Returns the file descriptors of a held slot.
+        Pass them to `release` when done
+        """
+        slot = self._try_lock('slot', self.slots)
+        if slot is not None:
+            self._record_admission(0.0)
+            return slot
+        queue_slot = self._try_lock('queue', self.max_waiting)
+        if queue_slot is None:
+            self.stats['rejected'] += 1
+            logger.warning("pdf admission rejected: queue is full")
+            raise AdmissionError(
+                "Too many pdfs are being generated right now",
+                retry_after=self.retry_after)
+        started = time.monotonic()
+        try:
+            while slot is None:
+                waited = time.monotonic() - started
+                if waited > self.timeout:
+                    self.stats['timed_out'] += 1
+                    logger.warning(
+                        "pdf admission timed out after %.2fs", waited)
+                    raise AdmissionError(
+                        "Timed out waiting to generate a pdf",
+                        retry_after=self.retry_after)
+                time.sleep(self.poll_interval)
+                slot = self._try_lock('slot', self.slots)
+        finally:
+            self._release(queue_slot)
+        self._record_admission(time.monotonic() - started)
+        return slot
+
+    def try_acquire(self):
+        """Returns the file descriptors of a slot if one is free right
+        now, or None, without waiting or queueing
+        """
+        slot = self._try_lock('slot', self.slots)
+        if slot is not None:
+            self._record_admission(0.0)
+        return slot
+
+    def _record_admission(self, waited):
+        self.stats['admitted'] += 1
+        self.stats['total_wait'] += waited
+        self.stats['max_wait'] = max(self.stats['max_wait'], waited)
+        if waited:
+            logger.info(
+                "pdf admission waited %.2fs, queue depth %s",
+                waited, self.get_queue_depth())
+
+    def release(self, slot):
+        self._release(slot)
+
+    @contextmanager
+    def slot(self):
+        slot = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(slot)
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_semaphore(directory, slots=2, max_waiting=10, timeout=20,
+        retry_after=10):
+    """Returns the process-wide semaphore for a lock directory
+    """
+    with _semaphores_lock:
+        key = (directory, slots, max_waiting, timeout, retry_after)
+        if key not in _semaphores:
+            _semaphores[key] = HostSemaphore(
+                directory, slots=slots, max_waiting=max_waiting,
+                timeout=timeout, retry_after=retry_after)
+        return _semaphores[key]
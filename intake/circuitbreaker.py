@@ -0,0 +1,173 @@
+import logging
+import threading
+from datetime import timedelta
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone as timezone_utils
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service that has been failing.
+    `retry_after` is the number of seconds until it will be tried again
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(
+            "{} is unavailable, retry in {:.0f}s".format(name, retry_after))
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling a remote service while it is failing, so that
+    callers fail fast instead of waiting on it.
+
+    While closed, calls are counted in windows of `window` seconds. Once
+    at least `minimum_calls` have been made in a window and `failure_rate`
+    of them failed, the breaker opens, and calls raise CircuitOpenError
+    for `open_seconds`. Only a failure can open it. After that it is half-open: the next call is let
+    through as a trial, and closes the breaker if it works or opens it
+    again if it doesn't, while other calls still fail fast.
+
+    The state is kept in the database, in a CircuitBreakerState row, so
+    that it is shared by every worker. `on_change` is called with the
+    breaker and the new state, CLOSED or OPEN, by the one worker that
+    made the change. Reopening after a failed trial isn't a change.
+    Successes while closed are counted with a single UPDATE rather than
+    by locking the row, so that they don't wait on each other
+    """
+
+    def __init__(self, name, failure_rate=0.5, minimum_calls=5, window=60,
+            open_seconds=60, on_change=None, now=timezone_utils.now):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.window = timedelta(seconds=window)
+        self.open_seconds = timedelta(seconds=open_seconds)
+        self.on_change = on_change
+        self.now = now
+
+    def get_state(self, lock=False):
+        from intake.models import CircuitBreakerState
+        states = CircuitBreakerState.objects
+        if lock:
+            states = states.select_for_update()
+        state = states.filter(name=self.name).first()
+        if state is None:
+            state, created = CircuitBreakerState.objects.get_or_create(
+                name=self.name, defaults={'window_start': self.now()})
+            if lock:
+                state = states.get(pk=state.pk)
+        return state
+
+    def before_call(self):
+        """Returns True if the call is a half-open trial, and raises
+        CircuitOpenError if it shouldn't be made at all
+        """
+        if self.get_state().state == CLOSED:
+            return False
+        with transaction.atomic():
+            state = self.get_state(lock=True)
+            if state.state == CLOSED:
+                return False
+            now = self.now()
+            if now < state.opened_until:
+                raise CircuitOpenError(
+                    self.name, (state.opened_until - now).total_seconds())
+            # this caller makes the trial call, and the others wait as
+            # though the breaker were open, until it finishes or hangs
+            state.opened_until = now + self.open_seconds
+            state.updated = now
+            state.save()
+            return True
+
+    def record_success(self):
+        """Counts a successful call in the current window, if the breaker
+        is closed and the window hasn't ended. Returns False otherwise
+        """
+        from intake.models import CircuitBreakerState
+        now = self.now()
+        return CircuitBreakerState.objects.filter(
+            name=self.name, state=CLOSED,
+            window_start__gte=now - self.window,
+            ).update(calls=F('calls') + 1, updated=now) > 0
+
+    def record(self, success, trial=False):
+        if success and not trial and self.record_success():
+            return
+        changed = None
+        with transaction.atomic():
+            state = self.get_state(lock=True)
+            now = self.now()
+            if trial:
+                if success:
+                    state.state = CLOSED
+                    state.opened_until = None
+                    state.calls = state.failures = 0
+                    state.window_start = now
+                    changed = CLOSED
+                else:
+                    state.opened_until = now + self.open_seconds
+            elif state.state == CLOSED:
+                if now - state.window_start > self.window:
+                    state.calls = state.failures = 0
+                    state.window_start = now
+                state.calls += 1
+                if not success:
+                    state.failures += 1
+                if (not success and state.calls >= self.minimum_calls and
+                        state.failures >= self.failure_rate * state.calls):
+                    state.state = OPEN
+                    state.opened_until = now + self.open_seconds
+                    changed = OPEN
+            state.updated = now
+            state.save()
+        if changed:
+            logger.warning("circuit breaker %s is now %s", self.name, changed)
+            if self.on_change:
+                self.on_change(self, changed)
+
+    @contextmanager
+    def call(self, is_failure=lambda error: True):
+        """Wraps a call to the service. Exceptions raised in the block
+        count as failures if `is_failure(error)` is True
+        """
+        trial = self.before_call()
+        try:
+            yield
+        except Exception as error:
+            self.record(not is_failure(error), trial)
+            raise
+        self.record(True, trial)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, on_change=None):
+    """Returns this process's breaker for `name`, configured by the
+    CIRCUIT_BREAKER_* settings
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_rate=getattr(
+                    settings, 'CIRCUIT_BREAKER_FAILURE_RATE', 0.5),
+                minimum_calls=getattr(
+                    settings, 'CIRCUIT_BREAKER_MINIMUM_CALLS', 5),
+                window=getattr(settings, 'CIRCUIT_BREAKER_WINDOW', 60),
+                open_seconds=getattr(
+                    settings, 'CIRCUIT_BREAKER_OPEN_SECONDS', 60),
+                on_change=on_change)
+        return _breakers[name]
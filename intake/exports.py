@@ -0,0 +1,58 @@
+import os
+import datetime
+
+from django.conf import settings
+from django.utils.text import slugify
+from pytz import timezone
+
+from intake import models
+
+
+Pacific = timezone('US/Pacific')
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def get_submissions(ids=None, start=None, end=None):
+    """Returns the submissions to export, either by id, or received
+    between the `start` and `end` dates, inclusive, in Pacific time
+    """
+    submissions = models.FormSubmission.objects.order_by('date_received')
+    if ids:
+        submissions = submissions.filter(pk__in=ids)
+    if start:
+        submissions = submissions.filter(date_received__gte=Pacific.localize(
+            datetime.datetime.combine(start, datetime.time.min)))
+    if end:
+        submissions = submissions.filter(date_received__lt=Pacific.localize(
+            datetime.datetime.combine(
+                end + datetime.timedelta(days=1), datetime.time.min)))
+    return list(submissions)
+
+
+def get_filename(submission):
+    return '{}-{}-{}.pdf'.format(
+        submission.get_local_date_received('%Y-%m-%d'),
+        slugify(submission.get_anonymous_display()),
+        submission.id)
+
+
+def iter_files(submissions, fillable=None):
+    """Yields `(name, path, on_written)` for the filled pdf of each
+    submission, for `responses.iter_zip`. Cached pdfs are reused, and
+    the rest are filled a few at a time as the export is consumed
+    """
+    fillable = fillable or models.FillablePDF.get_default_instance()
+    pdfs = fillable.iter_bundle_parts(
+        submissions, part_size=1,
+        max_workers=getattr(settings, 'PDF_BUNDLE_PART_WORKERS', 2))
+    try:
+        for part, path, is_temporary in pdfs:
+            on_written = None
+            if is_temporary:
+                on_written = lambda path=path: os.remove(path)
+            yield get_filename(part[0]), path, on_written
+    finally:
+        pdfs.close()
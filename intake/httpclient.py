@@ -0,0 +1,211 @@
+"""Sends requests to remote APIs, such as Front and Slack, through one
+pooled keep-alive `requests.Session` per host, with timeouts, retries,
+and respect for rate limits
+"""
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import ConnectTimeoutError
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# responses that say a request wasn't acted on, if they have a Retry-After
+RETRY_AFTER_STATUSES = (429, 503)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+def is_connect_error(error):
+    """Whether a ConnectionError happened before the request was sent,
+    rather than, say, the connection being dropped while waiting for
+    the response
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    # urllib3's NewConnectionError is a ConnectTimeoutError too
+    return isinstance(reason, ConnectTimeoutError)
+
+
+class HTTPClient:
+    """Keeps a session for each scheme and host, so that connections
+    are reused between requests.
+
+    Requests that fail to connect are retried up to `retries` times.
+    Idempotent requests, such as GETs, are also retried after other
+    connection errors and after a 429 or 5xx response. Other requests,
+    such as POSTs to Front that send a message, may already have been
+    acted on. So they are only retried after a 429 or 503 response with
+    a Retry-After or X-RateLimit-Reset header, which says they weren't.
+    Timeouts while reading a response are never retried, for the same
+    reason.
+
+    Retries wait for the response's Retry-After or X-RateLimit-Reset
+    header if it has one, and otherwise for a random time of up to
+    `backoff` seconds, doubling with each attempt. A response that asks
+    us to wait longer than `max_backoff` is returned rather than
+    waited for.
+
+    When a response's X-RateLimit-Remaining header, as sent by Front,
+    says that no requests are left, later requests to the same host wait
+    until its X-RateLimit-Reset time
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, retries=2,
+            backoff=0.5, max_backoff=10, pool_size=10,
+            sleep=time.sleep, clock=time.time):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.sleep = sleep
+        self.clock = clock
+        self._sessions = {}
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def get_host(self, url):
+        parts = urlsplit(url)
+        return '{}://{}'.format(parts.scheme, parts.netloc)
+
+    def get_session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size,
+                    max_retries=0)
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def get_backoff(self, attempt):
+        return random.uniform(0, min(
+            self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get_retry_after(self, response):
+        """Returns the seconds to wait that a response asks for, if any
+        """
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return max(float(retry_after), 0)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(
+                        retry_after).timestamp() - self.clock(), 0)
+                except (TypeError, ValueError):
+                    pass
+        reset = response.headers.get('X-RateLimit-Reset')
+        if reset and response.status_code == 429:
+            try:
+                return max(float(reset) - self.clock(), 0)
+            except ValueError:
+                pass
+        return None
+
+    def can_retry(self, method, response, retry_after):
+        if method.upper() in IDEMPOTENT_METHODS:
+            return response.status_code in RETRY_STATUSES
+        return (response.status_code in RETRY_AFTER_STATUSES and
+                retry_after is not None)
+
+    def note_rate_limit(self, host, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        try:
+            if int(remaining) <= 0:
+                with self._lock:
+                    self._blocked_until[host] = float(reset)
+        except ValueError:
+            pass
+
+    def wait_for_rate_limit(self, host):
+        with self._lock:
+            blocked_until = self._blocked_until.pop(host, None)
+        if blocked_until:
+            delay = blocked_until - self.clock()
+            if delay > 0:
+                logger.info("waiting %.1fs for the %s rate limit", delay, host)
+                self.sleep(min(delay, self.max_backoff))
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = self.get_host(url)
+        session = self.get_session(host)
+        attempt = 0
+        while True:
+            self.wait_for_rate_limit(host)
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.ConnectionError as error:
+                # includes connect timeouts, but not read timeouts
+                if attempt >= self.retries or not (
+                        method.upper() in IDEMPOTENT_METHODS or
+                        is_connect_error(error)):
+                    raise
+                delay = self.get_backoff(attempt)
+                logger.warning("retrying %s %s in %.1fs after %s",
+                    method, url, delay, error)
+            else:
+                self.note_rate_limit(host, response)
+                delay = self.get_retry_after(response)
+                if (attempt >= self.retries or
+                        not self.can_retry(method, response, delay)):
+                    return response
+                if delay is None:
+                    delay = self.get_backoff(attempt)
+                elif delay > self.max_backoff:
+                    return response
+                logger.warning("retrying %s %s in %.1fs after status %s",
+                    method, url, delay, response.status_code)
+            attempt += 1
+            self.sleep(delay)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the client shared by this process, configured by the
+    HTTP_CLIENT_* settings
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient(
+                connect_timeout=getattr(
+                    settings, 'HTTP_CLIENT_CONNECT_TIMEOUT', 3.05),
+                read_timeout=getattr(
+                    settings, 'HTTP_CLIENT_READ_TIMEOUT', 10),
+                retries=getattr(settings, 'HTTP_CLIENT_RETRIES', 2),
+                backoff=getattr(settings, 'HTTP_CLIENT_BACKOFF', 0.5),
+                max_backoff=getattr(settings, 'HTTP_CLIENT_MAX_BACKOFF', 10),
+                pool_size=getattr(settings, 'HTTP_CLIENT_POOL_SIZE', 10))
+        return _client
+
+
+def post(url, **kwargs):
+    return get_client().post(url, **kwargs)
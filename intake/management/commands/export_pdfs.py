@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from intake import exports, responses
+
+
+class Command(BaseCommand):
+    help = 'Writes a zip with one filled pdf per application'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='path of the zip file to write')
+        parser.add_argument('--ids', type=int, nargs='+',
+            help='ids of the submissions to export')
+        parser.add_argument('--start', type=exports.parse_date,
+            help='export submissions received on or after this date')
+        parser.add_argument('--end', type=exports.parse_date,
+            help='export submissions received on or before this date')
+
+    def handle(self, *args, **options):
+        if not (options['ids'] or options['start'] or options['end']):
+            raise CommandError("Choose submissions with --ids or --start/--end")
+        submissions = exports.get_submissions(
+            ids=options['ids'], start=options['start'], end=options['end'])
+        if not submissions:
+            raise CommandError("There are no submissions to export")
+        with open(options['output'], 'wb') as output:
+            for chunk in responses.iter_zip(exports.iter_files(submissions)):
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            "Exported {} pdfs to {}".format(
+                len(submissions), options['output'])))
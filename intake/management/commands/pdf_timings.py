@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from intake import models, pdftiming
+
+
+class Command(BaseCommand):
+    help = 'Fills a sample pdf and prints how long each phase took'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int,
+            help='ids of the submissions to fill, defaults to the latest')
+        parser.add_argument('--count', type=int, default=1,
+            help='number of recent submissions to fill, if no ids are given')
+
+    def get_submissions(self, options):
+        if options['ids']:
+            return list(models.FormSubmission.objects.filter(
+                id__in=options['ids']).order_by('id'))
+        return list(models.FormSubmission.objects.order_by(
+            '-date_received')[:options['count']])
+
+    def handle(self, *args, **options):
+        fillable = models.FillablePDF.get_default_instance()
+        if not fillable:
+            raise CommandError("There is no FillablePDF to fill")
+        submissions = self.get_submissions(options)
+        if not submissions:
+            raise CommandError("There are no submissions to fill")
+        with pdftiming.collect() as collector:
+            with pdftiming.span('total', files=len(submissions)):
+                if len(submissions) == 1:
+                    fillable.fill(submissions[0])
+                else:
+                    fillable.fill_many(submissions)
+        self.stdout.write(self.format_breakdown(collector.get_breakdown()))
+
+    def format_breakdown(self, breakdown):
+        row = '{:<20} {:>6} {:>10} {:>10} {:>12} {:>12} {:>7}'
+        lines = [row.format(
+            'phase', 'count', 'total s', 'max s', 'bytes in', 'bytes out',
+            'errors')]
+        for name, phase in breakdown:
+            lines.append(row.format(
+                name, phase['count'],
+                '{:.3f}'.format(phase['total']),
+                '{:.3f}'.format(phase['max']),
+                phase['bytes_in'], phase['bytes_out'], phase['errors']))
+        return '\n'.join(lines)
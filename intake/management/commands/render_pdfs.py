@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from intake import models
+
+
+class Command(BaseCommand):
+    help = 'Fills and caches pdfs for any submissions that do not have one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+            help='keep sweeping for new submissions, for use as a worker')
+        parser.add_argument('--interval', type=int, default=30,
+            help='seconds to wait between sweeps when using --loop')
+
+    def sweep(self):
+        fillable = models.FillablePDF.get_default_instance()
+        if not fillable:
+            return [], []
+        submissions = models.FormSubmission.get_unrendered_apps(
+            max_attempts=getattr(settings, 'PDF_RENDER_MAX_ATTEMPTS', 3),
+            days=getattr(settings, 'PDF_PRERENDER_DAYS', 30))
+        return fillable.prerender(submissions)
+
+    def handle(self, *args, **options):
+        while True:
+            rendered, failed = self.sweep()
+            if rendered or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    "Rendered {} pdfs, {} failed".format(
+                        len(rendered), len(failed))))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from intake import models
+
+
+class Command(BaseCommand):
+    help = 'Builds the pdfs for any pending bundle jobs and deletes expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+            help='keep checking for new jobs, for use as a worker')
+        parser.add_argument('--interval', type=int, default=5,
+            help='seconds to wait between checks when using --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = models.BundleJob.run_pending()
+            expired = models.BundleJob.delete_expired()
+            if jobs or expired or not options['loop']:
+                failed = [j for j in jobs if j.status == models.BundleJob.FAILED]
+                self.stdout.write(self.style.SUCCESS(
+                    "Ran {} bundle jobs, {} failed, deleted {} expired".format(
+                        len(jobs), len(failed), expired)))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
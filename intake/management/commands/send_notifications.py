@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from intake import models
+
+
+class Command(BaseCommand):
+    help = 'Sends any notifications waiting in the outbox, and slack digests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+            help='keep checking for new notifications, for use as a worker')
+        parser.add_argument('--interval', type=int, default=2,
+            help='seconds to wait between checks when using --loop')
+        parser.add_argument('--retry-failed', action='store_true',
+            help='queue notifications that ran out of attempts to be sent again')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            count = models.NotificationOutboxEntry.retry_failed()
+            self.stdout.write("Queued {} failed notifications".format(count))
+        while True:
+            entries = models.NotificationOutboxEntry.send_pending()
+            digests = models.SlackDigestEvent.send_due()
+            if entries or digests or not options['loop']:
+                outbox = models.NotificationOutboxEntry
+                retrying = [e for e in entries if e.status == outbox.PENDING]
+                failed = [e for e in entries if e.status == outbox.FAILED]
+                self.stdout.write(self.style.SUCCESS(
+                    "Sent {} notifications and {} slack digests, "
+                    "{} will be retried, {} failed".format(
+                        len(entries) - len(retrying) - len(failed),
+                        len(digests), len(retrying), len(failed))))
+                for entry in failed:
+                    self.stderr.write("Notification {} failed: {}".format(
+                        entry.id, entry.error))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+from django.http import HttpResponse
+
+from intake.admission import AdmissionError
+
+
+class PDFAdmissionMiddleware:
+    """Turns AdmissionError, raised when the host is too busy to
+    generate more pdfs, into a 503 response with a Retry-After header
+    """
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, AdmissionError):
+            response = HttpResponse(
+                "Too many PDFs are being generated right now. "
+                "Please try again shortly.",
+                status=503, content_type='text/plain')
+            response['Retry-After'] = str(exception.retry_after)
+            return response
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import intake.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intake', '0012_auto_20160706_2010'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilledPDFCacheEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('pdf', models.FileField(storage=intake.storage.PrivateStorage(), upload_to='filled_pdfs/')),
+                ('size', models.PositiveIntegerField()),
+                ('last_accessed', models.DateTimeField(default=django.utils.timezone.now)),
+                ('submission', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cached_pdfs', to='intake.FormSubmission')),
+                ('bundle_submissions', models.ManyToManyField(related_name='cached_bundles', to='intake.FormSubmission')),
+            ],
+        ),
+    ]
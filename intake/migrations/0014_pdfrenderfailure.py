@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intake', '0013_filledpdfcacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PDFRenderFailure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('error', models.TextField(blank=True)),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pdf_render_failures', to='intake.FormSubmission')),
+            ],
+            options={
+                'ordering': ['-time'],
+            },
+        ),
+    ]
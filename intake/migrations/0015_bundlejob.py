@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import intake.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intake', '0014_pdfrenderfailure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BundleJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submission_ids', models.TextField()),
+                ('status', models.PositiveSmallIntegerField(choices=[(1, 'pending'), (2, 'running'), (3, 'done'), (4, 'failed')], default=1)),
+                ('cache_key', models.CharField(blank=True, max_length=40)),
+                ('pdf', models.FileField(blank=True, storage=intake.storage.PrivateStorage(), upload_to='bundles/')),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('submissions', models.ManyToManyField(related_name='bundle_jobs', to='intake.FormSubmission')),
+            ],
+            options={
+                'ordering': ['created'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('intake', '0018_slackdigestevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fillablepdf',
+            name='field_data',
+            field=django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='fillablepdf',
+            name='field_data_key',
+            field=models.TextField(blank=True),
+        ),
+    ]
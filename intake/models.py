@@ -1,29 +1,102 @@
+import os
 import importlib
+import hashlib
+import json
+import logging
+import time
 import uuid
 import random
+import shutil
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from tempfile import mkstemp, gettempdir
 from django.conf import settings
-from django.db import models
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
 from pytz import timezone
 from django.utils import timezone as timezone_utils
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import JSONField
 
-from intake import pdfparser, anonymous_names, notifications, fields
+from intake import admission, circuitbreaker, storage, pdfforms, pdfparser, pdftiming, pdfworkers, templatecache, anonymous_names, notifications, fields
 from intake.constants import CONTACT_METHOD_CHOICES, CONTACT_PREFERENCE_CHECKS, STAFF_NAME_CHOICES
 
 
+logger = logging.getLogger(__name__)
+
+
+
+# errors that say nothing about the submission being rendered, such as
+# the host being too busy, so they don't count as failures to render it
+TRANSIENT_RENDER_ERRORS = (
+    admission.AdmissionError, pdfworkers.PDFWorkerTimeout, OSError)
+
 
 def gen_uuid():
     return uuid.uuid4().hex
 
 def get_parser():
-    parser = pdfparser.PDFParser()
+    backend = getattr(settings, 'PDFPARSER_BACKEND', 'subprocess')
+    parser_class = pdfparser.PDFParser
+    if backend == 'python':
+        parser_class = pdfforms.PythonPDFParser
+    parser = parser_class(
+        max_fill_workers=getattr(settings, 'PDFPARSER_FILL_WORKERS', 1),
+        in_memory=getattr(settings, 'PDFPARSER_IN_MEMORY', False),
+        optimize_joins=getattr(settings, 'PDFPARSER_OPTIMIZE_JOINS', False))
     parser.PDFPARSER_PATH = getattr(settings, 'PDFPARSER_PATH',
         'intake/pdfparser.jar')
+    if backend == 'workers':
+        parser.worker_pool = pdfworkers.get_worker_pool(
+            parser.PDFPARSER_PATH,
+            size=getattr(settings, 'PDFPARSER_WORKERS', 2),
+            timeout=getattr(settings, 'PDFPARSER_WORKER_TIMEOUT', 60))
+    slots = getattr(settings, 'PDF_ADMISSION_SLOTS', 0)
+    if slots:
+        parser.admission = admission.get_semaphore(
+            getattr(settings, 'PDF_ADMISSION_LOCK_DIR', None) or os.path.join(
+                gettempdir(), 'intake-pdf-slots'),
+            slots=slots,
+            max_waiting=getattr(settings, 'PDF_ADMISSION_MAX_WAITING', 10),
+            timeout=getattr(settings, 'PDF_ADMISSION_TIMEOUT', 20),
+            retry_after=getattr(settings, 'PDF_ADMISSION_RETRY_AFTER', 10))
     return parser
 
 
+def get_local_file(field_file):
+    """Returns `(path, is_temporary)` for a stored file, copying it to a
+    temporary file if it isn't on the local disk
+    """
+    try:
+        path = field_file.path
+    except (NotImplementedError, ValueError):
+        path = None
+    if path and os.path.isfile(path):
+        return path, False
+    os_int, tmp_path = mkstemp(suffix=os.path.splitext(field_file.name)[1])
+    with open(os_int, 'wb') as tmp_file:
+        field_file.open('rb')
+        for chunk in field_file.chunks():
+            tmp_file.write(chunk)
+        field_file.close()
+    return tmp_path, True
+
+
+def get_template_cache():
+    return templatecache.LocalFileCache(
+        getattr(settings, 'PDF_TEMPLATE_CACHE_DIR', None) or os.path.join(
+            gettempdir(), 'intake-pdf-templates'),
+        max_bytes=getattr(settings, 'PDF_TEMPLATE_CACHE_MAX_BYTES', 0))
+
+
 class FormSubmission(models.Model):
 
     answers = JSONField()
@@ -38,12 +111,13 @@ class FormSubmission(models.Model):
         ordering = ['-date_received']
 
     @classmethod
-    def mark_viewed(cls, submissions, user):
+    def mark_viewed(cls, submissions, user, notify=True):
         logs = ApplicationLogEntry.log_opened(
             [s.id for s in submissions], user)
-        # send a slack notification
-        notifications.slack_submissions_viewed.send(
-            submissions=submissions, user=user)
+        if notify:
+            # send a slack notification
+            notifications.slack_submissions_viewed.send(
+                submissions=submissions, user=user)
         return submissions, logs
 
     @classmethod
@@ -75,6 +149,22 @@ class FormSubmission(models.Model):
             logs__user__profile__organization__is_receiving_agency=True
             ).distinct()
 
+    @classmethod
+    def get_unrendered_apps(cls, max_attempts=3, days=30):
+        """Submissions received in the last `days` days and not yet
+        opened by an agency, without a cached pdf, excluding any that
+        have already failed to render `max_attempts` times.
+        Older and opened submissions are left to be filled when they
+        are viewed, so that entries evicted from the cache aren't
+        filled again straight away
+        """
+        since = timezone_utils.now() - timedelta(days=days)
+        return cls.get_unopened_apps().filter(
+            date_received__gte=since, cached_pdfs__isnull=True
+            ).annotate(
+            render_failures=models.Count('pdf_render_failures')
+            ).filter(render_failures__lt=max_attempts)
+
     @classmethod
     def all_plus_related_objects(cls):
         return cls.objects.prefetch_related('logs__user__profile__organization').all()
@@ -141,54 +231,79 @@ class FormSubmission(models.Model):
                 info[short] = self.answers.get(field_name, '')
         return info
 
-    def send_notification(self, notification, contact_info_key, **context):
-        contact_info = self.get_contact_info()
-        contact_info_used = {
-            contact_info_key: contact_info[contact_info_key]
-        }
-        notification.send(
-            to=[contact_info[contact_info_key]],
-            **context
-            )
-        ApplicationLogEntry.log_confirmation_sent(
-            submission_id=self.id, user=None, time=None,
-            contact_info=contact_info_used,
-            message_sent=notification.render_content_fields(**context)
-            )
+    def get_confirmations_sent(self):
+        """Returns the contact methods that a confirmation has already
+        been sent to
+        """
+        sent = set()
+        for log in ApplicantContactedLogEntry.objects.filter(
+                submission=self, event_type=ApplicationLogEntry.CONFIRMATION_SENT):
+            sent.update(log.contact_info)
+        return sent
 
-    def send_confirmation_notifications(self):
+    def send_confirmation_notifications(self, staff_name=None, exclude=(),
+            raise_outages=False):
+        """Sends a confirmation to each preferred contact method,
+        except those in `exclude`, all at the same time.
+        Errors from Front are reported to slack as failures, unless
+        `raise_outages` is set and they mean Front is having trouble,
+        such as a 5xx or 429 response, in which case they are raised so
+        that the caller can try again
+        """
         contact_info = self.get_contact_info()
-        errors = {}
         context = dict(
-            staff_name=random.choice(STAFF_NAME_CHOICES),
+            staff_name=staff_name or random.choice(STAFF_NAME_CHOICES),
             name=self.answers['first_name']
             )
         notify_map = {
             'email': notifications.email_confirmation,
             'sms': notifications.sms_confirmation
         }
-        for key, notification in notify_map.items():
-            if key in contact_info:
-                try:
-                    self.send_notification(
-                        notification, key, **context)
-                except notifications.FrontAPIError as error:
-                    errors[key] = error
+        sends = {
+            key: functools.partial(
+                notification.send, to=[contact_info[key]], **context)
+            for key, notification in notify_map.items()
+            if key in contact_info and key not in exclude}
+        results, errors = notifications.send_all(sends)
+        ApplicationLogEntry.log_confirmations_sent(self.id, [
+            ({key: contact_info[key]},
+             notify_map[key].render_content_fields(**context))
+            for key in sorted(results)])
+        for key, error in errors.items():
+            # anything but an error from front is raised, once the
+            # confirmations that did go out have been logged
+            if not isinstance(error, notifications.FrontAPIError) or (
+                    raise_outages and notify_map[key].is_outage(error)):
+                raise error
         successes = sorted([key for key in contact_info if key not in errors])
+        slack_sends = {}
         if successes:
-            notifications.slack_confirmation_sent.send(
+            slack_sends['sent'] = functools.partial(
+                notifications.slack_confirmation_sent.send,
                 submission=self,
                 methods=successes)
         if errors:
-            notifications.slack_confirmation_send_failed.send(
+            slack_sends['failed'] = functools.partial(
+                notifications.slack_confirmation_send_failed.send,
                 submission=self,
                 errors=errors)
+        slack_results, slack_errors = notifications.send_all(slack_sends)
+        for error in slack_errors.values():
+            raise error
         return self.confirmation_flash_messages(successes, contact_info)
 
-    def confirmation_flash_messages(self, successes, contact_info):
+    def confirmation_flash_messages(self, successes, contact_info,
+            queued=False):
+        """Messages for the applicant about the confirmations sent to
+        each method in `successes`, or about to be sent if `queued`
+        """
         messages = []
-        sent_email_message = _("We've sent you an email at {}")
-        sent_sms_message = _("We've sent you a text message at {}")
+        if queued:
+            sent_email_message = _("We will send you an email at {}")
+            sent_sms_message = _("We will send you a text message at {}")
+        else:
+            sent_email_message = _("We've sent you an email at {}")
+            sent_sms_message = _("We've sent you a text message at {}")
         for method in successes:
             if method == 'email':
                 messages.append(sent_email_message.format(contact_info['email']))
@@ -199,6 +314,15 @@ class FormSubmission(models.Model):
     def get_anonymous_display(self):
         return self.anonymous_name
 
+    def get_answers_digest(self):
+        """A hash of everything about this submission that can change
+        the contents of its filled pdf
+        """
+        content = json.dumps(
+            [self.answers, self.date_received],
+            sort_keys=True, cls=DjangoJSONEncoder)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
     def __str__(self):
         return self.get_anonymous_display()
 
@@ -268,6 +392,41 @@ class ApplicationLogEntry(models.Model):
             contact_info=contact_info,
             message_sent=message_sent)
 
+    @classmethod
+    def log_confirmations_sent(cls, submission_id, confirmations, user=None, time=None):
+        """Logs several confirmations, given as `(contact_info, message_sent)`
+        pairs, with one insert into each table. bulk_create can't save
+        multi-table models like ApplicantContactedLogEntry, so the parent
+        rows are bulk created first, and the child rows are added for them
+        """
+        if not confirmations:
+            return []
+        if not time:
+            time = timezone_utils.now()
+        with transaction.atomic():
+            ApplicationLogEntry.objects.bulk_create([
+                ApplicationLogEntry(
+                    time=time, user=user, submission_id=submission_id,
+                    event_type=cls.CONFIRMATION_SENT)
+                for contact_info, message_sent in confirmations])
+            # bulk_create doesn't set ids, and no other transaction can see
+            # the new rows, so they're the only ones without a child row
+            ids = ApplicationLogEntry.objects.filter(
+                submission_id=submission_id,
+                event_type=cls.CONFIRMATION_SENT,
+                applicantcontactedlogentry__isnull=True
+                ).order_by('id').values_list('id', flat=True)
+            logs = [
+                ApplicantContactedLogEntry(
+                    id=pk, applicationlogentry_ptr_id=pk,
+                    time=time, user=user, submission_id=submission_id,
+                    event_type=cls.CONFIRMATION_SENT,
+                    contact_info=contact_info, message_sent=message_sent)
+                for pk, (contact_info, message_sent)
+                in zip(ids, confirmations)]
+            ApplicantContactedLogEntry._base_manager._insert(
+                logs, fields=ApplicantContactedLogEntry._meta.local_concrete_fields)
+        return logs
 
 
 class ApplicantContactedLogEntry(ApplicationLogEntry):
@@ -275,45 +434,1011 @@ class ApplicantContactedLogEntry(ApplicationLogEntry):
     message_sent = models.TextField(blank=True)
 
 
+# field data for each template pdf, keyed by FillablePDF.get_template_key
+_field_data_cache = {}
+
+
+def import_translator(import_path):
+    import_path_parts = import_path.split('.')
+    callable_name = import_path_parts.pop()
+    module_path = '.'.join(import_path_parts)
+    module = importlib.import_module(module_path)
+    return getattr(module, callable_name)
+
+
+class FillablePDFRegistry:
+    """Remembers the default FillablePDF, resolved translators and
+    template keys for each process, so that PDF views don't need to
+    query the database, import translators or check file storage.
+    Cleared whenever a FillablePDF is saved or deleted in this process,
+    and after settings.FILLABLE_PDF_REGISTRY_TTL seconds, so that other
+    processes pick up changes.
+    Only the default FillablePDF's field values are kept, and each caller
+    gets its own instance, since its pdf file can't be shared between
+    threads
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._loaded_at = time.monotonic()
+        self._default_row = None
+        self._translators = {}
+        self._template_keys = {}
+
+    def check_expiry(self):
+        ttl = getattr(settings, 'FILLABLE_PDF_REGISTRY_TTL', 60)
+        if time.monotonic() - self._loaded_at > ttl:
+            self.clear()
+
+    def get_default_instance(self):
+        self.check_expiry()
+        field_names = [f.attname for f in FillablePDF._meta.concrete_fields]
+        if self._default_row is None:
+            self._default_row = FillablePDF.objects.values_list(
+                *field_names).first() or ()
+        if not self._default_row:
+            return None
+        return FillablePDF.from_db(
+            FillablePDF.objects.db, field_names, self._default_row)
+
+    def get_translator(self, import_path):
+        self.check_expiry()
+        if import_path not in self._translators:
+            self._translators[import_path] = import_translator(import_path)
+        return self._translators[import_path]
+
+    def get_template_key(self, fillable):
+        if fillable.pk is None:
+            return fillable.build_template_key()
+        self.check_expiry()
+        lookup = (fillable.pk, fillable.pdf.name)
+        if lookup not in self._template_keys:
+            self._template_keys[lookup] = fillable.build_template_key()
+        return self._template_keys[lookup]
+
+
+fillable_registry = FillablePDFRegistry()
+
+
 class FillablePDF(models.Model):
     name = models.CharField(max_length=50)
     pdf = models.FileField(upload_to='pdfs/')
     translator = models.TextField()
+    # the field data read from `pdf`, and the template key it was read for
+    field_data = JSONField(null=True, blank=True)
+    field_data_key = models.TextField(blank=True)
 
     @classmethod
     def get_default_instance(cls):
-        return cls.objects.first()
+        return fillable_registry.get_default_instance()
 
     def get_pdf(self):
         self.pdf.seek(0)
         return self.pdf
 
+    def get_local_pdf(self):
+        """Returns a path to the template pdf on the local disk.
+        Templates kept in remote storage are downloaded once and cached
+        in settings.PDF_TEMPLATE_CACHE_DIR
+        """
+        try:
+            path = self.pdf.path
+        except (NotImplementedError, ValueError):
+            path = None
+        if path and os.path.isfile(path):
+            return path
+        with pdftiming.span('fetch_template') as span:
+            path = get_template_cache().get_path(
+                self.get_template_key(), self.get_pdf)
+            span.bytes_out = os.path.getsize(path)
+        return path
+
     def get_translator(self):
-        import_path_parts = self.translator.split('.')
-        callable_name = import_path_parts.pop()
-        module_path = '.'.join(import_path_parts)
-        module = importlib.import_module(module_path)
-        return getattr(module, callable_name)
+        return fillable_registry.get_translator(self.translator)
+
+    def get_template_key(self):
+        return fillable_registry.get_template_key(self)
+
+    def build_template_key(self):
+        """Identifies the current version of the template pdf,
+        using its storage name and modification time
+        so that replacing the file invalidates any cached copies or data
+        """
+        try:
+            modified = self.pdf.storage.modified_time(self.pdf.name).isoformat()
+        except (NotImplementedError, OSError):
+            modified = ''
+        return 'fillablepdf-fields:{}:{}'.format(self.pdf.name, modified)
+
+    def get_field_data(self):
+        """Returns the field data of the template pdf, as read by
+        `PDFParser.get_field_data`. Results are cached in process memory
+        and saved on this FillablePDF, so that it is only read once per
+        template, by any process
+        """
+        key = self.get_template_key()
+        data = _field_data_cache.get(key)
+        if data is None:
+            with pdftiming.span('load_field_data'):
+                if self.field_data is not None and self.field_data_key == key:
+                    data = self.field_data
+                else:
+                    with get_parser() as parser:
+                        data = parser.get_field_data(self.get_local_pdf())
+                    self.field_data, self.field_data_key = data, key
+                    if self.pk:
+                        # update() skips the post_save signal, which would
+                        # throw away every filled pdf
+                        FillablePDF.objects.filter(pk=self.pk).update(
+                            field_data=data, field_data_key=key)
+            _field_data_cache[key] = data
+        return data
 
     def get_pdf_fields(self):
-        parser = get_parser()
-        data = parser.get_field_data(self.get_pdf())
-        return data['fields']
+        return self.get_field_data()['fields']
 
     def __str__(self):
         return self.name
 
     def fill(self, *args, **kwargs):
-        parser = get_parser()
         translator = self.get_translator()
-        return parser.fill_pdf(self.get_pdf(), translator(*args, **kwargs))
+        with pdftiming.span('translate', files=1):
+            answers = translator(*args, **kwargs)
+        field_data = self.get_field_data()
+        with get_parser() as parser:
+            return parser.fill_pdf(self.get_local_pdf(), answers,
+                field_data=field_data)
 
-    def fill_many(self, data_set, *args, **kwargs):
+    def get_version(self):
+        """Identifies the current template pdf and translator,
+        so that filled pdfs can be cached until either one changes.
+        Translators can define a `version` attribute to be bumped
+        when their output changes
+        """
+        translator = self.get_translator()
+        content = ':'.join([
+            str(self.pk),
+            self.get_template_key(),
+            self.translator,
+            str(getattr(translator, 'version', ''))])
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get_submission_cache_key(self, submission, version=None):
+        """Identifies the filled pdf of one submission
+        """
+        content = ':'.join([
+            version or self.get_version(),
+            '{}-{}'.format(submission.id, submission.get_answers_digest())])
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get_cache_key(self, submissions):
+        """Identifies the filled pdf of one submission, or a bundle of
+        several, built from the keys of each submission's pdf in order
+        of submission id
+        """
+        submissions = list(submissions)
+        version = self.get_version()
+        if len(submissions) == 1:
+            return self.get_submission_cache_key(submissions[0], version)
+        content = ':'.join(['bundle'] + [
+            self.get_submission_cache_key(s, version)
+            for s in sorted(submissions, key=lambda s: s.id)])
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def fill_cached(self, submission):
+        """Like `fill`, but returns a previously filled pdf if the
+        submission and the template haven't changed since it was filled
+        """
+        key = self.get_cache_key([submission])
+        with pdftiming.span('fetch_cached_pdf') as span:
+            pdf = FilledPDFCacheEntry.fetch(key)
+            span.extra['hit'] = pdf is not None
+            span.bytes_out = len(pdf) if pdf is not None else 0
+        if pdf is None:
+            pdf = self.fill(submission)
+            with pdftiming.span('store_cached_pdf', bytes_in=len(pdf)):
+                FilledPDFCacheEntry.store(key, pdf, submission=submission)
+        return pdf
+
+    def fill_bundle(self, submissions, output_path=None):
+        """Joins the filled pdf of each submission, reusing any that
+        are already cached and caching the rest. Returns the joined pdf
+        as bytes or, if `output_path` is given, writes it to `output_path`
+        """
+        submissions = list(submissions)
+        if not submissions:
+            return None
+        if len(submissions) == 1:
+            pdf = self.fill_cached(submissions[0])
+            if output_path is None:
+                return pdf
+            with open(output_path, 'wb') as output:
+                output.write(pdf)
+            return output_path
+        plan = self.plan_bundle(submissions)
+        with get_parser() as parser:
+            # keep the filled pdfs until they are joined and cached
+            parser.clean_up = False
+            result = self.render_bundle(parser, plan, output_path=output_path)
+            for index in plan['missing']:
+                with open(plan['pdfs'][index], 'rb') as pdf:
+                    FilledPDFCacheEntry.store(plan['keys'][index], File(pdf),
+                        submission=submissions[index])
+        return result
+
+    def plan_bundle(self, submissions):
+        """Finds the cached pdf of each submission, and translates the
+        rest, so that `render_bundle` can run without using the database.
+        Returns a dict of the cache `keys` and cached `pdfs` of each
+        submission, the indexes of the `missing` pdfs, and the data
+        needed to fill them
+        """
+        version = self.get_version()
+        keys = [self.get_submission_cache_key(s, version)
+                for s in submissions]
+        pdfs = [None] * len(submissions)
+        missing = []
+        for index, key in enumerate(keys):
+            entry = FilledPDFCacheEntry.fetch_entry(key)
+            if entry:
+                pdfs[index] = entry.pdf
+            else:
+                missing.append(index)
+        plan = {'keys': keys, 'pdfs': pdfs, 'missing': missing}
+        if missing:
+            translator = self.get_translator()
+            data_set = [submissions[i] for i in missing]
+            with pdftiming.span('translate', files=len(missing)):
+                if hasattr(translator, 'translate_many'):
+                    translated = translator.translate_many(data_set)
+                else:
+                    translated = [translator(d) for d in data_set]
+            plan.update(
+                translated=translated,
+                labels=['submission {}'.format(d.id) for d in data_set],
+                template=self.get_local_pdf(),
+                field_data=self.get_field_data())
+        return plan
+
+    def render_bundle(self, parser, plan, output_path=None):
+        """Fills the pdfs missing from a `plan_bundle` plan and joins
+        them with the cached ones. The filled pdfs are left in
+        `plan['pdfs']` as paths to temporary files, which last until
+        `parser` cleans up. Returns the result of `join_pdfs`
+        """
+        if plan['missing']:
+            filled = parser.fill_each_pdf(
+                plan['template'], plan['translated'],
+                field_data=plan['field_data'], labels=plan['labels'])
+            for index, path in zip(plan['missing'], filled):
+                plan['pdfs'][index] = path
+            if len(plan['pdfs']) == 1 and output_path:
+                # a single filled pdf doesn't need joining
+                shutil.copyfile(plan['pdfs'][0], output_path)
+                return output_path
+        return parser.join_pdfs(plan['pdfs'], output_path=output_path)
+
+    def _render_bundle_part(self, plan, output_path):
+        """Runs in a worker thread, so it doesn't use the database.
+        Returns the contents of the newly filled pdfs, keyed by index
+        """
+        with get_parser() as parser:
+            parser.clean_up = False
+            self.render_bundle(parser, plan, output_path=output_path)
+            filled = {}
+            for index in plan['missing']:
+                with open(plan['pdfs'][index], 'rb') as pdf:
+                    filled[index] = pdf.read()
+        return filled
+
+    def iter_bundle_parts(self, submissions, part_size, max_workers=1):
+        """Splits `submissions` into parts of `part_size`, and yields
+        `(part_submissions, path, is_temporary)` for each part, in order.
+        Up to `max_workers` parts are rendered at the same time, ahead of
+        the part being consumed. Each part is cached, and temporary files
+        should be deleted by the caller once it is done with them
+        """
+        submissions = list(submissions)
+        parts = iter([submissions[i:i + part_size]
+                      for i in range(0, len(submissions), part_size)])
+        pending = collections.deque()
+        executor = ThreadPoolExecutor(max(max_workers, 1))
+
+        def start_next_part():
+            part = next(parts, None)
+            if part is None:
+                return
+            key = self.get_cache_key(part)
+            entry = FilledPDFCacheEntry.fetch_entry(key)
+            if entry:
+                pending.append((part, key, entry, None, None))
+                return
+            plan = self.plan_bundle(part)
+            os_int, tmp_path = mkstemp(suffix='.pdf')
+            os.close(os_int)
+            future = executor.submit(
+                self._render_bundle_part, plan, tmp_path)
+            pending.append((part, key, plan, tmp_path, future))
+
+        try:
+            for i in range(max(max_workers, 1)):
+                start_next_part()
+            while pending:
+                part, key, entry_or_plan, tmp_path, future = pending[0]
+                if future is None:
+                    path, is_temporary = get_local_file(entry_or_plan.pdf)
+                else:
+                    filled = future.result()
+                    for index, pdf in filled.items():
+                        FilledPDFCacheEntry.store(
+                            entry_or_plan['keys'][index], pdf,
+                            submission=part[index])
+                    if len(part) > 1:
+                        with open(tmp_path, 'rb') as pdf:
+                            FilledPDFCacheEntry.store(
+                                key, File(pdf), bundle=part)
+                    path, is_temporary = tmp_path, True
+                pending.popleft()
+                start_next_part()
+                yield part, path, is_temporary
+        finally:
+            executor.shutdown(wait=True)
+            for part, key, entry_or_plan, tmp_path, future in pending:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def prerender(self, submissions):
+        """Fills and caches a pdf for each submission, so that it is
+        ready before anyone opens it. Failures are logged as
+        PDFRenderFailure, which count towards PDF_RENDER_MAX_ATTEMPTS,
+        unless they are TRANSIENT_RENDER_ERRORS.
+        Returns lists of the rendered and failed submissions
+        """
+        rendered, failed = [], []
+        for submission in submissions:
+            try:
+                self.fill_cached(submission)
+            except TRANSIENT_RENDER_ERRORS as error:
+                logger.warning("could not prerender submission %s: %s",
+                    submission.id, error)
+                failed.append(submission)
+            except Exception as error:
+                PDFRenderFailure.objects.create(
+                    submission=submission,
+                    error='{}: {}'.format(type(error).__name__, error))
+                failed.append(submission)
+            else:
+                rendered.append(submission)
+        return rendered, failed
+
+    def fill_many(self, data_set, *args, output_path=None, **kwargs):
+        """Fills the template once for each item in `data_set` and
+        returns the joined pdf as bytes, or, if `output_path` is given,
+        writes it to `output_path`
+        """
         if data_set:
-            parser = get_parser()
+            data_set = list(data_set)
             translator = self.get_translator()
-            translated = [translator(d, *args, **kwargs)
-                            for d in data_set]
-            if len(translated) == 1:
-                return parser.fill_pdf(self.get_pdf(), translated[0])
-            return parser.fill_many_pdfs(self.get_pdf(), translated)
+            with pdftiming.span('translate', files=len(data_set)):
+                if hasattr(translator, 'translate_many') and not (
+                        args or kwargs):
+                    translated = translator.translate_many(data_set)
+                else:
+                    translated = [translator(d, *args, **kwargs)
+                                    for d in data_set]
+            field_data = self.get_field_data()
+            with get_parser() as parser:
+                if len(translated) == 1:
+                    return parser.fill_pdf(self.get_local_pdf(), translated[0],
+                        field_data=field_data, output_path=output_path)
+                labels = [
+                    'submission {}'.format(getattr(d, 'id', i))
+                    for i, d in enumerate(data_set)]
+                return parser.fill_many_pdfs(self.get_local_pdf(), translated,
+                    field_data=field_data, labels=labels,
+                    output_path=output_path)
+
+    def open_many_cached(self, submissions):
+        """Returns a previously filled bundle if none of the submissions
+        or the template have changed, and otherwise fills and caches it.
+        The bundle is returned as an open file and its size, so that
+        large bundles can be streamed rather than read into memory. The
+        third value returned is the path of a temporary file that the
+        caller should delete once it is done, or `None`
+        """
+        submissions = list(submissions)
+        key = self.get_cache_key(submissions)
+        entry = FilledPDFCacheEntry.fetch_entry(key)
+        if entry:
+            entry.pdf.open('rb')
+            return entry.pdf, entry.size, None
+        os_int, tmp_path = mkstemp(suffix='.pdf')
+        os.close(os_int)
+        try:
+            self.fill_bundle(submissions, output_path=tmp_path)
+            if len(submissions) > 1:
+                # single pdfs are cached by `fill_bundle` itself
+                with open(tmp_path, 'rb') as pdf:
+                    FilledPDFCacheEntry.store(
+                        key, File(pdf), bundle=submissions)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return open(tmp_path, 'rb'), os.path.getsize(tmp_path), tmp_path
+
+
+class FilledPDFCacheEntry(models.Model):
+    """A filled pdf, saved to private file storage
+    and keyed by `FillablePDF.get_cache_key`.
+    Entries for single submissions are linked to the submission, and
+    bundles to each submission in them, so that they are deleted along
+    with any of them. The least recently used entries are deleted
+    once the cache grows past `settings.FILLED_PDF_CACHE_MAX_BYTES`
+    """
+    key = models.CharField(max_length=40, unique=True)
+    pdf = models.FileField(upload_to='filled_pdfs/',
+        storage=storage.private_storage)
+    size = models.PositiveIntegerField()
+    submission = models.ForeignKey(FormSubmission,
+        on_delete=models.CASCADE, null=True,
+        related_name='cached_pdfs')
+    bundle_submissions = models.ManyToManyField(FormSubmission,
+        related_name='cached_bundles')
+    last_accessed = models.DateTimeField(default=timezone_utils.now)
+
+    @classmethod
+    def fetch_entry(cls, key):
+        entry = cls.objects.filter(key=key).first()
+        if not entry:
+            return None
+        if not entry.pdf.storage.exists(entry.pdf.name):
+            entry.delete()
+            return None
+        cls.objects.filter(pk=entry.pk).update(
+            last_accessed=timezone_utils.now())
+        return entry
+
+    @classmethod
+    def fetch(cls, key):
+        entry = cls.fetch_entry(key)
+        if not entry:
+            return None
+        entry.pdf.open('rb')
+        pdf = entry.pdf.read()
+        entry.pdf.close()
+        return pdf
+
+    @classmethod
+    def store(cls, key, pdf, submission=None, bundle=None):
+        """Saves `pdf`, which can be bytes or a django `File`, as the
+        pdf of one `submission` or of the submissions in a `bundle`.
+        If another worker stored the same key first, its entry is kept
+        and returned
+        """
+        if submission:
+            # anything else cached for this submission is out of date
+            cls.objects.filter(submission=submission).exclude(
+                key=key).delete()
+        if isinstance(pdf, bytes):
+            pdf = ContentFile(pdf)
+        entry = cls(key=key, size=pdf.size, submission=submission)
+        entry.pdf.save(key + '.pdf', pdf, save=False)
+        try:
+            with transaction.atomic():
+                entry.save()
+                if bundle:
+                    entry.bundle_submissions.add(*bundle)
+        except IntegrityError:
+            entry.pdf.delete(save=False)
+            return cls.objects.get(key=key)
+        cls.evict(getattr(settings, 'FILLED_PDF_CACHE_MAX_BYTES', 0))
+        return entry
+
+    @classmethod
+    def evict(cls, max_bytes):
+        """Deletes the least recently used entries until the cache
+        takes up no more than `max_bytes`. Does nothing if `max_bytes`
+        is falsey
+        """
+        if not max_bytes:
+            return
+        total = cls.objects.aggregate(total=Sum('size'))['total'] or 0
+        for entry in cls.objects.order_by('last_accessed', 'id'):
+            if total <= max_bytes:
+                break
+            total -= entry.size
+            entry.delete()
+
+
+class BundleJob(models.Model):
+    """A request to build a pdf bundle, processed outside of the request
+    path by `./manage.py run_bundle_jobs`.
+    Jobs left running for settings.PDF_BUNDLE_JOB_LEASE seconds are
+    assumed to have been abandoned and are run again. Jobs and their
+    pdfs are deleted after settings.PDF_BUNDLE_JOB_EXPIRY seconds, or
+    as soon as any of their submissions is deleted
+    """
+    PENDING = 1
+    RUNNING = 2
+    DONE = 3
+    FAILED = 4
+
+    STATUSES = (
+        (PENDING, "pending"),
+        (RUNNING, "running"),
+        (DONE,    "done"),
+        (FAILED,  "failed"),
+        )
+
+    submission_ids = models.TextField()
+    submissions = models.ManyToManyField(FormSubmission,
+        related_name='bundle_jobs')
+    status = models.PositiveSmallIntegerField(
+        choices=STATUSES, default=PENDING)
+    # FillablePDF.get_cache_key of the bundle, set when it is built
+    cache_key = models.CharField(max_length=40, blank=True)
+    pdf = models.FileField(upload_to='bundles/', blank=True,
+        storage=storage.private_storage)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone_utils.now)
+    updated = models.DateTimeField(default=timezone_utils.now)
+
+    class Meta:
+        ordering = ['created']
+
+    @classmethod
+    def serialize_ids(cls, submission_ids):
+        return ','.join([str(i) for i in sorted(set(submission_ids))])
+
+    def get_submission_ids(self):
+        return [int(i) for i in self.submission_ids.split(',') if i]
+
+    def get_submissions(self):
+        return list(FormSubmission.objects.filter(
+            pk__in=self.get_submission_ids()))
+
+    @classmethod
+    def get_lease_start(cls):
+        """Jobs that have been running since before this are stale
+        """
+        return timezone_utils.now() - timedelta(
+            seconds=getattr(settings, 'PDF_BUNDLE_JOB_LEASE', 600))
+
+    @classmethod
+    def get_or_create_for_ids(cls, submission_ids):
+        """Returns a job for this set of ids, reusing a pending job,
+        a running job that isn't stale, or a finished one if none of
+        its submissions have changed since it was built
+        """
+        serialized = cls.serialize_ids(submission_ids)
+        job = cls.get_reusable_job(serialized)
+        if job:
+            return job, False
+        with transaction.atomic():
+            # requests for the same ids wait here for each other, so
+            # that only the first one queues a job
+            submissions = list(FormSubmission.objects.select_for_update(
+                ).filter(pk__in=submission_ids).order_by('pk'))
+            job = cls.get_reusable_job(serialized)
+            if job:
+                return job, False
+            job = cls.objects.create(submission_ids=serialized)
+            job.submissions.add(*submissions)
+        return job, True
+
+    @classmethod
+    def get_reusable_job(cls, serialized_ids):
+        jobs = cls.objects.filter(
+            submission_ids=serialized_ids,
+            status__in=[cls.PENDING, cls.RUNNING, cls.DONE]
+            ).exclude(
+            status=cls.RUNNING, updated__lt=cls.get_lease_start()
+            ).order_by('-created')
+        for job in jobs:
+            if job.status != cls.DONE or job.is_current():
+                return job
+        return None
+
+    def is_current(self):
+        fillable = FillablePDF.get_default_instance()
+        if not fillable:
+            return False
+        return self.cache_key == fillable.get_cache_key(
+            self.get_submissions())
+
+    def set_status(self, status, **kwargs):
+        self.status = status
+        self.updated = timezone_utils.now()
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.save()
+
+    def claim(self):
+        """Marks a pending or stale running job as running. Returns
+        False if another worker got to it first
+        """
+        claimed = BundleJob.objects.filter(
+            models.Q(status=self.PENDING) | models.Q(
+                status=self.RUNNING, updated__lt=self.get_lease_start()),
+            pk=self.pk,
+            ).update(status=self.RUNNING, updated=timezone_utils.now())
+        if claimed:
+            self.status = self.RUNNING
+        return bool(claimed)
+
+    def run(self):
+        fillable = FillablePDF.get_default_instance()
+        submissions = self.get_submissions()
+        os_int, tmp_path = mkstemp(suffix='.pdf')
+        os.close(os_int)
+        try:
+            fillable.fill_bundle(submissions, output_path=tmp_path)
+            with open(tmp_path, 'rb') as pdf:
+                self.pdf.save('bundle-{}.pdf'.format(self.pk), File(pdf),
+                    save=False)
+            self.set_status(self.DONE,
+                cache_key=fillable.get_cache_key(submissions))
+        except Exception as error:
+            self.set_status(self.FAILED,
+                error='{}: {}'.format(type(error).__name__, error))
+        finally:
+            os.remove(tmp_path)
+
+    @classmethod
+    def run_pending(cls):
+        """Runs every pending job, and any that a worker started but
+        didn't finish, returning the jobs that were run
+        """
+        jobs = []
+        for job in cls.objects.filter(
+                models.Q(status=cls.PENDING) | models.Q(
+                    status=cls.RUNNING, updated__lt=cls.get_lease_start())):
+            if job.claim():
+                job.run()
+                jobs.append(job)
+        return jobs
+
+    @classmethod
+    def delete_expired(cls):
+        """Deletes jobs, and their pdfs, that haven't been updated in
+        settings.PDF_BUNDLE_JOB_EXPIRY seconds. Returns how many
+        were deleted
+        """
+        expired = cls.objects.filter(
+            updated__lt=timezone_utils.now() - timedelta(
+                seconds=getattr(settings, 'PDF_BUNDLE_JOB_EXPIRY', 86400)))
+        count = 0
+        for job in expired:
+            job.delete()
+            count += 1
+        return count
+
+
+class PDFRenderFailure(models.Model):
+    submission = models.ForeignKey(FormSubmission,
+        on_delete=models.CASCADE,
+        related_name='pdf_render_failures')
+    time = models.DateTimeField(default=timezone_utils.now)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-time']
+
+
+class NotificationOutboxEntry(models.Model):
+    """A notification to send outside of the request path. Entries are
+    saved in the same transaction as whatever they are about, and sent
+    by `./manage.py send_notifications`. Failed sends are retried with
+    exponential backoff, and after settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS
+    the entry is marked as failed and left for someone to look at
+    """
+    PENDING = 1
+    SENDING = 2
+    SENT = 3
+    FAILED = 4
+
+    STATUSES = (
+        (PENDING, "pending"),
+        (SENDING, "sending"),
+        (SENT,    "sent"),
+        (FAILED,  "failed"),
+        )
+
+    NEW_SUBMISSION = 'new_submission'
+    CONFIRMATIONS = 'confirmations'
+
+    TASKS = (
+        (NEW_SUBMISSION, "slack new submission"),
+        (CONFIRMATIONS,  "applicant confirmations"),
+        )
+
+    task = models.CharField(max_length=40, choices=TASKS)
+    submission = models.ForeignKey(FormSubmission,
+        on_delete=models.CASCADE, null=True,
+        related_name='outbox_entries')
+    payload = JSONField(default=dict)
+    status = models.PositiveSmallIntegerField(
+        choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone_utils.now)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(default=timezone_utils.now)
+    updated = models.DateTimeField(default=timezone_utils.now)
+
+    class Meta:
+        ordering = ['created']
+
+    @classmethod
+    def add_new_submission(cls, submission, pdf_url, submission_count):
+        return cls.objects.create(
+            task=cls.NEW_SUBMISSION, submission=submission,
+            payload=dict(pdf_url=pdf_url, submission_count=submission_count))
+
+    @classmethod
+    def add_confirmations(cls, submission):
+        # the staff name is chosen now, so that retries use the same one
+        return cls.objects.create(
+            task=cls.CONFIRMATIONS, submission=submission,
+            payload=dict(staff_name=random.choice(STAFF_NAME_CHOICES)))
+
+    def send_new_submission(self):
+        notifications.slack_new_submission.send(
+            submission=self.submission, **self.payload)
+
+    def send_confirmations(self):
+        # methods that were confirmed by an earlier attempt are skipped,
+        # and front outages are raised so that the rest are retried
+        self.submission.send_confirmation_notifications(
+            staff_name=self.payload.get('staff_name'),
+            exclude=self.submission.get_confirmations_sent(),
+            raise_outages=True)
+
+    def get_backoff(self):
+        """Seconds to wait before the next attempt, doubling with each
+        failed attempt, with some jitter so that entries that failed
+        together aren't all retried together
+        """
+        base = getattr(settings, 'NOTIFICATION_OUTBOX_BACKOFF', 30)
+        delay = min(base * 2 ** (self.attempts - 1),
+            getattr(settings, 'NOTIFICATION_OUTBOX_MAX_BACKOFF', 3600))
+        return delay * random.uniform(0.8, 1.2)
+
+    def claim(self):
+        """Marks the entry as sending. Returns False if another worker
+        got to it first
+        """
+        claimed = NotificationOutboxEntry.objects.filter(
+            pk=self.pk, status=self.status, updated=self.updated
+            ).update(status=self.SENDING, updated=timezone_utils.now())
+        if claimed:
+            self.status = self.SENDING
+        return bool(claimed)
+
+    def set_status(self, status, **kwargs):
+        self.status = status
+        self.updated = timezone_utils.now()
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.save()
+
+    def send(self):
+        self.attempts += 1
+        try:
+            getattr(self, 'send_' + self.task)()
+        except circuitbreaker.CircuitOpenError as error:
+            # the service is known to be down, so this doesn't count as
+            # an attempt, and is tried again once the breaker lets it
+            self.set_status(self.PENDING, attempts=self.attempts - 1,
+                error=str(error), next_attempt=timezone_utils.now() + timedelta(
+                    seconds=error.retry_after))
+        except Exception as error:
+            message = '{}: {}'.format(type(error).__name__, error)
+            max_attempts = getattr(
+                settings, 'NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 8)
+            if self.attempts >= max_attempts:
+                self.set_status(self.FAILED, error=message)
+            else:
+                self.set_status(self.PENDING, error=message,
+                    next_attempt=timezone_utils.now() + timedelta(
+                        seconds=self.get_backoff()))
+        else:
+            self.set_status(self.SENT, error='')
+
+    @classmethod
+    def get_due(cls):
+        """Entries that are ready to send, including any that a worker
+        started sending but didn't finish
+        """
+        now = timezone_utils.now()
+        stale = now - timedelta(
+            seconds=getattr(settings, 'NOTIFICATION_OUTBOX_LEASE', 300))
+        return cls.objects.filter(
+            models.Q(status=cls.PENDING, next_attempt__lte=now) |
+            models.Q(status=cls.SENDING, updated__lt=stale))
+
+    @classmethod
+    def send_pending(cls, limit=None):
+        """Sends every entry that is due, returning the entries that
+        were attempted
+        """
+        entries = []
+        for entry in cls.get_due()[:limit]:
+            if entry.claim():
+                entry.send()
+                entries.append(entry)
+        return entries
+
+    @classmethod
+    def retry_failed(cls):
+        return cls.objects.filter(status=cls.FAILED).update(
+            status=cls.PENDING, attempts=0, next_attempt=timezone_utils.now(),
+            updated=timezone_utils.now())
+
+
+class SlackDigestEvent(models.Model):
+    """Something a user did to some submissions, waiting to be sent to
+    slack as part of a digest. See notifications.SlackDigestNotification
+    """
+    notification = models.CharField(max_length=60)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # a list of {id, name}, since the submissions may have been deleted
+    submissions = JSONField(default=list)
+    created = models.DateTimeField(default=timezone_utils.now)
+    # digests that couldn't be sent back off, like the outbox
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone_utils.now)
+
+    class Meta:
+        ordering = ['created']
+
+    @classmethod
+    def add(cls, notification, submissions, user):
+        return cls.objects.create(
+            notification=notification, user=user,
+            submissions=[
+                {'id': s.id, 'name': str(s)} for s in submissions])
+
+    @classmethod
+    def get_due_groups(cls, now=None):
+        """Returns lists of events to combine, one for each notification
+        and user, where the oldest event has waited long enough or there
+        are enough events to send, and no event is waiting to be retried.
+        At most SLACK_DIGEST_MAX_GROUPS groups of SLACK_DIGEST_MAX_EVENTS
+        events are returned, oldest first
+        """
+        now = now or timezone_utils.now()
+        window = timedelta(
+            seconds=getattr(settings, 'SLACK_DIGEST_WINDOW', 60))
+        max_events = getattr(settings, 'SLACK_DIGEST_MAX_EVENTS', 25)
+        max_groups = getattr(settings, 'SLACK_DIGEST_MAX_GROUPS', 20)
+        groups = cls.objects.values('notification', 'user_id').annotate(
+            oldest=Min('created'), count=Count('id'),
+            retry_at=Max('next_attempt'),
+            ).filter(
+            Q(oldest__lte=now - window) | Q(count__gte=max_events),
+            retry_at__lte=now,
+            ).order_by('oldest')[:max_groups]
+        return [
+            list(cls.objects.filter(
+                notification=group['notification'],
+                user_id=group['user_id'])[:max_events])
+            for group in groups]
+
+    @classmethod
+    def back_off(cls, events, now=None):
+        """Puts off sending a group of events that couldn't be sent,
+        doubling the wait with each failed attempt
+        """
+        now = now or timezone_utils.now()
+        attempts = max(event.attempts for event in events) + 1
+        base = getattr(settings, 'SLACK_DIGEST_BACKOFF', 30)
+        delay = min(base * 2 ** (attempts - 1),
+            getattr(settings, 'SLACK_DIGEST_MAX_BACKOFF', 3600))
+        cls.objects.filter(pk__in=[event.pk for event in events]).update(
+            attempts=attempts, next_attempt=now + timedelta(seconds=delay))
+
+    @classmethod
+    def send_digest(cls, events, now=None):
+        """Sends one message for a group of events, and deletes them.
+        The events are claimed for SLACK_DIGEST_LEASE seconds first, so
+        that no other worker sends them too, and the message is sent
+        after that commits, so that slack isn't waited on with the rows
+        locked. Events are kept if sending fails
+        """
+        now = now or timezone_utils.now()
+        with transaction.atomic():
+            events = list(cls.objects.select_for_update().filter(
+                pk__in=[event.pk for event in events],
+                next_attempt__lte=now))
+            if not events:
+                return events
+            lease = timedelta(
+                seconds=getattr(settings, 'SLACK_DIGEST_LEASE', 300))
+            cls.objects.filter(pk__in=[event.pk for event in events]).update(
+                next_attempt=now + lease)
+        submissions = collections.OrderedDict()
+        for event in events:
+            for submission in event.submissions:
+                submissions.setdefault(submission['id'],
+                    notifications.DigestSubmission(**submission))
+        notification = notifications.SlackDigestNotification.registry[
+            events[0].notification]
+        notification.send_now(
+            submissions=list(submissions.values()), user=events[0].user)
+        cls.objects.filter(pk__in=[event.pk for event in events]).delete()
+        return events
+
+    @classmethod
+    def send_due(cls, now=None):
+        """Sends a digest for each group of events that is due,
+        returning the groups that were sent. Digests are spaced out by
+        notifications.slack_digest_rate_limiter, outside of the
+        transaction that locks their events
+        """
+        sent = []
+        for events in cls.get_due_groups(now):
+            notifications.slack_digest_rate_limiter.wait()
+            try:
+                events = cls.send_digest(events, now)
+            except Exception:
+                logger.exception("could not send slack digest")
+                cls.back_off(events, now)
+                continue
+            if events:
+                sent.append(events)
+        return sent
+
+
+class CircuitBreakerState(models.Model):
+    """The state of an intake.circuitbreaker.CircuitBreaker, shared by
+    every worker
+    """
+    STATES = (
+        (circuitbreaker.CLOSED, "closed"),
+        (circuitbreaker.OPEN,   "open"),
+        )
+
+    name = models.CharField(max_length=60, unique=True)
+    state = models.CharField(max_length=10, choices=STATES,
+        default=circuitbreaker.CLOSED)
+    calls = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    window_start = models.DateTimeField(default=timezone_utils.now)
+    opened_until = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(default=timezone_utils.now)
+
+
+@receiver(post_delete, sender=FilledPDFCacheEntry)
+def delete_cached_pdf_file(sender, instance, **kwargs):
+    instance.pdf.delete(save=False)
+
+
+@receiver(post_delete, sender=BundleJob)
+def delete_bundle_job_file(sender, instance, **kwargs):
+    if instance.pdf:
+        instance.pdf.delete(save=False)
+
+
+@receiver(post_save, sender=FormSubmission)
+def invalidate_submission_cached_pdfs(sender, instance, created, **kwargs):
+    if not created:
+        FilledPDFCacheEntry.objects.filter(
+            Q(submission=instance) | Q(bundle_submissions=instance)
+            ).delete()
+
+
+@receiver(pre_delete, sender=FormSubmission)
+def delete_submission_bundles(sender, instance, **kwargs):
+    # single pdfs cascade, but bundles have to be deleted while the
+    # links to them still exist
+    FilledPDFCacheEntry.objects.filter(bundle_submissions=instance).delete()
+    BundleJob.objects.filter(submissions=instance).delete()
+
+
+@receiver(post_save, sender=FillablePDF)
+@receiver(post_delete, sender=FillablePDF)
+def invalidate_all_cached_pdfs(sender, instance, **kwargs):
+    fillable_registry.clear()
+    FilledPDFCacheEntry.objects.all().delete()
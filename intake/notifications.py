@@ -1,14 +1,21 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import json
-import requests
+import time
+import logging
+import threading
 from project.jinja2 import url_with_ids
 from django.core import mail
 from django.conf import settings
+from django.db import connection
 from django.utils.translation import ugettext as _
 
 from django.template import loader, Context
 
+from intake import circuitbreaker, httpclient
+
 jinja = loader.engines['jinja']
+logger = logging.getLogger(__name__)
 
 class JinjaNotInitializedError(Exception):
     pass
@@ -19,7 +26,10 @@ class DuplicateTemplateError(Exception):
 
 
 class FrontAPIError(Exception):
-    pass
+
+    def __init__(self, message='', status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
 
 
 def check_that_remote_connections_are_okay(*output_if_not_okay):
@@ -29,6 +39,36 @@ def check_that_remote_connections_are_okay(*output_if_not_okay):
     return True
 
 
+def run_and_close_connection(send):
+    try:
+        return send()
+    finally:
+        # sends may use the database, as circuit breakers do, and each
+        # thread has its own connection
+        connection.close()
+
+
+def send_all(sends):
+    """Calls each of `sends`, a dict of functions, at the same time.
+    Returns `(results, errors)`, two dicts with the same keys as `sends`,
+    where `errors` has the exception raised by each call that failed
+    """
+    results = {}
+    errors = {}
+    if not sends:
+        return results, errors
+    with ThreadPoolExecutor(max_workers=len(sends)) as executor:
+        futures = {
+            key: executor.submit(run_and_close_connection, send)
+            for key, send in sends.items()}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as error:
+            errors[key] = error
+    return results, errors
+
+
 class TemplateNotification:
 
     def __init__(self, default_context=None, **template_and_path_args):
@@ -116,6 +156,8 @@ class EmailNotification(TemplateNotification):
             )
 
 class FrontNotification(TemplateNotification): 
+    # channels have their own circuit breaker, see get_circuit_breaker
+    circuit_name = 'front'
 
     def __init__(self, default_context=None, subject_template='', body_template_path=''):
         super().__init__(
@@ -145,7 +187,20 @@ Error: {title}
 {detail}
 REQUEST JSON:
 {payload}
-""".format(payload=payload, **response.json()['errors'][0]))
+""".format(payload=payload, **response.json()['errors'][0]),
+                status_code=response.status_code)
+
+    def get_circuit_breaker(self):
+        return circuitbreaker.get_breaker(
+            self.circuit_name, on_change=report_circuit_change)
+
+    def is_outage(self, error):
+        """Whether an error means Front is having trouble, rather than
+        that something was wrong with this one message
+        """
+        if isinstance(error, FrontAPIError) and error.status_code:
+            return error.status_code >= 500 or error.status_code == 429
+        return True
 
     def send(self, to, **context_args):
         content = self.render(**context_args)
@@ -162,23 +217,62 @@ REQUEST JSON:
         payload = json.dumps(data)
         if check_that_remote_connections_are_okay(
                 'FRONT POST:', payload):
-            result = requests.post(
-                url=self.build_api_url_endpoint(),
-                data=payload,
-                headers=self.build_headers()
-                )
-            self.raise_post_errors(result, payload)
+            # raises CircuitOpenError without posting while Front is down
+            with self.get_circuit_breaker().call(is_failure=self.is_outage):
+                result = httpclient.post(
+                    url=self.build_api_url_endpoint(),
+                    data=payload,
+                    headers=self.build_headers()
+                    )
+                self.raise_post_errors(result, payload)
             return result
 
 
 
 class FrontEmailNotification(FrontNotification):
     channel_id = settings.FRONT_EMAIL_CHANNEL_ID
+    circuit_name = 'front-email'
 
 
 class FrontSMSNotification(FrontNotification):
     channel_id = settings.FRONT_PHONE_CHANNEL_ID
+    circuit_name = 'front-sms'
+
+
+def report_circuit_change(breaker, state):
+    if state == circuitbreaker.OPEN:
+        message = (
+            "{} is failing, so messages to it are paused for {:.0f} seconds "
+            "and will be retried from the outbox".format(
+                breaker.name, breaker.open_seconds.total_seconds()))
+    else:
+        message = "{} is working again".format(breaker.name)
+    try:
+        slack_simple.send(message)
+    except Exception:
+        logger.exception("could not report circuit breaker change")
+
+
 
+class RateLimiter:
+    """Spaces out calls to `wait` so that they return at most once
+    every `interval` seconds in this process. It sleeps, so it is only
+    used by workers, not while handling requests
+    """
+
+    def __init__(self, interval, sleep=time.sleep, clock=time.monotonic):
+        self.interval = interval
+        self.sleep = sleep
+        self.clock = clock
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            delay = self.next_time - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            self.next_time = max(self.next_time, self.clock()) + self.interval
 
 
 class BasicSlackNotification:
@@ -194,7 +288,7 @@ class BasicSlackNotification:
             })
         if check_that_remote_connections_are_okay(
                 'SLACK POST:', payload):
-            return requests.post(
+            return httpclient.post(
                 url=self.webhook_url,
                 data=payload,
                 headers=self.headers)
@@ -222,24 +316,66 @@ class SlackTemplateNotification(BasicSlackNotification, TemplateNotification):
 
 
 
+class DigestSubmission(namedtuple('DigestSubmission', ['id', 'name'])):
+    """Stands in for a FormSubmission in a digest, which may be sent
+    after the submission has been deleted
+    """
+
+    def __str__(self):
+        return self.name
+
+
+class SlackDigestNotification(SlackTemplateNotification):
+    """A slack notification about a user doing something to some
+    submissions. With settings.SLACK_DIGESTS on, `send` only queues the
+    event, and `./manage.py send_notifications` combines the events for
+    each notification and user into one message, once the oldest is
+    SLACK_DIGEST_WINDOW seconds old or there are SLACK_DIGEST_MAX_EVENTS
+    of them
+    """
+    registry = {}
+
+    def __init__(self, name, default_context=None, message_template_path='', webhook_url=None):
+        super().__init__(default_context=default_context,
+            message_template_path=message_template_path,
+            webhook_url=webhook_url)
+        self.name = name
+        SlackDigestNotification.registry[name] = self
+
+    def send(self, submissions, user):
+        if not getattr(settings, 'SLACK_DIGESTS', False):
+            return self.send_now(submissions=submissions, user=user)
+        # models imports this module, so this import can't be at the top
+        from intake.models import SlackDigestEvent
+        SlackDigestEvent.add(self.name, submissions, user)
+
+    def send_now(self, **context_args):
+        return super().send(**context_args)
+
+
 slack_simple = BasicSlackNotification()
 
+# slack asks for no more than one message a second, and digests are
+# sent by one worker, `./manage.py send_notifications --loop`
+slack_digest_rate_limiter = RateLimiter(
+    getattr(settings, 'SLACK_MESSAGE_INTERVAL', 1))
+
 # submission, submission_count, request
 slack_new_submission = SlackTemplateNotification(
     message_template_path="slack/new_submission.jinja")
 
 # submissions, user
-slack_submissions_viewed = SlackTemplateNotification(
+slack_submissions_viewed = SlackDigestNotification('submissions_viewed',
     {'action': 'opened'},
     message_template_path="slack/bundle_action.jinja")
 
 # submissions, user
-slack_submissions_processed = SlackTemplateNotification(
+slack_submissions_processed = SlackDigestNotification('submissions_processed',
     {'action': 'processed'},
     message_template_path="slack/bundle_action.jinja")
 
 # submissions, user
-slack_submissions_deleted = SlackTemplateNotification(
+slack_submissions_deleted = SlackDigestNotification('submissions_deleted',
     {'action': 'deleted'},
     message_template_path="slack/bundle_action.jinja")
 
@@ -0,0 +1,686 @@
+"""Fills, flattens and joins AcroForm pdfs in python, using PyPDF2 to
+read and write them, as an alternative to pdfparser.jar.
+See PythonPDFParser.
+"""
+import io
+import re
+import json
+import hashlib
+import logging
+import unicodedata
+
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject,
+    IndirectObject, NameObject, StreamObject,
+    createStringObject)
+from PyPDF2.utils import PdfReadError
+
+from intake.pdfparser import PDFParser
+
+
+# field flags, see section 12.7.3 of the pdf specification
+REQUIRED = 1 << 1
+MULTILINE = 1 << 12
+RADIO = 1 << 15
+PUSHBUTTON = 1 << 16
+COMBO = 1 << 17
+# annotation flags
+HIDDEN = 1 << 1
+NO_VIEW = 1 << 5
+
+# widths of the standard Helvetica font, for characters 32 to 126
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333,
+    278, 278, 556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278,
+    584, 584, 584, 556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278,
+    500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944,
+    667, 667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556, 556,
+    278, 556, 556, 222, 222, 500, 222, 833, 556, 556, 556, 556, 333, 500,
+    278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584]
+ASCENT = 0.718
+DESCENT = 0.207
+PADDING = 2
+
+DA_FONT_RE = re.compile(rb'/([^\s/]+)\s+([\d.]+)\s+Tf')
+# the encoding of the standard fonts that forms use
+FONT_ENCODING = 'cp1252'
+
+logger = logging.getLogger(__name__)
+
+
+def read_pdf(data):
+    return PdfFileReader(io.BytesIO(data), strict=False)
+
+
+def write_pdf(writer):
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def resolve(obj):
+    if isinstance(obj, IndirectObject):
+        return obj.getObject()
+    return obj
+
+
+def get_key(ref):
+    """A hashable key for an indirect reference, which PyPDF2 can't hash
+    """
+    if isinstance(ref, IndirectObject):
+        return (id(ref.pdf), ref.idnum, ref.generation)
+    return id(ref)
+
+
+def get_catalog(reader):
+    return reader.trailer['/Root'].getObject()
+
+
+def strip_name(value):
+    return value[1:] if isinstance(value, NameObject) else value
+
+
+def decode_text(value):
+    """Decodes a text string, such as a field name, or a name
+    """
+    value = resolve(value)
+    if value is None:
+        return None
+    if isinstance(value, NameObject):
+        return strip_name(value)
+    if isinstance(value, bytes):
+        return value.decode('latin-1')
+    return str(value)
+
+
+def to_bytes(value):
+    value = resolve(value)
+    if isinstance(value, bytes):
+        return bytes(value)
+    try:
+        return value.encode('latin-1')
+    except UnicodeEncodeError:
+        return value.original_bytes
+
+
+def to_floats(values):
+    return [float(resolve(value)) for value in resolve(values)]
+
+
+def make_stream(data, entries=None):
+    stream = DecodedStreamObject()
+    stream.setData(data)
+    stream = stream.flateEncode()
+    stream.update(entries or {})
+    return stream
+
+
+def make_numbers(numbers):
+    return ArrayObject([FloatObject(fmt(number)) for number in numbers])
+
+
+class FormField:
+    """A terminal field of an AcroForm, with its widget annotations
+    """
+
+    def __init__(self, ref, name, parents):
+        self.ref = ref
+        self.name = name
+        self.dict = resolve(ref)
+        self.parents = parents
+        kids = resolve(self.dict.get('/Kids')) or []
+        if kids:
+            self.widgets = [(kid, resolve(kid)) for kid in kids]
+        else:
+            # a field with a single widget can be merged with it
+            self.widgets = [(ref, self.dict)]
+
+    def get(self, key, default=None):
+        """Looks up an attribute, which may be inherited from parents
+        """
+        for node in [self.dict] + self.parents:
+            if key in node:
+                return resolve(node[key])
+        return default
+
+    @property
+    def flags(self):
+        return int(self.get('/Ff', 0))
+
+    @property
+    def type(self):
+        field_type = self.get('/FT')
+        if field_type == '/Btn':
+            if self.flags & PUSHBUTTON:
+                return 'button'
+            if self.flags & RADIO:
+                return 'radio button'
+            return 'checkbox'
+        if field_type == '/Tx':
+            return 'text'
+        if field_type == '/Ch':
+            return 'combo box' if self.flags & COMBO else 'listbox'
+        if field_type == '/Sig':
+            return 'signature'
+        return 'unknown'
+
+    def get_value(self):
+        value = self.get('/V')
+        if value is None:
+            return ''
+        if isinstance(value, list):
+            value = value[0] if value else ''
+        return decode_text(value)
+
+    def get_states(self):
+        """The appearance states of a checkbox or radio button
+        """
+        states = set()
+        for ref, widget in self.widgets:
+            appearances = resolve(widget.get('/AP')) or {}
+            for key in ('/N', '/D'):
+                normal = resolve(appearances.get(key))
+                if isinstance(normal, DictionaryObject) and not isinstance(
+                        normal, StreamObject):
+                    states.update(strip_name(state) for state in normal)
+        return sorted(states)
+
+    def get_options(self):
+        if self.type in ('checkbox', 'radio button'):
+            return self.get_states()
+        if self.type in ('combo box', 'listbox'):
+            options = []
+            for option in self.get('/Opt', []):
+                option = resolve(option)
+                if isinstance(option, list):
+                    option = option[0]
+                options.append(decode_text(option))
+            return options
+        return None
+
+    def get_display_value(self, value):
+        """The text shown for a choice field's export value
+        """
+        for option in self.get('/Opt', []):
+            option = resolve(option)
+            if isinstance(option, list) and len(option) > 1 and (
+                    decode_text(option[0]) == value):
+                return decode_text(option[1])
+        return value
+
+    def get_positions(self, page_numbers):
+        positions = []
+        for ref, widget in self.widgets:
+            left, bottom, right, top = normalize_rect(
+                to_floats(widget.get('/Rect', [0, 0, 0, 0])))
+            page = widget.get('/P')
+            positions.append({
+                'page': page_numbers.get(get_key(page)) if page else None,
+                'left': left,
+                'top': top,
+                'width': right - left,
+                'height': top - bottom,
+            })
+        return positions
+
+    def as_dict(self, page_numbers):
+        return {
+            'name': self.name,
+            'type': self.type,
+            'value': self.get_value(),
+            'options': self.get_options(),
+            'required': bool(self.flags & REQUIRED),
+            'altText': decode_text(self.get('/TU')),
+            'positions': self.get_positions(page_numbers),
+        }
+
+
+def normalize_rect(rect):
+    x0, y0, x1, y1 = rect
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+
+def get_fields(reader):
+    """Returns the terminal fields of a pdf's AcroForm, in order
+    """
+    acroform = resolve(get_catalog(reader).get('/AcroForm'))
+    if not acroform:
+        return []
+    fields = []
+    stack = [(ref, [], []) for ref in reversed(
+        resolve(acroform.get('/Fields', [])))]
+    seen = set()
+    while stack:
+        ref, names, parents = stack.pop()
+        if get_key(ref) in seen:
+            continue
+        seen.add(get_key(ref))
+        node = resolve(ref)
+        if '/T' in node:
+            names = names + [decode_text(node['/T'])]
+        kids = resolve(node.get('/Kids')) or []
+        if any('/T' in resolve(kid) for kid in kids):
+            for kid in reversed(kids):
+                stack.append((kid, names, [node] + parents))
+        else:
+            fields.append(FormField(ref, '.'.join(names), parents))
+    return fields
+
+
+def get_field_data(reader):
+    """The same data as `pdfparser get_fields`
+    """
+    page_numbers = {
+        get_key(page.indirectRef): number + 1
+        for number, page in enumerate(reader.pages)}
+    return {
+        'fields': [field.as_dict(page_numbers)
+                   for field in get_fields(reader)],
+    }
+
+
+class Font:
+    """Measures and encodes text for a simple font
+    """
+
+    def __init__(self, font_dict):
+        self.font_dict = font_dict or {}
+        widths = self.font_dict.get('/Widths')
+        self.widths = to_floats(widths) if widths else None
+        self.first_char = int(self.font_dict.get('/FirstChar', 0))
+
+    def encode(self, text):
+        return text.encode(FONT_ENCODING, 'replace')
+
+    def width(self, encoded, size):
+        total = 0
+        for char in encoded:
+            if self.widths and 0 <= char - self.first_char < len(self.widths):
+                total += self.widths[char - self.first_char] or 556
+            elif 32 <= char <= 126:
+                total += HELVETICA_WIDTHS[char - 32]
+            else:
+                total += 556
+        return total * size / 1000
+
+
+def substitute_unsupported(text):
+    """Returns `text` with the characters that the standard fonts can't
+    show replaced, by the same letter without its accents where there is
+    one, and otherwise by a question mark, as pdfparser.jar draws them
+    """
+    chars = []
+    for char in text:
+        try:
+            char.encode(FONT_ENCODING)
+        except UnicodeEncodeError:
+            base = unicodedata.normalize('NFKD', char)[:1]
+            try:
+                base.encode(FONT_ENCODING)
+                char = base or '?'
+            except UnicodeEncodeError:
+                char = '?'
+        chars.append(char)
+    return ''.join(chars)
+
+
+def escape(encoded):
+    return encoded.replace(b'\\', b'\\\\').replace(
+        b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'\\r')
+
+
+def wrap_lines(font, text, size, width):
+    lines = []
+    for paragraph in text.splitlines() or ['']:
+        line = ''
+        for word in paragraph.split(' '):
+            candidate = word if not line else line + ' ' + word
+            if line and font.width(font.encode(candidate), size) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+class FormFiller:
+    """Sets the values of fields in a pdf read by PyPDF2 and flattens its
+    form, drawing each widget's appearance onto its page, as
+    pdfparser.jar's `set_fields` does. The reader's objects are changed
+    in place, and its pages can then be added to a PdfFileWriter
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.acroform = resolve(get_catalog(reader).get('/AcroForm')) or {}
+        self.fields = {field.name: field for field in get_fields(reader)}
+        # appearance streams generated for widgets, keyed by widget
+        self.appearances = {}
+
+    def set_values(self, values):
+        for name, value in values.items():
+            field = self.fields.get(name)
+            if field is None or value is None:
+                continue
+            self.set_value(field, str(value))
+
+    def set_value(self, field, value):
+        if field.type in ('checkbox', 'radio button'):
+            for ref, widget in field.widgets:
+                states = resolve(
+                    (resolve(widget.get('/AP')) or {}).get('/N'))
+                state = value if isinstance(states, DictionaryObject) and (
+                    '/' + value in states) else 'Off'
+                widget[NameObject('/AS')] = NameObject('/' + state)
+        elif field.type in ('text', 'combo box', 'listbox'):
+            field.dict[NameObject('/V')] = createStringObject(value)
+            if field.type != 'text':
+                value = field.get_display_value(value)
+            shown = substitute_unsupported(value)
+            if shown != value:
+                # the value itself isn't logged, it is an applicant's answer
+                logger.warning(
+                    "%s has characters that its font can't show, "
+                    "they were replaced", field.name)
+                value = shown
+            for ref, widget in field.widgets:
+                self.appearances[get_key(ref)] = self.build_text_appearance(
+                    field, widget, value)
+
+    def get_font(self, field, widget, font_name):
+        for resources in (widget.get('/DR'), field.get('/DR'),
+                          self.acroform.get('/DR')):
+            resources = resolve(resources) or {}
+            fonts = resolve(resources.get('/Font')) or {}
+            if '/' + font_name in fonts:
+                return fonts['/' + font_name]
+        return None
+
+    def build_text_appearance(self, field, widget, value):
+        left, bottom, right, top = normalize_rect(to_floats(widget['/Rect']))
+        width, height = right - left, top - bottom
+        appearance = (widget.get('/DA') or field.get('/DA') or
+                      self.acroform.get('/DA') or b'/Helv 0 Tf 0 g')
+        appearance = to_bytes(appearance)
+        match = DA_FONT_RE.search(appearance)
+        font_name, size = (match.group(1).decode('latin-1'),
+                           float(match.group(2))) if match else ('Helv', 0)
+        colour = DA_FONT_RE.sub(b'', appearance).strip()
+        font_ref = self.get_font(field, widget, font_name)
+        font = Font(resolve(font_ref))
+        multiline = field.flags & MULTILINE
+        inner_width = max(width - 2 * PADDING, 1)
+
+        if not size:
+            size = 12 if multiline else min(
+                12, max(4, (height - 2 * PADDING) / (ASCENT + DESCENT)))
+            if not multiline:
+                text_width = font.width(font.encode(value), 1)
+                if text_width:
+                    size = max(4, min(size, inner_width / text_width))
+        if multiline:
+            lines = wrap_lines(font, value, size, inner_width)
+            y = height - PADDING - ASCENT * size
+        else:
+            lines = [value]
+            y = (height - (ASCENT + DESCENT) * size) / 2 + DESCENT * size
+        alignment = int(field.get('/Q', 0))
+
+        content = [b'/Tx BMC', b'q',
+                   '1 1 {} {} re W n'.format(
+                       fmt(width - 2), fmt(height - 2)).encode('ascii'),
+                   b'BT']
+        if colour:
+            content.append(colour)
+        content.append('/{} {} Tf'.format(
+            font_name, fmt(size)).encode('latin-1'))
+        for line in lines:
+            encoded = font.encode(line)
+            line_width = font.width(encoded, size)
+            if alignment == 1:
+                x = (width - line_width) / 2
+            elif alignment == 2:
+                x = width - PADDING - line_width
+            else:
+                x = PADDING
+            content.append('1 0 0 1 {} {} Tm'.format(
+                fmt(x), fmt(y)).encode('ascii'))
+            content.append(b'(' + escape(encoded) + b') Tj')
+            y -= size * 1.15
+        content.extend([b'ET', b'Q', b'EMC'])
+        resources = DictionaryObject()
+        if font_ref is not None:
+            resources[NameObject('/Font')] = DictionaryObject({
+                NameObject('/' + font_name): font_ref})
+        return make_stream(b'\n'.join(content), {
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/BBox'): make_numbers([0, 0, width, height]),
+            NameObject('/Resources'): resources,
+        })
+
+    def get_widget_appearance(self, ref, widget):
+        """Returns the appearance stream to draw for a widget, or None if
+        it has no visible appearance
+        """
+        if int(widget.get('/F', 0)) & (HIDDEN | NO_VIEW):
+            return None
+        if get_key(ref) in self.appearances:
+            return self.appearances[get_key(ref)]
+        appearances = resolve(widget.get('/AP')) or {}
+        normal = appearances.get('/N')
+        resolved = resolve(normal)
+        if isinstance(resolved, StreamObject):
+            return normal
+        if isinstance(resolved, DictionaryObject):
+            state = widget.get('/AS')
+            if state in resolved and isinstance(
+                    resolve(resolved[state]), StreamObject):
+                return resolved[state]
+        return None
+
+    def flatten(self):
+        widget_keys = set()
+        for field in self.fields.values():
+            widget_keys.update(get_key(ref) for ref, widget in field.widgets)
+        for page in self.reader.pages:
+            annots = resolve(page.get('/Annots')) or []
+            if not any(get_key(ref) in widget_keys for ref in annots):
+                continue
+            self.flatten_page(page, annots, widget_keys)
+        get_catalog(self.reader).pop('/AcroForm', None)
+
+    def flatten_page(self, page, annots, widget_keys):
+        resources = DictionaryObject(resolve(page.get('/Resources')) or {})
+        xobjects = DictionaryObject(resolve(resources.get('/XObject')) or {})
+        drawing = []
+        kept = ArrayObject()
+        for ref in annots:
+            if get_key(ref) not in widget_keys:
+                kept.append(ref)
+                continue
+            widget = resolve(ref)
+            appearance_ref = self.get_widget_appearance(ref, widget)
+            if appearance_ref is None:
+                continue
+            appearance = resolve(appearance_ref)
+            if appearance.get('/Subtype') != '/Form':
+                appearance[NameObject('/Type')] = NameObject('/XObject')
+                appearance[NameObject('/Subtype')] = NameObject('/Form')
+            name = 'Flat{}'.format(len(xobjects))
+            while '/' + name in xobjects:
+                name += 'x'
+            xobjects[NameObject('/' + name)] = appearance_ref
+            matrix = get_placement(
+                to_floats(widget['/Rect']),
+                to_floats(appearance.get('/BBox', [0, 0, 1, 1])),
+                to_floats(appearance.get('/Matrix', [1, 0, 0, 1, 0, 0])))
+            drawing.append('q {} cm /{} Do Q'.format(
+                ' '.join(fmt(n) for n in matrix), name).encode('latin-1'))
+        resources[NameObject('/XObject')] = xobjects
+        contents = page.get('/Contents')
+        if isinstance(resolve(contents), StreamObject):
+            contents = [contents]
+        contents = list(resolve(contents) or [])
+        # streams added directly are made indirect by PdfFileWriter
+        page[NameObject('/Contents')] = ArrayObject(
+            [make_stream(b'q\n')] + contents +
+            [make_stream(b'\nQ\n' + b'\n'.join(drawing))])
+        page[NameObject('/Resources')] = resources
+        if kept:
+            page[NameObject('/Annots')] = kept
+        else:
+            page.pop('/Annots', None)
+
+
+def get_placement(rect, bbox, matrix):
+    """The matrix that draws a form xobject with `bbox` and `matrix`
+    into `rect`, as described in section 12.5.5 of the pdf specification
+    """
+    a, b, c, d, e, f = matrix
+    corners = [(x * a + y * c + e, x * b + y * d + f)
+               for x in (bbox[0], bbox[2]) for y in (bbox[1], bbox[3])]
+    x0 = min(x for x, y in corners)
+    y0 = min(y for x, y in corners)
+    x1 = max(x for x, y in corners)
+    y1 = max(y for x, y in corners)
+    left, bottom, right, top = normalize_rect(rect)
+    scale_x = (right - left) / (x1 - x0) if x1 != x0 else 1
+    scale_y = (top - bottom) / (y1 - y0) if y1 != y0 else 1
+    return [scale_x, 0, 0, scale_y,
+            left - x0 * scale_x, bottom - y0 * scale_y]
+
+
+def fmt(number):
+    text = '{:.4f}'.format(number).rstrip('0').rstrip('.')
+    return text if text not in ('', '-0') else '0'
+
+
+def fill(data, values):
+    """Returns a copy of the pdf `data` with its fields set to `values`,
+    a dict of field names and values, and its form flattened
+    """
+    reader = read_pdf(data)
+    filler = FormFiller(reader)
+    filler.set_values(values)
+    filler.flatten()
+    writer = PdfFileWriter()
+    for page in reader.pages:
+        writer.addPage(page)
+    return write_pdf(writer)
+
+
+def get_stream_digest(stream):
+    """A hash of a stream that doesn't refer to other objects, or None
+    """
+    entries = io.BytesIO()
+    for key, value in sorted(stream.items()):
+        if key == '/Length':
+            continue
+        if isinstance(value, (IndirectObject, DictionaryObject, ArrayObject)):
+            return None
+        entries.write(key.encode('latin-1'))
+        value.writeToStream(entries, None)
+    return hashlib.sha1(entries.getvalue() + stream._data).digest()
+
+
+def dedupe_streams(node, streams, seen):
+    """Replaces references to streams that are identical to a stream
+    already in `streams`, a dict of stream digests and references, with
+    that stream's reference, in `node` and the objects it refers to.
+    `seen` maps the keys of references already visited to the
+    references that replace them
+    """
+    if isinstance(node, DictionaryObject):
+        items = [(key, value) for key, value in node.items()
+                 if key not in ('/Parent', '/P')]
+    else:
+        items = list(enumerate(node))
+    for key, value in items:
+        if isinstance(value, IndirectObject):
+            if get_key(value) in seen:
+                node[key] = seen[get_key(value)]
+                continue
+            seen[get_key(value)] = value
+            target = value.getObject()
+            if isinstance(target, StreamObject):
+                digest = get_stream_digest(target)
+                if digest is not None:
+                    node[key] = seen[get_key(value)] = streams.setdefault(
+                        digest, value)
+                    continue
+            value = target
+        if isinstance(value, (DictionaryObject, ArrayObject)):
+            dedupe_streams(value, streams, seen)
+
+
+def join(datas, flatten=False, dedupe=False):
+    """Returns the pages of each pdf in `datas`, joined into one pdf.
+    If `flatten` is True, forms are flattened first, and if `dedupe` is
+    True, identical streams, such as fonts and images, are only stored
+    once
+    """
+    writer = PdfFileWriter()
+    streams = {}
+    # the writer copies objects from the readers when it writes
+    readers = []
+    for data in datas:
+        reader = read_pdf(data)
+        readers.append(reader)
+        if flatten:
+            FormFiller(reader).flatten()
+        seen = {}
+        for page in reader.pages:
+            if dedupe:
+                dedupe_streams(page, streams, seen)
+            writer.addPage(page)
+    return write_pdf(writer)
+
+
+class PythonPDFParser(PDFParser):
+    """A PDFParser that runs pdfparser commands in python rather than
+    with pdfparser.jar, so that no java runtime is needed.
+    Text, checkbox, radio and choice fields are supported, and filled
+    pdfs are flattened, as they are by the jar. Characters that the
+    form's fonts can't show are replaced, see `substitute_unsupported`
+    """
+
+    def _read(self, path):
+        with open(path, 'rb') as pdf_file:
+            return pdf_file.read()
+
+    def _write(self, path, data):
+        with open(path, 'wb') as pdf_file:
+            pdf_file.write(data)
+
+    def _run(self, args, span=None):
+        command = args[0]
+        out = b''
+        try:
+            if command == 'get_fields':
+                out = json.dumps(get_field_data(
+                    read_pdf(self._read(args[1])))).encode('utf-8')
+            elif command == 'set_fields':
+                values = {}
+                for item in json.loads(args[3])['fields']:
+                    values.update(item)
+                self._write(args[2], fill(self._read(args[1]), values))
+            elif command in ('concat_files', 'concat_optimized'):
+                optimize = command == 'concat_optimized'
+                self._write(args[-1], join(
+                    [self._read(path) for path in args[1:-1]],
+                    flatten=optimize, dedupe=optimize))
+            else:
+                return b'', "Unknown command {}".format(command).encode(
+                    'utf-8')
+        except (PdfReadError, OSError, ValueError, KeyError, IndexError,
+                TypeError, AssertionError) as error:
+            if span:
+                span.status = 1
+            return b'', "{}: {}".format(
+                type(error).__name__, error).encode('utf-8')
+        if span:
+            span.status = 0
+        return out, b''
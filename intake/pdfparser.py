@@ -1,7 +1,26 @@
 import os
 import subprocess
 import json
+import logging
 from tempfile import mkstemp
+from concurrent.futures import ThreadPoolExecutor
+
+from intake import pdftiming
+
+
+logger = logging.getLogger(__name__)
+
+# commands that pdfparser.jar doesn't support itself, which are
+# implemented in PdfParserWorker.java. It is compiled into
+# EXTENSIONS_CLASS_DIR at build time, by `make pdfparser.worker`
+EXTENSIONS_CLASS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'pdfparser_classes')
+EXTENSIONS_CLASS = 'PdfParserWorker'
+EXTENDED_COMMANDS = ('ping', 'concat_optimized')
+
+
+def get_extensions_classpath(jar_path, class_dir=None):
+    return os.pathsep.join([jar_path, class_dir or EXTENSIONS_CLASS_DIR])
 
 
 class PDFParserError(Exception):
@@ -12,25 +31,95 @@ class InvalidOptionError(Exception):
     pass
 
 
+class PDFFillError(PDFParserError):
+    """Raised by `fill_many_pdfs` when one set of answers fails to fill.
+    `index` is the position of the failed answers in the input list.
+    """
+
+    def __init__(self, message, index=None, label=None):
+        super().__init__(message)
+        self.index = index
+        self.label = label
+
+
 class PDFParser:
 
-    def __init__(self, tmp_path=None, clean_up=True):
+    SHARED_MEMORY_PATH = '/dev/shm'
+
+    def __init__(self, tmp_path=None, clean_up=True, worker_pool=None,
+            max_fill_workers=1, in_memory=False, optimize_joins=False,
+            admission=None, timer=None):
         self.TEMP_FOLDER_PATH = tmp_path
         self._tmp_files = []
+        # file descriptors of memory-backed temporary files, keyed by path
+        self._tmp_fds = {}
         self.clean_up = clean_up
+        # if True, temporary files are kept in memory rather than on disk
+        self.in_memory = in_memory
+        # if True, `join_pdfs` flattens forms and removes duplicate resources
+        self.optimize_joins = optimize_joins
+        # input and output sizes of the last `join_pdfs` call
+        self.last_join_stats = None
+        # number of pdfs that `fill_many_pdfs` fills at the same time
+        self.max_fill_workers = max_fill_workers
+        # if set, commands run on warm workers instead of a new `java -jar`
+        # see intake.pdfworkers.PDFWorkerPool
+        self.worker_pool = worker_pool
+        # if set, the parser waits for a host-wide slot when it is entered
+        # as a context manager, and holds it until it exits, so that a
+        # render is admitted once rather than for each command. Commands
+        # run outside of a `with` block wait for a slot each. Filling
+        # pdfs in parallel takes a free slot for each extra fill worker
+        # see intake.admission.HostSemaphore
+        self.admission = admission
+        self._slot = None
+        # records how long each phase takes, see intake.pdftiming
+        self.timer = timer or pdftiming.timer
         self.PDFPARSER_PATH = os.environ.get('PDFPARSER_PATH', 'pdfparser.jar')
 
+    def __enter__(self):
+        if self.admission:
+            with self.timer.span('admission_wait'):
+                self._slot = self.admission.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.clean_up_tmp_files()
+        finally:
+            if self._slot is not None:
+                self.admission.release(self._slot)
+                self._slot = None
+
+    def _get_local_path(self, file_obj):
+        """Returns the path of a file-like object that is already
+        stored on the local disk, such as a django `FieldFile` using
+        `FileSystemStorage`, or `None`
+        """
+        try:
+            path = getattr(file_obj, 'path', None)
+        except (NotImplementedError, ValueError):
+            return None
+        if isinstance(path, str) and os.path.isfile(path):
+            return path
+        return None
+
     def _coerce_to_file_path(self, path_or_file_or_bytes):
         """This converts file-like objects and `bytes` into
         existing files and returns a filepath
         if strings are passed in, it is assumed that they are existing
         files
+        file-like objects that already exist on the local disk
+        are used directly, rather than copied
         """
         if not isinstance(path_or_file_or_bytes, str):
             if isinstance(path_or_file_or_bytes, bytes):
                 return self._write_tmp_file(
                     bytestring=path_or_file_or_bytes)
             else:
+                local_path = self._get_local_path(path_or_file_or_bytes)
+                if local_path:
+                    return local_path
                 return self._write_tmp_file(
                     file_obj=path_or_file_or_bytes)
         return path_or_file_or_bytes
@@ -40,17 +129,45 @@ class PDFParser:
         create a temporary file and return a file path.
         file-like objects will be read and written to the tempfile
         bytes objects will be written directly to the tempfile
+        if `self.in_memory` is set, the tempfile is memory-backed
         """
+        if file_obj is None and bytestring is None:
+            return self._create_tmp_file(file_obj, bytestring)
+        with self.timer.span('write_tmp_file') as span:
+            path = self._create_tmp_file(file_obj, bytestring)
+            span.bytes_out = self._get_size(path)
+        return path
+
+    def _create_tmp_file(self, file_obj=None, bytestring=None):
+        if self.in_memory and hasattr(os, 'memfd_create'):
+            return self._write_memory_file(file_obj, bytestring)
         tmp_path = self.TEMP_FOLDER_PATH
+        if self.in_memory and os.path.isdir(self.SHARED_MEMORY_PATH):
+            tmp_path = self.SHARED_MEMORY_PATH
         os_int, tmp_fp = mkstemp(dir=tmp_path)
-        with open(tmp_fp, 'wb') as tmp_file:
-            if file_obj:
-                tmp_file.write(file_obj.read())
-            elif bytestring:
-                tmp_file.write(bytestring)
+        with open(os_int, 'wb') as tmp_file:
+            self._write_contents(tmp_file, file_obj, bytestring)
         self._tmp_files.append(tmp_fp)
         return tmp_fp
 
+    def _write_memory_file(self, file_obj=None, bytestring=None):
+        """Writes to an anonymous `memfd_create` file, which stays open
+        until `clean_up_tmp_files` is called. The pdfparser process
+        reaches it through `/proc/<pid>/fd/<fd>`
+        """
+        os_int = os.memfd_create('pdfparser')
+        tmp_fp = '/proc/{}/fd/{}'.format(os.getpid(), os_int)
+        with open(os_int, 'wb', closefd=False) as tmp_file:
+            self._write_contents(tmp_file, file_obj, bytestring)
+        self._tmp_fds[tmp_fp] = os_int
+        return tmp_fp
+
+    def _write_contents(self, tmp_file, file_obj=None, bytestring=None):
+        if file_obj:
+            tmp_file.write(file_obj.read())
+        elif bytestring:
+            tmp_file.write(bytestring)
+
     def _load_json(self, raw_string):
         return json.loads(raw_string)
 
@@ -58,11 +175,15 @@ class PDFParser:
         return json.dumps(data)
 
     def clean_up_tmp_files(self):
+        while self._tmp_fds:
+            path, fd = self._tmp_fds.popitem()
+            os.close(fd)
         if not self._tmp_files:
             return
         for i in range(len(self._tmp_files)):
             path = self._tmp_files.pop()
-            os.remove(path)
+            if os.path.exists(path):
+                os.remove(path)
 
     def _get_name_option_lookup(self, field_data):
         return {
@@ -75,7 +196,26 @@ class PDFParser:
         if decode is True, the contents will be decoded using the default
         encoding
         """
-        return open(path, 'rb').read()
+        with open(path, 'rb') as pdf_file:
+            return pdf_file.read()
+
+    def _get_size(self, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+    def _get_command_files(self, args):
+        """Returns the input paths and the output path of a
+        pdfparser command
+        """
+        if args[0] == 'get_fields':
+            return args[1:2], None
+        if args[0] == 'set_fields':
+            return args[1:2], args[2]
+        if args[0] in ('concat_files', 'concat_optimized'):
+            return args[1:-1], args[-1]
+        return [], None
 
     def run_command(self, args):
         """Run a command to pdftk on the command line.
@@ -83,15 +223,52 @@ class PDFParser:
         This method is reponsible for handling errors that arise from
         pdftk's CLI
         """
-        args = ['java', '-jar', self.PDFPARSER_PATH] + args
+        if self.admission and self._slot is None:
+            with self.timer.span('admission_wait'):
+                slot = self.admission.acquire()
+            try:
+                out = self._run_timed(args)
+            finally:
+                self.admission.release(slot)
+        else:
+            out = self._run_timed(args)
+        return out.decode('utf-8')
+
+    def _run_timed(self, args):
+        inputs, output = self._get_command_files(args)
+        with self.timer.span(args[0]) as span:
+            out, err = self._run(args, span)
+            if err:
+                raise PDFParserError(err.decode('utf-8'))
+            sizes = [self._get_size(path) for path in inputs]
+            span.bytes_in = sum(size or 0 for size in sizes)
+            span.bytes_out = self._get_size(output) if output else len(out)
+        return out
+
+    def _run(self, args, span=None):
+        if self.worker_pool:
+            out, err = self.worker_pool.run(args)
+            if span:
+                # workers don't exit per command, so report what the jar
+                # would have: a failure status whenever it wrote to stderr
+                span.status = 1 if err else 0
+            return out, err
+        return self._run_subprocess(args, span)
+
+    def _run_subprocess(self, args, span=None):
+        if args[0] in EXTENDED_COMMANDS:
+            args = ['java', '-cp', get_extensions_classpath(
+                self.PDFPARSER_PATH), EXTENSIONS_CLASS] + args
+        else:
+            args = ['java', '-jar', self.PDFPARSER_PATH] + args
         process = subprocess.Popen(
             args,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE)
         out, err = process.communicate()
-        if err:
-            raise PDFParserError(err.decode('utf-8'))
-        return out.decode('utf-8')
+        if span:
+            span.status = process.returncode
+        return out, err
 
     def _fill(self, pdf_path, output_path, option_check, answers):
         answer_fields = {'fields': []}
@@ -111,47 +288,168 @@ class PDFParser:
             self._dump_json(answer_fields)
         ])
 
-    def join_pdfs(self, list_of_pdf_paths):
-        paths = [self._coerce_to_file_path(p) for p in list_of_pdf_paths]
-        output_path = self._write_tmp_file()
-        args = ['concat_files'] + paths + [output_path]
-        self.run_command(args)
-        result = self._get_file_contents(output_path)
+    def _read_output(self, output_path, keep_output):
+        """Returns the contents of an output file, or if `keep_output`
+        is True, the path itself, leaving the file in place
+        """
+        if keep_output:
+            result = output_path
+        else:
+            with self.timer.span('read_output') as span:
+                result = self._get_file_contents(output_path)
+                span.bytes_out = len(result)
         if self.clean_up:
             self.clean_up_tmp_files()
         return result
 
+    def join_pdfs(self, list_of_pdf_paths, output_path=None, optimize=None):
+        """Concatenates pdfs and returns the result as bytes.
+        If `output_path` is given, the result is written there instead,
+        and `output_path` is returned
+        If `optimize` is True (defaults to `self.optimize_joins`), form
+        fields are flattened, resources shared by the pdfs are only
+        stored once, and object streams are compressed
+        """
+        with self.timer.span('join_pdfs', files=len(list_of_pdf_paths)):
+            return self._join_pdfs(list_of_pdf_paths, output_path, optimize)
+
+    def _join_pdfs(self, list_of_pdf_paths, output_path, optimize):
+        if optimize is None:
+            optimize = self.optimize_joins
+        paths = [self._coerce_to_file_path(p) for p in list_of_pdf_paths]
+        keep_output = output_path is not None
+        output_path = output_path or self._write_tmp_file()
+        command = 'concat_optimized' if optimize else 'concat_files'
+        self.run_command([command] + paths + [output_path])
+        self._record_join_stats(paths, output_path, optimize)
+        return self._read_output(output_path, keep_output)
+
+    def _record_join_stats(self, paths, output_path, optimized):
+        self.last_join_stats = {
+            'files': len(paths),
+            'optimized': optimized,
+            'input_bytes': sum(os.path.getsize(p) for p in paths),
+            'output_bytes': os.path.getsize(output_path),
+        }
+        logger.info(
+            "joined %(files)s pdfs: %(input_bytes)s bytes in, "
+            "%(output_bytes)s bytes out (optimized: %(optimized)s)",
+            self.last_join_stats)
+
     def get_field_data(self, pdf_file_path):
         pdf_file_path = self._coerce_to_file_path(pdf_file_path)
         string = self.run_command(['get_fields', pdf_file_path])
         return self._load_json(string)
 
-    def fill_pdf(self, pdf_path, answers):
+    def fill_pdf(self, pdf_path, answers, field_data=None, output_path=None):
+        """`field_data` can be passed in if the fields of `pdf_path`
+        are already known, which avoids a `get_fields` call
+        if `output_path` is given, the filled pdf is written there and
+        `output_path` is returned, instead of the filled pdf's bytes
+        """
+        with self.timer.span('fill_pdf'):
+            return self._fill_pdf(pdf_path, answers, field_data, output_path)
+
+    def _fill_pdf(self, pdf_path, answers, field_data, output_path):
         pdf_path = self._coerce_to_file_path(pdf_path)
-        field_data = self.get_field_data(pdf_path)
+        if field_data is None:
+            field_data = self.get_field_data(pdf_path)
         option_check = self._get_name_option_lookup(field_data)
-        output_path = self._write_tmp_file()
+        keep_output = output_path is not None
+        output_path = output_path or self._write_tmp_file()
         self._fill(pdf_path, output_path, option_check, answers)
-        result = self._get_file_contents(output_path)
-        if self.clean_up:
-            self.clean_up_tmp_files()
-        return result
+        return self._read_output(output_path, keep_output)
 
-    def fill_many_pdfs(self, pdf_path, answers_list):
+    def fill_many_pdfs(self, pdf_path, answers_list, field_data=None,
+            labels=None, output_path=None):
+        """Fills `pdf_path` once for each item in `answers_list` and joins
+        the results, in the same order as `answers_list`.
+        Up to `self.max_fill_workers` pdfs are filled at the same time.
+        `labels` are used to describe failed items in a PDFFillError
+        `output_path` works the same way as in `join_pdfs`
+        """
+        with self.timer.span('fill_many_pdfs', files=len(answers_list)):
+            return self._fill_many_pdfs(
+                pdf_path, answers_list, field_data, labels, output_path)
 
+    def _fill_many_pdfs(self, pdf_path, answers_list, field_data, labels,
+            output_path):
         # don't clean up while filling multiple pdfs
         _clean_up_setting = self.clean_up
         self.clean_up = False
+        try:
+            tmp_filled_pdf_paths = self.fill_each_pdf(
+                pdf_path, answers_list, field_data=field_data, labels=labels)
+        except Exception:
+            if _clean_up_setting:
+                self.clean_up_tmp_files()
+            raise
+        finally:
+            self.clean_up = _clean_up_setting
+        return self.join_pdfs(tmp_filled_pdf_paths, output_path=output_path)
 
-        pdf_path = self._coerce_to_file_path(pdf_path)
-        field_data = self.get_field_data(pdf_path)
-        option_check = self._get_name_option_lookup(field_data)
-        tmp_filled_pdf_paths = []
-        for answers in answers_list:
-            output_path = self._write_tmp_file()
-            self._fill(pdf_path, output_path, option_check, answers)
-            tmp_filled_pdf_paths.append(output_path)
-        self.clean_up = _clean_up_setting
-        return self.join_pdfs(tmp_filled_pdf_paths)       
+    def fill_each_pdf(self, pdf_path, answers_list, field_data=None,
+            labels=None):
+        """Fills `pdf_path` once for each item in `answers_list`, and
+        returns the paths of the filled pdfs, in the same order.
+        The filled pdfs are temporary files, which are left in place
+        until `clean_up_tmp_files` is called.
+        Up to `self.max_fill_workers` pdfs are filled at the same time.
+        `labels` are used to describe failed items in a PDFFillError
+        """
+        labels = labels or [
+            'item {}'.format(i) for i in range(len(answers_list))]
+        try:
+            pdf_path = self._coerce_to_file_path(pdf_path)
+            if field_data is None:
+                field_data = self.get_field_data(pdf_path)
+            option_check = self._get_name_option_lookup(field_data)
+            tmp_filled_pdf_paths = [
+                self._write_tmp_file() for answers in answers_list]
+            workers, extra_slots = self._get_fill_workers()
 
+            def fill_one(index):
+                try:
+                    self._fill(pdf_path, tmp_filled_pdf_paths[index],
+                        option_check, answers_list[index])
+                except (PDFParserError, InvalidOptionError) as error:
+                    raise PDFFillError(
+                        "Failed to fill pdf for {}: {}".format(
+                            labels[index], error),
+                        index=index, label=labels[index]) from error
 
+            try:
+                if workers > 1:
+                    with ThreadPoolExecutor(workers) as executor:
+                        # consume the results to raise the first error
+                        # in order
+                        list(executor.map(
+                            fill_one, range(len(answers_list))))
+                else:
+                    for index in range(len(answers_list)):
+                        fill_one(index)
+            finally:
+                for slot in extra_slots:
+                    self.admission.release(slot)
+        except Exception:
+            if self.clean_up:
+                self.clean_up_tmp_files()
+            raise
+        return tmp_filled_pdf_paths
+
+    def _get_fill_workers(self):
+        """Returns how many pdfs `fill_each_pdf` can fill at the same
+        time, and the extra admission slots taken for them. Inside a
+        `with` block, the parser's own slot covers one fill, and each
+        other fill needs a slot that is free right now. Outside of one,
+        each command waits for its own slot
+        """
+        if self.admission is None or self._slot is None:
+            return self.max_fill_workers, []
+        extra_slots = []
+        while len(extra_slots) < self.max_fill_workers - 1:
+            slot = self.admission.try_acquire()
+            if slot is None:
+                break
+            extra_slots.append(slot)
+        return len(extra_slots) + 1, extra_slots
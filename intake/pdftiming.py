@@ -0,0 +1,139 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed phase of pdf work, such as writing a temporary file or
+    running a pdfparser command. `bytes_in` and `bytes_out` are the sizes
+    of the files read and written, where known, and `status` is the exit
+    status of a pdfparser command, or 'error' if the phase raised
+    """
+
+    def __init__(self, name, bytes_in=None, bytes_out=None, status=None,
+            **extra):
+        self.name = name
+        self.bytes_in = bytes_in
+        self.bytes_out = bytes_out
+        self.status = status
+        self.extra = extra
+        self.duration = None
+
+    def as_dict(self):
+        data = dict(self.extra)
+        data.update(
+            phase=self.name,
+            duration=self.duration,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            status=self.status)
+        return data
+
+
+class LoggingSink:
+    """Logs each span, with its fields in the `pdf_span` attribute of
+    the log record for structured log handlers
+    """
+
+    def __init__(self, logger=logger, level=logging.DEBUG):
+        self.logger = logger
+        self.level = level
+
+    def emit(self, span):
+        data = span.as_dict()
+        self.logger.log(
+            self.level,
+            "pdf phase %(phase)s took %(duration).3fs "
+            "(in: %(bytes_in)s, out: %(bytes_out)s, status: %(status)s)",
+            data, extra={'pdf_span': data})
+
+
+class MemorySink:
+    """Keeps every span in `spans`, and summarizes them by phase
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def emit(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def get_phases(self):
+        return [span.name for span in self.spans]
+
+    def get_breakdown(self):
+        """Returns a dict of totals for each phase, in the order that
+        each phase was first seen
+        """
+        breakdown = {}
+        order = []
+        for span in self.spans:
+            if span.name not in breakdown:
+                order.append(span.name)
+                breakdown[span.name] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0,
+                    'bytes_in': 0, 'bytes_out': 0, 'errors': 0}
+            phase = breakdown[span.name]
+            phase['count'] += 1
+            phase['total'] += span.duration
+            phase['max'] = max(phase['max'], span.duration)
+            phase['bytes_in'] += span.bytes_in or 0
+            phase['bytes_out'] += span.bytes_out or 0
+            if span.status not in (None, 0):
+                phase['errors'] += 1
+        return [(name, breakdown[name]) for name in order]
+
+
+class Timer:
+    """Sends timed spans to each of its sinks
+    """
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks) if sinks is not None else [LoggingSink()]
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Times the body of a `with` block. The yielded Span can be
+        updated inside the block, for example to set `bytes_out`
+        """
+        span = Span(name, **fields)
+        started = time.monotonic()
+        try:
+            yield span
+        except Exception:
+            if span.status is None:
+                span.status = 'error'
+            raise
+        finally:
+            span.duration = time.monotonic() - started
+            for sink in list(self.sinks):
+                sink.emit(span)
+
+    @contextmanager
+    def collect(self):
+        """Adds a MemorySink for the duration of a `with` block
+        """
+        sink = MemorySink()
+        self.sinks.append(sink)
+        try:
+            yield sink
+        finally:
+            self.sinks.remove(sink)
+
+
+# used by PDFParser and FillablePDF unless they are given another timer
+timer = Timer()
+
+
+def span(name, **fields):
+    return timer.span(name, **fields)
+
+
+def collect():
+    return timer.collect()
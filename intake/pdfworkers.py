@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import queue
+import select
+import subprocess
+import threading
+
+from intake.pdfparser import (
+    PDFParserError, EXTENSIONS_CLASS, get_extensions_classpath)
+
+
+class PDFWorkerTimeout(PDFParserError):
+    pass
+
+
+class PDFWorker:
+    """A single warm pdfparser JVM.
+
+    Requests are written to the worker's stdin as one JSON array of
+    pdfparser arguments per line. Responses are framed as
+        RESULT <stdout length> <stderr length>\\n<stdout bytes><stderr bytes>
+    see `PdfParserWorker.java`.
+    """
+
+    def __init__(self, jar_path, class_dir=None, java='java'):
+        self.jar_path = jar_path
+        self.class_dir = class_dir
+        self.java = java
+        self.process = None
+        self._buffer = b''
+
+    def build_command(self):
+        return [
+            self.java, '-cp',
+            get_extensions_classpath(self.jar_path, self.class_dir),
+            EXTENSIONS_CLASS]
+
+    def start(self):
+        self._buffer = b''
+        self.process = subprocess.Popen(
+            self.build_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.is_alive():
+            self.process.kill()
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _fill_buffer(self, deadline):
+        """Read whatever is available from the worker's stdout,
+        raising PDFWorkerTimeout if `deadline` passes first
+        """
+        fd = self.process.stdout.fileno()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise PDFWorkerTimeout(
+                "pdfparser worker did not respond in time")
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if not ready:
+            return
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            raise PDFParserError("pdfparser worker exited unexpectedly")
+        self._buffer += chunk
+
+    def _read(self, size, deadline):
+        while len(self._buffer) < size:
+            self._fill_buffer(deadline)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_header(self, deadline):
+        while b'\n' not in self._buffer:
+            self._fill_buffer(deadline)
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        parts = line.decode('utf-8').split()
+        if len(parts) != 3 or parts[0] != 'RESULT':
+            raise PDFParserError(
+                "unexpected response from pdfparser worker: {}".format(line))
+        return int(parts[1]), int(parts[2])
+
+    def call(self, args, timeout):
+        """Send `args` to the worker and return `(out, err)` as bytes.
+        """
+        if not self.is_alive():
+            self.restart()
+        deadline = time.monotonic() + timeout
+        request = json.dumps(args).encode('utf-8') + b'\n'
+        try:
+            self.process.stdin.write(request)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as error:
+            raise PDFParserError(
+                "could not write to pdfparser worker: {}".format(error))
+        out_length, err_length = self._read_header(deadline)
+        out = self._read(out_length, deadline)
+        err = self._read(err_length, deadline)
+        return out, err
+
+    def ping(self, timeout=10):
+        try:
+            out, err = self.call(['ping'], timeout)
+        except PDFParserError:
+            return False
+        return out == b'pong'
+
+
+class PDFWorkerPool:
+    """A small pool of warm pdfparser workers.
+
+    Each process keeps its own pool (one per gunicorn worker). Workers
+    are started lazily, restarted if they crash, and killed and replaced
+    if a call runs past `timeout` seconds.
+    """
+
+    def __init__(self, jar_path, size=2, timeout=60, worker_class=PDFWorker):
+        self.jar_path = jar_path
+        self.size = size
+        self.timeout = timeout
+        self.worker_class = worker_class
+        self.workers = [worker_class(jar_path) for i in range(size)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+
+    def acquire(self):
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PDFWorkerTimeout(
+                "no pdfparser worker became available in time")
+
+    def release(self, worker):
+        self._idle.put(worker)
+
+    def run(self, args):
+        """Run pdfparser `args` on a pooled worker, returning `(out, err)`
+        """
+        worker = self.acquire()
+        try:
+            return worker.call(args, self.timeout)
+        except PDFParserError:
+            # the worker is in an unknown state, so replace it
+            worker.stop()
+            raise
+        finally:
+            self.release(worker)
+
+    def check_health(self):
+        """Ping every worker, restarting any that do not answer.
+        Waits for busy workers to finish. Returns the number of workers
+        that were restarted.
+        """
+        restarted = 0
+        held = [self.acquire() for i in range(self.size)]
+        try:
+            for worker in held:
+                if not worker.ping(self.timeout):
+                    worker.restart()
+                    restarted += 1
+        finally:
+            for worker in held:
+                self.release(worker)
+        return restarted
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_worker_pool(jar_path, size=2, timeout=60):
+    """Returns the process-wide worker pool for a given jar path
+    """
+    with _pools_lock:
+        key = (jar_path, size, timeout)
+        if key not in _pools:
+            _pools[key] = PDFWorkerPool(jar_path, size=size, timeout=timeout)
+        return _pools[key]
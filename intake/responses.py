@@ -0,0 +1,204 @@
+import re
+import zipfile
+from calendar import timegm
+
+from django.http import StreamingHttpResponse, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileChunkIterator:
+    """Yields `length` bytes of `file_obj` from `start`, in chunks.
+    `close` is called by django when the response is closed, and closes
+    the file and calls `on_close`, if given
+    """
+
+    def __init__(self, file_obj, start, length, chunk_size=64 * 1024,
+            on_close=None):
+        self.file_obj = file_obj
+        self.start = start
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.on_close = on_close
+
+    def __iter__(self):
+        self.file_obj.seek(self.start)
+        while self.remaining > 0:
+            chunk = self.file_obj.read(min(self.chunk_size, self.remaining))
+            if not chunk:
+                break
+            self.remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.file_obj.close()
+        if self.on_close:
+            self.on_close()
+            self.on_close = None
+
+
+def parse_range_header(header, size):
+    """Returns a `(start, end)` tuple of inclusive byte positions for a
+    single `bytes=` range, `None` if there is no usable range header,
+    and raises ValueError if the range can't be satisfied.
+    Multiple ranges are not supported, and are ignored
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # a suffix range, 'bytes=-500' is the last 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def file_response(request, file_obj, size, content_type='application/pdf',
+        on_close=None):
+    """Streams an open file, with support for single HTTP Range requests.
+    `on_close` is called once the response is finished, and can be used
+    to clean up temporary files
+    """
+    try:
+        byte_range = parse_range_header(
+            request.META.get('HTTP_RANGE', ''), size)
+    except ValueError:
+        file_obj.close()
+        if on_close:
+            on_close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        FileChunkIterator(file_obj, start, length, on_close=on_close),
+        content_type=content_type,
+        status=206 if byte_range else 200)
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    if byte_range:
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+    return response
+
+
+def parse_etags(header):
+    """Returns the entity tags in an If-None-Match header, without
+    their quotes. Weak tags are treated as strong ones
+    """
+    tags = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tags.append(tag.strip('"'))
+    return tags
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """Returns True if a GET or HEAD request can be answered with 304
+    Not Modified. As in RFC 7232, If-Modified-Since is only used when
+    there is no If-None-Match
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = parse_etags(if_none_match)
+        return '*' in tags or etag in tags
+    since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if since is None or last_modified is None:
+        return False
+    return timegm(last_modified.utctimetuple()) <= since
+
+
+def set_validators(response, etag, last_modified=None,
+        cache_control='private, no-cache'):
+    """Adds ETag, Last-Modified and Cache-Control headers to a response.
+    The default Cache-Control lets browsers keep a copy, but makes them
+    check it is still current, and keeps it out of shared caches
+    """
+    response['ETag'] = '"{}"'.format(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(
+            timegm(last_modified.utctimetuple()))
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def not_modified_response(etag, last_modified=None, **kwargs):
+    return set_validators(
+        HttpResponse(status=304), etag, last_modified, **kwargs)
+
+
+class ZipBuffer:
+    """A write-only file object for `zipfile.ZipFile`. It has no `seek`,
+    so ZipFile writes a streamable archive, and `pop` returns whatever
+    has been written since the last call
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(files):
+    """Yields a zip archive of `files`, an iterable of
+    `(name, path, on_written)` tuples, as it is written. Files are added
+    one at a time, and read from disk in chunks. `on_written`, if not
+    `None`, is called once the file has been added, for example to delete
+    a temporary file. pdfs are already compressed, so files are stored
+    rather than deflated
+    """
+    buffer = ZipBuffer()
+    try:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for name, path, on_written in files:
+                try:
+                    archive.write(path, name)
+                finally:
+                    if on_written:
+                        on_written()
+                yield buffer.pop()
+        yield buffer.pop()
+    finally:
+        if hasattr(files, 'close'):
+            files.close()
+
+
+def zip_response(files, filename):
+    """Streams a zip archive of `files`, see `iter_zip`
+    """
+    response = StreamingHttpResponse(
+        iter_zip(files), content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        filename)
+    return response
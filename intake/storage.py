@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.files.storage import get_storage_class
+
+
+class PrivateStorage(get_storage_class(
+        getattr(settings, 'PRIVATE_FILE_STORAGE', None))):
+    """Storage for files that hold applicants' answers, such as filled
+    pdfs. It uses settings.PRIVATE_FILE_STORAGE, which defaults to
+    the default file storage, but never makes files public: s3 storages
+    upload files as `public-read` unless told otherwise. Urls of files
+    on s3 are signed and expire
+    """
+    default_acl = 'private'
+    bucket_acl = 'private'
+    querystring_auth = True
+
+
+private_storage = PrivateStorage()
@@ -0,0 +1,70 @@
+import os
+import hashlib
+from tempfile import mkstemp
+
+
+class LocalFileCache:
+    """Keeps copies of remote files in a local directory, so that
+    they can be passed to pdfparser by path without being downloaded
+    and copied again.
+
+    Files are named by a hash of their key, so a new key (for example,
+    after the remote file is replaced) results in a new copy. Once the
+    directory holds more than `max_bytes`, the least recently used
+    files are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def get_path_for_key(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.pdf')
+
+    def get_path(self, key, file_obj):
+        """Returns a local path for `key`, writing the contents of
+        `file_obj` there if it is not already cached. `file_obj` can be
+        a callable that returns a file-like object, so that it is only
+        opened on a cache miss
+        """
+        path = self.get_path_for_key(key)
+        if os.path.exists(path):
+            # mark as recently used
+            os.utime(path)
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        if callable(file_obj):
+            file_obj = file_obj()
+        os_int, tmp_path = mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with open(os_int, 'wb') as tmp_file:
+                tmp_file.write(file_obj.read())
+            # rename is atomic, so other processes never see partial files
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        if not self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.pdf') and path != keep:
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for mtime, size, path in entries)
+        if keep and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,77 @@
+import time
+import threading
+from collections import deque, namedtuple
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+
+RecordedRequest = namedtuple(
+    'RecordedRequest', ['method', 'path', 'headers', 'body', 'client_port'])
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeHTTPServer:
+    """A local HTTP server for testing remote API clients offline.
+    Queue responses with `add_response`. Once they run out, requests get
+    an empty 200. Every request is recorded in `requests`, along with the
+    client port, which shows whether a connection was reused.
+
+        with FakeHTTPServer() as server:
+            server.add_response(503, headers={'Retry-After': '1'})
+            client.post(server.url + '/messages', data='{}')
+    """
+
+    def __init__(self):
+        self.responses = deque()
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+                fake.requests.append(RecordedRequest(
+                    self.command, self.path, dict(self.headers), body,
+                    self.client_address[1]))
+                status, headers, content, delay = (
+                    fake.responses.popleft() if fake.responses
+                    else (200, {}, b'', 0))
+                if delay:
+                    time.sleep(delay)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def add_response(self, status=200, body=b'', headers=None, delay=0):
+        self.responses.append((status, headers or {}, body, delay))
+
+    def __enter__(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,123 @@
+import time
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import Mock
+
+from intake import admission, pdfparser
+
+
+class TestHostSemaphore(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.semaphore = admission.HostSemaphore(
+            self.directory, slots=1, max_waiting=1, timeout=0.2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_slots_are_shared_between_semaphores(self):
+        other = admission.HostSemaphore(
+            self.directory, slots=1, max_waiting=1, timeout=0.2)
+        with self.semaphore.slot():
+            self.assertEqual(other.get_active(), 1)
+            with self.assertRaises(admission.AdmissionError):
+                other.acquire()
+        self.assertEqual(other.stats['timed_out'], 1)
+        with other.slot():
+            pass
+        self.assertEqual(other.get_active(), 0)
+        self.assertEqual(other.stats['admitted'], 1)
+
+    def test_full_queue_is_rejected(self):
+        self.semaphore.timeout = 5
+        slot = self.semaphore.acquire()
+
+        def wait_for_slot():
+            with self.semaphore.slot():
+                pass
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        deadline = time.monotonic() + 5
+        while self.semaphore.get_queue_depth() < 1:
+            self.assertLess(time.monotonic(), deadline,
+                "the waiting thread never queued")
+            time.sleep(0.01)
+        with self.assertRaises(admission.AdmissionError) as context:
+            self.semaphore.acquire()
+        self.assertEqual(context.exception.retry_after, 10)
+        self.assertEqual(self.semaphore.stats['rejected'], 1)
+        self.semaphore.release(slot)
+        waiter.join()
+        self.assertEqual(self.semaphore.stats['admitted'], 2)
+        self.assertGreater(self.semaphore.stats['max_wait'], 0)
+
+    def test_parser_waits_for_a_slot(self):
+        parser = pdfparser.PDFParser(admission=self.semaphore)
+        parser._run = Mock(return_value=(b'{}', b''))
+        with self.semaphore.slot():
+            with self.assertRaises(admission.AdmissionError):
+                parser.run_command(['get_fields', 'a.pdf'])
+        parser._run.assert_not_called()
+        self.assertEqual(parser.run_command(['get_fields', 'a.pdf']), '{}')
+
+    def test_metrics_do_not_take_slots(self):
+        self.semaphore.acquire = Mock(wraps=self.semaphore.acquire)
+        probing = threading.Event()
+        done = threading.Event()
+
+        def probe():
+            while not done.is_set():
+                self.semaphore.get_active()
+                self.semaphore.get_queue_depth()
+                probing.set()
+        prober = threading.Thread(target=probe)
+        prober.start()
+        probing.wait(5)
+        try:
+            for i in range(50):
+                with self.semaphore.slot():
+                    self.assertEqual(self.semaphore.get_active(), 1)
+        finally:
+            done.set()
+            prober.join()
+        self.assertEqual(self.semaphore.stats['rejected'], 0)
+        self.assertEqual(self.semaphore.stats['timed_out'], 0)
+
+    def test_parser_is_admitted_once_per_render(self):
+        parser = pdfparser.PDFParser(admission=self.semaphore)
+        parser._run = Mock(return_value=(b'{}', b''))
+        with parser:
+            self.assertEqual(self.semaphore.get_active(), 1)
+            parser.run_command(['get_fields', 'a.pdf'])
+            parser.run_command(['get_fields', 'b.pdf'])
+        self.assertEqual(self.semaphore.get_active(), 0)
+        self.assertEqual(self.semaphore.stats['admitted'], 1)
+
+    def test_parallel_fills_are_limited_to_free_slots(self):
+        semaphore = admission.HostSemaphore(
+            self.directory, slots=2, max_waiting=1, timeout=0.2)
+        parser = pdfparser.PDFParser(
+            admission=semaphore, max_fill_workers=4)
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+
+        def run(args, span=None):
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return b'', b''
+        parser._run = Mock(side_effect=run)
+        with parser:
+            parser.fill_each_pdf(
+                b'%PDF', [{}] * 8, field_data={'fields': []})
+            self.assertEqual(semaphore.get_active(), 1)
+        self.assertEqual(parser._run.call_count, 8)
+        self.assertEqual(most_running[0], 2)
+        self.assertEqual(semaphore.get_active(), 0)
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+from django.test import TestCase, override_settings
+
+from intake import circuitbreaker, models, notifications
+from intake.tests import mock
+
+
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        self.time = datetime(2016, 7, 1, tzinfo=timezone.utc)
+        self.on_change = Mock()
+        self.breaker = circuitbreaker.CircuitBreaker(
+            'front-test', failure_rate=0.5, minimum_calls=4, window=60,
+            open_seconds=30, on_change=self.on_change,
+            now=lambda: self.time)
+
+    def call(self, fail=False):
+        with self.breaker.call():
+            if fail:
+                raise ConnectionError('timed out')
+
+    def fail(self, times=1):
+        for i in range(times):
+            with self.assertRaises(ConnectionError):
+                self.call(fail=True)
+
+    def test_opens_after_enough_failures(self):
+        self.call()
+        self.fail(2)
+        self.on_change.assert_not_called()
+        self.fail()
+        self.on_change.assert_called_once_with(
+            self.breaker, circuitbreaker.OPEN)
+        with self.assertRaises(circuitbreaker.CircuitOpenError) as context:
+            self.call()
+        self.assertEqual(context.exception.retry_after, 30)
+
+    def test_failures_in_old_windows_are_forgotten(self):
+        self.fail(3)
+        self.time += timedelta(seconds=61)
+        self.call()
+        self.fail(2)
+        self.on_change.assert_not_called()
+
+    def test_trial_call_closes_breaker(self):
+        self.fail(4)
+        self.time += timedelta(seconds=31)
+        trial = self.breaker.before_call()
+        self.assertTrue(trial)
+        # other calls fail fast while the trial is running
+        with self.assertRaises(circuitbreaker.CircuitOpenError):
+            self.call()
+        self.breaker.record(True, trial)
+        self.on_change.assert_called_with(self.breaker, circuitbreaker.CLOSED)
+        self.call()
+        self.assertEqual(
+            models.CircuitBreakerState.objects.get(name='front-test').calls, 1)
+
+    @patch('intake.circuitbreaker.CircuitBreaker.get_state')
+    def test_successes_are_counted_without_locking(self, get_state):
+        models.CircuitBreakerState.objects.create(
+            name='front-test', window_start=self.time)
+        for i in range(3):
+            self.breaker.record(True)
+        get_state.assert_not_called()
+        state = models.CircuitBreakerState.objects.get(name='front-test')
+        self.assertEqual(state.calls, 3)
+        # a new window is started under the lock
+        self.time += timedelta(seconds=61)
+        get_state.side_effect = lambda lock=False: state
+        self.breaker.record(True)
+        get_state.assert_called_once_with(lock=True)
+        self.assertEqual(state.calls, 1)
+        self.assertEqual(state.window_start, self.time)
+
+    def test_failed_trial_reopens_breaker(self):
+        self.fail(4)
+        self.time += timedelta(seconds=31)
+        self.fail()
+        with self.assertRaises(circuitbreaker.CircuitOpenError):
+            self.call()
+        # reopening isn't reported again
+        self.assertEqual(self.on_change.call_count, 1)
+
+    def test_only_outages_count_as_failures(self):
+        for i in range(4):
+            with self.assertRaises(notifications.FrontAPIError):
+                with self.breaker.call(is_failure=lambda error: False):
+                    raise notifications.FrontAPIError('bad', status_code=400)
+        self.call()
+        self.on_change.assert_not_called()
+
+    @override_settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=1)
+    @patch('intake.models.FormSubmission.send_confirmation_notifications')
+    def test_outbox_waits_for_open_breaker(self, send_confirmations):
+        send_confirmations.side_effect = circuitbreaker.CircuitOpenError(
+            'front-email', 20)
+        entry = models.NotificationOutboxEntry.add_confirmations(
+            mock.FormSubmissionFactory.create())
+        models.NotificationOutboxEntry.send_pending()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, models.NotificationOutboxEntry.PENDING)
+        self.assertEqual(entry.attempts, 0)
+        self.assertGreater(entry.next_attempt, entry.updated)
+
+    @patch('intake.notifications.slack_simple.send')
+    def test_state_changes_are_reported_to_slack(self, slack):
+        notifications.report_circuit_change(
+            self.breaker, circuitbreaker.OPEN)
+        self.assertIn('paused for 30 seconds', slack.call_args[0][0])
+        slack.side_effect = ConnectionError('slack is down too')
+        notifications.report_circuit_change(
+            self.breaker, circuitbreaker.CLOSED)
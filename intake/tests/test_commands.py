@@ -1,8 +1,10 @@
 import random
+import tempfile
 from unittest.mock import Mock, patch, MagicMock
 from intake.tests import mock
 from django.test import TestCase
 
+from intake import pdftiming
 from intake.management import commands
 
 class TestCommands(TestCase):
@@ -15,6 +17,87 @@ class TestCommands(TestCase):
         command.style.SUCCESS.assert_called_once_with("Successfully referred any unopened apps")
 
 
+    @patch('intake.management.commands.render_pdfs.models')
+    def test_render_pdfs(self, models):
+        fillable = models.FillablePDF.get_default_instance.return_value
+        fillable.prerender.return_value = ([Mock(), Mock()], [Mock()])
+        command = commands.render_pdfs.Command()
+        command.stdout = Mock()
+        command.handle(loop=False, interval=30)
+        fillable.prerender.assert_called_once_with(
+            models.FormSubmission.get_unrendered_apps.return_value)
+        command.stdout.write.assert_called_once_with(
+            command.style.SUCCESS("Rendered 2 pdfs, 1 failed"))
+
+    @patch('intake.management.commands.run_bundle_jobs.models')
+    def test_run_bundle_jobs(self, models):
+        models.BundleJob.FAILED = 4
+        models.BundleJob.run_pending.return_value = [
+            Mock(status=3), Mock(status=4)]
+        command = commands.run_bundle_jobs.Command()
+        command.stdout = Mock()
+        models.BundleJob.delete_expired.return_value = 3
+        command.handle(loop=False, interval=5)
+        models.BundleJob.run_pending.assert_called_once_with()
+        command.stdout.write.assert_called_once_with(
+            command.style.SUCCESS(
+                "Ran 2 bundle jobs, 1 failed, deleted 3 expired"))
+
+    @patch('intake.management.commands.send_notifications.models')
+    def test_send_notifications(self, models):
+        outbox = models.NotificationOutboxEntry
+        outbox.PENDING, outbox.SENT, outbox.FAILED = 1, 3, 4
+        outbox.send_pending.return_value = [
+            Mock(status=3), Mock(status=3), Mock(status=1),
+            Mock(status=4, id=7, error='ConnectionError: timed out')]
+        command = commands.send_notifications.Command()
+        command.stdout = Mock()
+        command.stderr = Mock()
+        models.SlackDigestEvent.send_due.return_value = [[Mock(), Mock()]]
+        command.handle(loop=False, interval=2, retry_failed=False)
+        outbox.send_pending.assert_called_once_with()
+        outbox.retry_failed.assert_not_called()
+        command.stdout.write.assert_called_once_with(command.style.SUCCESS(
+            "Sent 2 notifications and 1 slack digests, 1 will be retried, 1 failed"))
+        command.stderr.write.assert_called_once_with(
+            "Notification 7 failed: ConnectionError: timed out")
+
+    @patch('intake.management.commands.pdf_timings.models')
+    def test_pdf_timings(self, models):
+        fillable = models.FillablePDF.get_default_instance.return_value
+        models.FormSubmission.objects.order_by.return_value = [Mock()]
+
+        def fill(submission):
+            with pdftiming.span('set_fields', bytes_in=10, bytes_out=20):
+                pass
+        fillable.fill.side_effect = fill
+        command = commands.pdf_timings.Command()
+        command.stdout = Mock()
+        command.handle(ids=[], count=1)
+        output = command.stdout.write.call_args[0][0]
+        lines = output.split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('set_fields'))
+        self.assertIn('20', lines[1])
+        self.assertTrue(lines[2].startswith('total'))
+
+    @patch('intake.management.commands.export_pdfs.responses')
+    @patch('intake.management.commands.export_pdfs.exports')
+    def test_export_pdfs(self, exports, responses):
+        exports.get_submissions.return_value = [Mock(), Mock()]
+        responses.iter_zip.return_value = [b'zip', b'file']
+        command = commands.export_pdfs.Command()
+        command.stdout = Mock()
+        with tempfile.NamedTemporaryFile() as output:
+            command.handle(output=output.name, ids=[1, 2],
+                start=None, end=None)
+            self.assertEqual(output.read(), b'zipfile')
+        exports.get_submissions.assert_called_once_with(
+            ids=[1, 2], start=None, end=None)
+        command.stdout.write.assert_called_once_with(
+            command.style.SUCCESS(
+                "Exported 2 pdfs to {}".format(output.name)))
+
     @patch('intake.management.commands.pull_data_from_typeseam.DataImporter')
     @patch('intake.management.commands.pull_data_from_typeseam.notifications')
     @patch('intake.management.commands.pull_data_from_typeseam.os')
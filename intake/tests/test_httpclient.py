@@ -0,0 +1,117 @@
+import socket
+from unittest import TestCase
+from unittest.mock import Mock
+
+import requests
+
+from intake import httpclient
+from intake.tests.fake_server import FakeHTTPServer
+
+
+def get_unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestHTTPClient(TestCase):
+
+    def setUp(self):
+        self.sleep = Mock()
+        self.client = httpclient.HTTPClient(
+            connect_timeout=1, read_timeout=1, retries=2, backoff=0.5,
+            max_backoff=10, sleep=self.sleep, clock=lambda: 1000.0)
+        self.server = FakeHTTPServer().__enter__()
+        self.url = self.server.url + '/channels/1/messages'
+
+    def tearDown(self):
+        self.client.close()
+        self.server.__exit__(None, None, None)
+
+    def test_connections_are_reused(self):
+        for i in range(3):
+            response = self.client.post(self.url, data='{}')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        ports = {request.client_port for request in self.server.requests}
+        self.assertEqual(len(ports), 1)
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.server.add_response(503)
+        self.server.add_response(500)
+        self.server.add_response(200, body=b'{"status": "ok"}')
+        response = self.client.request('GET', self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests), 3)
+        delays = [args[0] for args, kwargs in self.sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertLessEqual(delays[0], 0.5)
+        self.assertLessEqual(delays[1], 1.0)
+
+    def test_gives_up_after_retries(self):
+        for i in range(3):
+            self.server.add_response(502)
+        response = self.client.request('GET', self.url)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_posts_are_only_retried_when_asked_to(self):
+        # a 5xx may come after the message was accepted, so sending it
+        # again could send it twice
+        for status in (500, 502, 503, 504):
+            self.server.add_response(status)
+            self.assertEqual(self.client.post(self.url).status_code, status)
+        self.assertEqual(len(self.server.requests), 4)
+        self.sleep.assert_not_called()
+        self.server.add_response(503, headers={'Retry-After': '2'})
+        self.server.add_response(202, body=b'{"status": "accepted"}')
+        response = self.client.post(self.url, data='{"to": ["a"]}')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.server.requests[-1].body, b'{"to": ["a"]}')
+        self.sleep.assert_called_once_with(2)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.add_response(400)
+        self.assertEqual(self.client.post(self.url).status_code, 400)
+        self.assertEqual(len(self.server.requests), 1)
+        self.sleep.assert_not_called()
+
+    def test_retry_after_is_honoured(self):
+        self.server.add_response(429, headers={'Retry-After': '3'})
+        self.server.add_response(429, headers={'X-RateLimit-Reset': '1004'})
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        self.assertListEqual(
+            [args[0] for args, kwargs in self.sleep.call_args_list], [3, 4])
+
+    def test_long_retry_after_is_not_waited_for(self):
+        self.server.add_response(429, headers={'Retry-After': '120'})
+        self.assertEqual(self.client.post(self.url).status_code, 429)
+        self.assertEqual(len(self.server.requests), 1)
+        self.sleep.assert_not_called()
+
+    def test_front_rate_limit_headers(self):
+        self.server.add_response(202, headers={
+            'X-RateLimit-Limit': '50',
+            'X-RateLimit-Remaining': '0',
+            'X-RateLimit-Reset': '1005'})
+        self.client.post(self.url)
+        self.sleep.assert_not_called()
+        self.client.post(self.url)
+        self.sleep.assert_called_once_with(5)
+        # other hosts aren't held up
+        self.sleep.reset_mock()
+        self.client.post(self.server.url.replace('127.0.0.1', 'localhost'))
+        self.sleep.assert_not_called()
+
+    def test_read_timeouts_are_not_retried(self):
+        self.client.timeout = (1, 0.1)
+        self.server.add_response(200, delay=0.5)
+        with self.assertRaises(requests.ReadTimeout):
+            self.client.post(self.url)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_connection_errors_are_retried(self):
+        url = 'http://127.0.0.1:{}/'.format(get_unused_port())
+        with self.assertRaises(requests.ConnectionError):
+            self.client.post(url)
+        self.assertEqual(self.sleep.call_count, 2)
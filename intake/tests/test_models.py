@@ -1,13 +1,23 @@
 from django.test import TestCase, override_settings
 from django.core.exceptions import ValidationError
-from datetime import datetime
+from django.core.files.base import ContentFile
+from django.utils import timezone as timezone_utils
+from datetime import datetime, timedelta
+import os
+import json
 
 from unittest.mock import patch, Mock
 
 from intake.tests import mock
 from user_accounts.tests.mock import create_fake_auth_models
 from user_accounts import models as auth_models
-from intake import models, fields, anonymous_names, validators, notifications
+from intake import models, fields, anonymous_names, validators, notifications, pdftiming
+from intake.admission import AdmissionError
+from intake.pdfparser import PDFParserError
+
+
+def pdfparser_error():
+    raise PDFParserError("could not fill")
 
 
 class TestModels(TestCase):
@@ -63,6 +73,224 @@ class TestModels(TestCase):
         filled_pdf = pdf.fill(submission)
         self.assertEqual(type(filled_pdf), bytes)
 
+    @patch('intake.models._field_data_cache', {})
+    @patch('intake.models.get_parser')
+    def test_fillablepdf_caches_field_data(self, get_parser):
+        parser = get_parser.return_value.__enter__.return_value
+        parser.get_field_data.return_value = {'fields': []}
+        fillable = mock.fillable_pdf()
+        submissions = mock.FormSubmissionFactory.create_batch(2)
+        fillable.get_pdf_fields()
+        fillable.fill(submissions[0])
+        fillable.fill_many(submissions)
+        parser.get_field_data.assert_called_once_with(fillable.get_local_pdf())
+        for call in (parser.fill_pdf, parser.fill_many_pdfs):
+            args, kwargs = call.call_args
+            self.assertDictEqual(kwargs['field_data'], {'fields': []})
+        # other processes load the saved field data instead of the pdf
+        saved = models.FillablePDF.objects.get(pk=fillable.pk)
+        self.assertEqual(saved.field_data_key, fillable.get_template_key())
+        with patch('intake.models._field_data_cache', {}):
+            self.assertDictEqual(saved.get_field_data(), {'fields': []})
+        self.assertEqual(parser.get_field_data.call_count, 1)
+
+    @patch('intake.models.FillablePDF.fill')
+    def test_fillablepdf_fill_cached(self, fill):
+        fill.return_value = b'%PDF filled'
+        fillable = mock.fillable_pdf()
+        submission = mock.FormSubmissionFactory.create()
+        self.assertEqual(fillable.fill_cached(submission), b'%PDF filled')
+        self.assertEqual(fillable.fill_cached(submission), b'%PDF filled')
+        fill.assert_called_once_with(submission)
+        self.assertEqual(submission.cached_pdfs.count(), 1)
+
+        # changing the answers invalidates the cached pdf
+        submission.answers['first_name'] = 'Changed'
+        submission.save()
+        self.assertEqual(submission.cached_pdfs.count(), 0)
+        fillable.fill_cached(submission)
+        self.assertEqual(fill.call_count, 2)
+
+        # changing the template invalidates everything
+        fillable.save()
+        self.assertEqual(models.FilledPDFCacheEntry.objects.count(), 0)
+
+    def test_fill_bundle_reuses_cached_pdfs(self):
+        fillable = mock.fillable_pdf()
+        submissions = mock.FormSubmissionFactory.create_batch(3)
+        fillable.fill_cached(submissions[0])
+        with pdftiming.collect() as collector:
+            bundle = fillable.fill_bundle(submissions)
+        self.assertEqual(type(bundle), bytes)
+        self.assertEqual(collector.get_phases().count('set_fields'), 2)
+        self.assertEqual(models.FilledPDFCacheEntry.objects.count(), 3)
+        with pdftiming.collect() as collector:
+            fillable.fill_bundle(submissions[1:])
+        self.assertNotIn('set_fields', collector.get_phases())
+        self.assertEqual(
+            fillable.get_cache_key(submissions),
+            fillable.get_cache_key(reversed(submissions)))
+        self.assertEqual(
+            fillable.get_cache_key(submissions[:1]),
+            fillable.get_submission_cache_key(submissions[0]))
+
+    @patch('intake.models.FillablePDF.fill')
+    def test_filled_pdf_cache_evicts_least_recently_used(self, fill):
+        fillable = mock.fillable_pdf()
+        submissions = mock.FormSubmissionFactory.create_batch(3)
+        fill.return_value = b'x' * 10
+        with override_settings(FILLED_PDF_CACHE_MAX_BYTES=25):
+            for submission in submissions:
+                fillable.fill_cached(submission)
+        cached_ids = [
+            entry.submission_id for entry
+            in models.FilledPDFCacheEntry.objects.all()]
+        self.assertEqual(len(cached_ids), 2)
+        self.assertNotIn(submissions[0].id, cached_ids)
+
+    @patch('intake.models.FillablePDF.fill_bundle')
+    def test_deleting_a_submission_deletes_its_cached_bundles(self, fill_bundle):
+        fill_bundle.return_value = b'%PDF bundle'
+        fillable = mock.fillable_pdf()
+        submissions = mock.FormSubmissionFactory.create_batch(3)
+        for bundle in (submissions[:2], submissions[1:]):
+            pdf, size, tmp_path = fillable.open_many_cached(bundle)
+            pdf.close()
+            os.remove(tmp_path)
+        entries = models.FilledPDFCacheEntry.objects
+        self.assertEqual(entries.count(), 2)
+        self.assertEqual(submissions[1].cached_bundles.count(), 2)
+        submissions[0].delete()
+        self.assertEqual(entries.count(), 1)
+        models.FormSubmission.objects.filter(pk=submissions[2].pk).delete()
+        self.assertEqual(entries.count(), 0)
+
+    def test_filled_pdf_cache_keeps_the_first_entry_stored(self):
+        key = models.gen_uuid()
+        first = models.FilledPDFCacheEntry.store(key, b'%PDF first')
+        second = models.FilledPDFCacheEntry.store(key, b'%PDF second')
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(models.FilledPDFCacheEntry.fetch(key), b'%PDF first')
+        # the file saved for the second entry isn't left behind
+        directory, files = first.pdf.storage.listdir('filled_pdfs')
+        self.assertEqual(
+            len([name for name in files if name.startswith(key)]), 1)
+
+    @patch('intake.models.BundleJob.run')
+    def test_stale_bundle_jobs_are_run_again(self, run):
+        submissions = mock.FormSubmissionFactory.create_batch(2)
+        ids = [s.id for s in submissions]
+        job, created = models.BundleJob.get_or_create_for_ids(ids)
+        self.assertTrue(job.claim())
+        self.assertFalse(job.claim())
+        self.assertEqual(
+            models.BundleJob.get_or_create_for_ids(ids), (job, False))
+
+        # a worker died while running the job
+        models.BundleJob.objects.filter(pk=job.pk).update(
+            updated=timezone_utils.now() - timedelta(seconds=601))
+        new_job, created = models.BundleJob.get_or_create_for_ids(ids)
+        self.assertTrue(created)
+        self.assertListEqual(
+            models.BundleJob.run_pending(), [job, new_job])
+        self.assertEqual(run.call_count, 2)
+
+    def test_bundle_job_queued_by_a_concurrent_request_is_reused(self):
+        submissions = mock.FormSubmissionFactory.create_batch(2)
+        ids = [s.id for s in submissions]
+        real_get_reusable_job = models.BundleJob.get_reusable_job
+        other_jobs = []
+
+        def other_request_queues_first(serialized_ids):
+            if not other_jobs:
+                # another request queued a job after the first check
+                other_jobs.append(models.BundleJob.objects.create(
+                    submission_ids=serialized_ids))
+                return None
+            return real_get_reusable_job(serialized_ids)
+        with patch.object(models.BundleJob, 'get_reusable_job',
+                side_effect=other_request_queues_first):
+            job, created = models.BundleJob.get_or_create_for_ids(ids)
+        self.assertFalse(created)
+        self.assertEqual(job, other_jobs[0])
+        self.assertEqual(models.BundleJob.objects.count(), 1)
+
+    def test_bundle_jobs_are_deleted_with_their_pdfs(self):
+        submissions = mock.FormSubmissionFactory.create_batch(3)
+        jobs = [
+            models.BundleJob.get_or_create_for_ids(
+                [s.id for s in submissions[i:i + 2]])[0]
+            for i in range(2)]
+        jobs[0].pdf.save('bundle.pdf', ContentFile(b'%PDF bundle'))
+        name = jobs[0].pdf.name
+        models.BundleJob.objects.filter(pk=jobs[0].pk).update(
+            updated=timezone_utils.now() - timedelta(days=2))
+        self.assertEqual(models.BundleJob.delete_expired(), 1)
+        self.assertFalse(jobs[0].pdf.storage.exists(name))
+        submissions[2].delete()
+        self.assertEqual(models.BundleJob.objects.count(), 0)
+
+    @patch('intake.models.FillablePDF.fill')
+    def test_prerender_records_failures_for_retry(self, fill):
+        fillable = mock.fillable_pdf()
+        good, bad = mock.FormSubmissionFactory.create_batch(2)
+        fill.side_effect = lambda s: (
+            b'%PDF filled' if s == good else pdfparser_error())
+        rendered, failed = fillable.prerender([good, bad])
+        self.assertListEqual(rendered, [good])
+        self.assertListEqual(failed, [bad])
+        failure = bad.pdf_render_failures.get()
+        self.assertIn('PDFParserError', failure.error)
+        unrendered = models.FormSubmission.get_unrendered_apps(max_attempts=2)
+        self.assertNotIn(good, unrendered)
+        self.assertIn(bad, unrendered)
+        unrendered = models.FormSubmission.get_unrendered_apps(max_attempts=1)
+        self.assertNotIn(bad, unrendered)
+
+    @patch('intake.models.FillablePDF.fill')
+    def test_prerender_does_not_count_transient_errors(self, fill):
+        fillable = mock.fillable_pdf()
+        submission = mock.FormSubmissionFactory.create()
+        fill.side_effect = AdmissionError("too busy")
+        rendered, failed = fillable.prerender([submission])
+        self.assertListEqual(failed, [submission])
+        self.assertEqual(submission.pdf_render_failures.count(), 0)
+        self.assertIn(submission, models.FormSubmission.get_unrendered_apps(
+            max_attempts=1))
+
+    def test_unrendered_apps_are_recent_and_unopened(self):
+        recent, old, opened = mock.FormSubmissionFactory.create_batch(3)
+        models.FormSubmission.objects.filter(pk=old.pk).update(
+            date_received=timezone_utils.now() - timedelta(days=31))
+        models.FormSubmission.mark_viewed([opened], self.agency_users[0],
+            notify=False)
+        unrendered = models.FormSubmission.get_unrendered_apps(days=30)
+        self.assertIn(recent, unrendered)
+        self.assertNotIn(old, unrendered)
+        self.assertNotIn(opened, unrendered)
+
+    @patch('intake.models.import_translator')
+    def test_fillable_registry(self, import_translator):
+        fillable = mock.fillable_pdf()
+        with self.assertNumQueries(1):
+            default = models.FillablePDF.get_default_instance()
+            self.assertEqual(default, fillable)
+            # each caller gets its own instance, with its own file
+            other = models.FillablePDF.get_default_instance()
+            self.assertEqual(other, default)
+            self.assertIsNot(other, default)
+            self.assertIsNot(other.pdf, default.pdf)
+        default.get_translator()
+        default.get_translator()
+        import_translator.assert_called_once_with(fillable.translator)
+
+        # saving a FillablePDF clears the registry
+        fillable.save()
+        with self.assertNumQueries(1):
+            models.FillablePDF.get_default_instance()
+        default.get_translator()
+        self.assertEqual(import_translator.call_count, 2)
+
     def test_anonymous_names(self):
         fake_name = anonymous_names.generate()
         self.validate_anonymous_name(fake_name)
@@ -394,6 +622,181 @@ class TestModels(TestCase):
             submission=submission, errors={'sms': sms_error, 'email': email_error})
 
 
+    def test_log_confirmations_sent(self):
+        submission = mock.FormSubmissionFactory.create()
+        logs = models.ApplicationLogEntry.log_confirmations_sent(submission.id, [
+            ({'email': 'someone@gmail.com'}, 'email message'),
+            ({'sms': '+19993334444'}, 'text message')])
+        saved = models.ApplicantContactedLogEntry.objects.filter(
+            submission=submission).order_by('id')
+        self.assertListEqual([log.id for log in logs], [log.id for log in saved])
+        self.assertListEqual(
+            [(log.contact_info, log.message_sent) for log in saved], [
+                ({'email': 'someone@gmail.com'}, 'email message'),
+                ({'sms': '+19993334444'}, 'text message')])
+        self.assertTrue(all(
+            log.event_type == models.ApplicationLogEntry.CONFIRMATION_SENT
+            for log in saved))
+        self.assertSetEqual(
+            submission.get_confirmations_sent(), {'email', 'sms'})
+
+    @override_settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=2)
+    @patch('intake.models.notifications.slack_confirmation_sent.send')
+    @patch('intake.models.notifications.sms_confirmation.send')
+    @patch('intake.models.notifications.email_confirmation.send')
+    def test_notification_outbox_retries(self, email_notification, sms_notification, sent_notification):
+        outbox = models.NotificationOutboxEntry
+        submission = mock.FormSubmissionFactory.create()
+        submission.answers['contact_preferences'] = ['prefers_email', 'prefers_sms']
+        submission.answers['email'] = 'someone@gmail.com'
+        submission.answers['phone_number'] = '+19993334444'
+        submission.save()
+        entry = outbox.add_confirmations(submission)
+
+        # a connection error leaves the entry to be retried later,
+        # and the email that did go out isn't sent again
+        sms_notification.side_effect = ConnectionError('timed out')
+        self.assertListEqual(outbox.send_pending(), [entry])
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, outbox.PENDING)
+        self.assertIn('timed out', entry.error)
+        self.assertGreater(entry.next_attempt, entry.updated)
+        self.assertListEqual(outbox.send_pending(), [])
+        outbox.objects.update(next_attempt=entry.created)
+        outbox.send_pending()
+        entry.refresh_from_db()
+        self.assertEqual(email_notification.call_count, 1)
+        self.assertEqual(sms_notification.call_count, 2)
+
+        # after too many attempts, it is left for someone to look at
+        self.assertEqual(entry.status, outbox.FAILED)
+        self.assertEqual(outbox.retry_failed(), 1)
+        sms_notification.side_effect = None
+        outbox.send_pending()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, outbox.SENT)
+        self.assertEqual(email_notification.call_count, 1)
+        sent_notification.assert_called_once_with(
+            submission=entry.submission, methods=['email', 'sms'])
+
+    @patch('intake.models.notifications.slack_confirmation_send_failed.send')
+    @patch('intake.models.notifications.slack_confirmation_sent.send')
+    @patch('intake.models.notifications.sms_confirmation.send')
+    @patch('intake.models.notifications.email_confirmation.send')
+    def test_notification_outbox_retries_front_outages(self, email_notification,
+            sms_notification, sent_notification, failed_notification):
+        outbox = models.NotificationOutboxEntry
+        submission = mock.FormSubmissionFactory.create()
+        submission.answers['contact_preferences'] = ['prefers_email', 'prefers_sms']
+        submission.answers['email'] = 'someone@gmail.com'
+        submission.answers['phone_number'] = '+19993334444'
+        submission.save()
+        entry = outbox.add_confirmations(submission)
+
+        # front being down is retried, rather than reported as a failure
+        sms_notification.side_effect = notifications.FrontAPIError(
+            'unavailable', status_code=503)
+        outbox.send_pending()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, outbox.PENDING)
+        failed_notification.assert_not_called()
+
+        # but a message that front won't send is a failure
+        sms_error = notifications.FrontAPIError('bad number', status_code=400)
+        sms_notification.side_effect = sms_error
+        outbox.objects.update(next_attempt=entry.created)
+        outbox.send_pending()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, outbox.SENT)
+        self.assertEqual(email_notification.call_count, 1)
+        failed_notification.assert_called_once_with(
+            submission=entry.submission, errors={'sms': sms_error})
+
+    def test_queued_confirmation_flash_messages(self):
+        submission = mock.FormSubmissionFactory.create()
+        contact_info = {'email': 'someone@gmail.com', 'sms': '+19993334444'}
+        self.assertListEqual(
+            submission.confirmation_flash_messages(
+                ['email', 'sms'], contact_info, queued=True),
+            ["We will send you an email at someone@gmail.com",
+             "We will send you a text message at +19993334444"])
+
+    @override_settings(SLACK_DIGESTS=True, SLACK_DIGEST_WINDOW=60,
+        SLACK_DIGEST_MAX_EVENTS=3)
+    @patch('intake.notifications.slack_digest_rate_limiter')
+    @patch('intake.notifications.httpclient.post')
+    def test_slack_digests(self, slack_post, rate_limiter):
+        digests = models.SlackDigestEvent
+        user = self.agency_users[0]
+        submissions = mock.FormSubmissionFactory.create_batch(2)
+        notifications.slack_submissions_viewed.send(
+            submissions=submissions[:1], user=user)
+        notifications.slack_submissions_viewed.send(
+            submissions=submissions, user=user)
+        notifications.slack_submissions_processed.send(
+            submissions=submissions[:1], user=user)
+        slack_post.assert_not_called()
+        self.assertEqual(digests.objects.count(), 3)
+        self.assertListEqual(digests.send_due(), [])
+
+        # once the window has passed, each action is sent as one message
+        # and submissions are only mentioned once
+        later = digests.objects.first().created + timedelta(seconds=61)
+        self.assertEqual(len(digests.send_due(now=later)), 2)
+        self.assertEqual(slack_post.call_count, 2)
+        self.assertEqual(rate_limiter.wait.call_count, 2)
+        texts = [
+            json.loads(kwargs['data'])['text']
+            for args, kwargs in slack_post.call_args_list]
+        self.assertIn('{} opened apps from'.format(user.email), texts[0])
+        self.assertIn(
+            '?ids={},{}|'.format(*[s.id for s in submissions]), texts[0])
+        self.assertIn('{} processed <'.format(user.email), texts[1])
+        self.assertEqual(digests.objects.count(), 0)
+
+        # enough events are sent without waiting, even once the
+        # submissions they were about are gone
+        slack_post.reset_mock()
+        for submission in submissions:
+            submission.delete()
+            notifications.slack_submissions_deleted.send(
+                submissions=[submission], user=user)
+        self.assertListEqual(digests.send_due(), [])
+        notifications.slack_submissions_deleted.send(
+            submissions=[mock.FormSubmissionFactory.create()], user=user)
+        # a digest that can't be sent is kept, and retried with backoff
+        slack_post.side_effect = ConnectionError('slack is down')
+        now = timezone_utils.now()
+        self.assertListEqual(digests.send_due(now=now), [])
+        self.assertEqual(digests.objects.count(), 3)
+        self.assertListEqual(digests.get_due_groups(now=now), [])
+        self.assertListEqual(
+            digests.get_due_groups(now=now + timedelta(seconds=29)), [])
+        self.assertListEqual(
+            digests.send_due(now=now + timedelta(seconds=31)), [])
+        self.assertListEqual(
+            digests.get_due_groups(now=now + timedelta(seconds=61)), [])
+        slack_post.side_effect = None
+        self.assertEqual(
+            len(digests.send_due(now=now + timedelta(seconds=92))), 1)
+        self.assertEqual(digests.objects.count(), 0)
+        self.assertIn('deleted apps from',
+            json.loads(slack_post.call_args[1]['data'])['text'])
+
+    @override_settings(SLACK_DIGEST_WINDOW=60, SLACK_DIGEST_MAX_EVENTS=2,
+        SLACK_DIGEST_MAX_GROUPS=1)
+    def test_slack_digest_groups_are_bounded(self):
+        digests = models.SlackDigestEvent
+        submission = mock.FormSubmissionFactory.create()
+        for user in self.agency_users[:2]:
+            for i in range(3):
+                digests.add('submissions_viewed', [submission], user)
+        groups = digests.get_due_groups()
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(len(groups[0]), 2)
+        self.assertEqual(groups[0][0].user, self.agency_users[0])
+
+
 
 
 
@@ -36,7 +36,7 @@ class TestNotifications(TestCase):
         email = mail.outbox[0]
         self.assertEqual(email.subject, "Hello Ben")
 
-    @patch('intake.notifications.requests.post')
+    @patch('intake.notifications.httpclient.post')
     @patch('intake.notifications.loader.get_template')
     @override_settings(FRONT_API_TOKEN='mytoken', ADMIN_PHONE_NUMBER='+19993336666')
     def test_front_notifications(self, get_template, mock_post):
@@ -173,7 +173,7 @@ They want to be contacted via text message and email
             ).message
         self.assertEqual(deleted, expected_submission_deleted_text)
 
-    @patch('intake.notifications.requests.post')
+    @patch('intake.notifications.httpclient.post')
     def test_slack_simple(self, mock_post):
         mock_post.return_value = "HTTP response"
         expected_json = '{"text": "Hello slack <&>"}'
@@ -185,7 +185,7 @@ They want to be contacted via text message and email
         self.assertDictEqual(
             called_kwargs['headers'], expected_headers)
 
-    @patch('intake.notifications.requests.post')
+    @patch('intake.notifications.httpclient.post')
     def test_slack_send(self, mock_post):
         mock_post.return_value = "HTTP response"
         expected_json = '{"text": "New submission #101!\\n<http://filled_pdf/|Shining Koala>\\nThey want to be contacted via text message and email\\n"}'
@@ -201,6 +201,29 @@ They want to be contacted via text message and email
         self.assertDictEqual(
             called_kwargs['headers'], expected_headers)
     
+    @override_settings(SLACK_DIGESTS=False)
+    @patch('intake.notifications.httpclient.post')
+    def test_slack_digest_sent_now_without_digests(self, mock_post):
+        notifications.slack_submissions_deleted.send(
+            submissions=[self.sub], user=self.user)
+        called_args, called_kwargs = mock_post.call_args
+        text = json.loads(called_kwargs['data'])['text']
+        self.assertTrue(text.startswith("staff@org.org deleted <"))
+        self.assertIn("?ids=2|Shining Koala's application>", text)
+
+    def test_rate_limiter(self):
+        times = [100.0]
+        sleep = Mock(side_effect=lambda delay: times.append(times[-1] + delay))
+        limiter = notifications.RateLimiter(
+            1, sleep=sleep, clock=lambda: times[-1])
+        limiter.wait()
+        sleep.assert_not_called()
+        limiter.wait()
+        sleep.assert_called_once_with(1.0)
+        times.append(times[-1] + 5)
+        limiter.wait()
+        self.assertEqual(sleep.call_count, 1)
+
     @override_settings(DEFAULT_HOST='something.com')
     def test_render_front_email_daily_app_bundle(self):
         expected_subject = "current time: Online applications to Clean Slate"
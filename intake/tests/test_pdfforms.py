@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+from unittest import TestCase, skipIf
+
+from PyPDF2.utils import PdfReadError
+
+from intake import pdfforms, pdfparser
+
+
+SAMPLE_PDF_PATH = 'tests/sample_pdfs/sample_form.pdf'
+# a combo box with options, and a list box with export values and labels
+CHOICE_PDF_PATH = 'tests/sample_pdfs/choice_form.pdf'
+PDFPARSER_PATH = 'intake/pdfparser.jar'
+
+ANSWERS = {
+    'Given Name Text Box': 'Ziggy (Z) Stardust',
+    'Address 1 Text Box': '1 Main St',
+    'Driving License Check Box': 'Yes',
+    'Language 2 Check Box': 'Off',
+}
+
+
+def get_drawn_text(data):
+    """Returns the decoded contents of each page and form xobject"""
+    contents = []
+    for page in pdfforms.read_pdf(data).pages:
+        page_contents = page['/Contents'].getObject()
+        if not isinstance(page_contents, list):
+            page_contents = [page_contents]
+        for stream in page_contents:
+            contents.append(stream.getObject().getData())
+        resources = page['/Resources'].getObject()
+        for xobject in resources['/XObject'].getObject().values():
+            xobject = xobject.getObject()
+            if xobject.get('/Subtype') == '/Form':
+                contents.append(xobject.getData())
+    return b'\n'.join(contents)
+
+
+def get_catalog(data):
+    return pdfforms.get_catalog(pdfforms.read_pdf(data))
+
+
+def get_pages(data):
+    return pdfforms.read_pdf(data).pages
+
+
+class TestPythonPDFParser(TestCase):
+
+    def setUp(self):
+        self.parser = pdfforms.PythonPDFParser()
+        with open(SAMPLE_PDF_PATH, 'rb') as sample:
+            self.sample = sample.read()
+
+    def test_get_field_data(self):
+        fields = {
+            field['name']: field
+            for field in self.parser.get_field_data(self.sample)['fields']}
+        self.assertEqual(len(fields), 14)
+        self.assertEqual(fields['Given Name Text Box']['type'], 'text')
+        self.assertEqual(fields['Height Formatted Field']['value'], '150')
+        checkbox = fields['Driving License Check Box']
+        self.assertEqual(checkbox['type'], 'checkbox')
+        self.assertListEqual(checkbox['options'], ['Off', 'Yes'])
+        self.assertEqual(checkbox['positions'][0]['page'], 1)
+
+    def test_fill_pdf_flattens_form(self):
+        result = self.parser.fill_pdf(self.sample, ANSWERS)
+        self.assertNotIn('/AcroForm', get_catalog(result))
+        self.assertEqual(len(get_pages(result)), 1)
+        self.assertNotIn('/Annots', get_pages(result)[0])
+        text = get_drawn_text(result)
+        self.assertIn(b'(Ziggy \\(Z\\) Stardust) Tj', text)
+        self.assertIn(b'(1 Main St) Tj', text)
+        self.assertListEqual(
+            self.parser.get_field_data(result)['fields'], [])
+
+    def test_checkbox_states(self):
+        filler = pdfforms.FormFiller(pdfforms.read_pdf(self.sample))
+        filler.set_values({
+            'Driving License Check Box': 'Yes',
+            'Language 2 Check Box': 'not a state'})
+        for name, state in [('Driving License Check Box', '/Yes'),
+                            ('Language 2 Check Box', '/Off')]:
+            ref, widget = filler.fields[name].widgets[0]
+            self.assertEqual(ref.getObject()['/AS'], state)
+
+    def test_join_pdfs(self):
+        filled = self.parser.fill_pdf(self.sample, ANSWERS)
+        joined = self.parser.join_pdfs([filled, filled, self.sample])
+        self.assertEqual(len(get_pages(joined)), 3)
+        optimized = self.parser.join_pdfs(
+            [filled, filled, self.sample], optimize=True)
+        self.assertEqual(len(get_pages(optimized)), 3)
+        self.assertLess(len(optimized), len(joined))
+        self.assertNotIn('/Annots', get_pages(optimized)[2])
+
+    def test_fill_many_pdfs(self):
+        answers = [dict(ANSWERS, **{'Given Name Text Box': str(i)})
+                   for i in range(3)]
+        result = self.parser.fill_many_pdfs(self.sample, answers)
+        self.assertEqual(len(get_pages(result)), 3)
+        text = get_drawn_text(result)
+        for i in range(3):
+            self.assertIn('({}) Tj'.format(i).encode('ascii'), text)
+
+    def test_choice_fields(self):
+        with open(CHOICE_PDF_PATH, 'rb') as choice_pdf:
+            choice_pdf = choice_pdf.read()
+        fields = {
+            field['name']: field
+            for field in self.parser.get_field_data(choice_pdf)['fields']}
+        combo = fields['Colour Combo Box']
+        self.assertEqual(combo['type'], 'combo box')
+        self.assertEqual(combo['value'], 'Red')
+        self.assertListEqual(combo['options'], ['Red', 'Green', 'Blue'])
+        listbox = fields['Size List Box']
+        self.assertEqual(listbox['type'], 'listbox')
+        self.assertListEqual(listbox['options'], ['s', 'l'])
+
+        result = self.parser.fill_pdf(choice_pdf, {
+            'Colour Combo Box': 'Blue', 'Size List Box': 'l'})
+        self.assertNotIn('/AcroForm', get_catalog(result))
+        text = get_drawn_text(result)
+        self.assertIn(b'(Blue) Tj', text)
+        # list boxes show the label of the chosen export value
+        self.assertIn(b'(Large) Tj', text)
+
+    def test_text_that_cannot_be_shown_is_replaced(self):
+        # latin text outside ascii can be drawn
+        result = self.parser.fill_pdf(
+            self.sample, {'Given Name Text Box': 'Zoë'})
+        self.assertIn('(Zo\xeb) Tj'.encode('latin-1'), get_drawn_text(result))
+        with self.assertLogs('intake.pdfforms', 'WARNING') as logs:
+            result = self.parser.fill_pdf(self.sample, {
+                'Given Name Text Box': 'Ziggy Ştardust 星'})
+        self.assertIn(b'(Ziggy Stardust ?) Tj', get_drawn_text(result))
+        self.assertIn('Given Name Text Box', logs.output[0])
+        self.assertNotIn('Ziggy', logs.output[0])
+
+    def test_errors_are_raised_as_parser_errors(self):
+        with self.assertRaises(pdfparser.PDFParserError):
+            self.parser.fill_pdf(b'not a pdf', ANSWERS,
+                                 field_data={'fields': []})
+        with self.assertRaises(PdfReadError):
+            pdfforms.read_pdf(b'not a pdf')
+
+
+# CI installs java, so that the backends are always compared there
+@skipIf(not shutil.which('java') and not os.environ.get('CI'),
+        "java is needed to compare with the jar")
+class TestPythonParserMatchesJar(TestCase):
+
+    def setUp(self):
+        self.jar = pdfparser.PDFParser()
+        self.jar.PDFPARSER_PATH = PDFPARSER_PATH
+        self.python = pdfforms.PythonPDFParser()
+        with open(SAMPLE_PDF_PATH, 'rb') as sample:
+            self.sample = sample.read()
+
+    def summarize(self, field_data):
+        return sorted(
+            (field['name'], field['type'], field['value'],
+             sorted(field['options'] or []))
+            for field in field_data['fields'])
+
+    def test_fields_match(self):
+        self.assertListEqual(
+            self.summarize(self.python.get_field_data(self.sample)),
+            self.summarize(self.jar.get_field_data(self.sample)))
+
+    def test_filled_pdfs_match(self):
+        field_data = self.jar.get_field_data(self.sample)
+        for parser in (self.jar, self.python):
+            result = parser.fill_pdf(self.sample, ANSWERS,
+                                     field_data=field_data)
+            self.assertNotIn('/AcroForm', get_catalog(result))
+            self.assertEqual(len(get_pages(result)), 1)
+            self.assertEqual(
+                json.dumps(self.jar.get_field_data(result)['fields']), '[]')
@@ -0,0 +1,274 @@
+import sys
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock, PropertyMock, patch
+
+from intake import pdfparser, pdftiming, pdfworkers
+
+
+FAKE_WORKER_SCRIPT = r'''
+import sys, json, time
+for line in sys.stdin.buffer:
+    args = json.loads(line.decode('utf-8'))
+    out, err = b'', b''
+    if args == ['ping']:
+        out = b'pong'
+    elif args[0] == 'sleep':
+        time.sleep(float(args[1]))
+    elif args[0] == 'crash':
+        sys.exit(1)
+    elif args[0] == 'fail':
+        err = b'something went wrong'
+    else:
+        out = json.dumps(args).encode('utf-8')
+    sys.stdout.buffer.write(
+        'RESULT {} {}\n'.format(len(out), len(err)).encode('utf-8'))
+    sys.stdout.buffer.write(out + err)
+    sys.stdout.buffer.flush()
+'''
+
+
+class FakeWorker(pdfworkers.PDFWorker):
+
+    def build_command(self):
+        return [sys.executable, '-c', FAKE_WORKER_SCRIPT]
+
+
+class TestPDFWorkers(TestCase):
+
+    def setUp(self):
+        self.pool = pdfworkers.PDFWorkerPool(
+            'pdfparser.jar', size=2, timeout=5, worker_class=FakeWorker)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_worker_pool_reuses_processes(self):
+        out, err = self.pool.run(['get_fields', 'a.pdf'])
+        self.assertEqual(out, b'["get_fields", "a.pdf"]')
+        self.assertEqual(err, b'')
+        self.pool.run(['get_fields', 'a.pdf'])
+        pids = {w.process.pid for w in self.pool.workers if w.process}
+        for i in range(4):
+            self.pool.run(['get_fields', 'a.pdf'])
+        self.assertSetEqual(
+            pids, {w.process.pid for w in self.pool.workers if w.process})
+
+    def test_worker_pool_restarts_crashed_worker(self):
+        with self.assertRaises(pdfparser.PDFParserError):
+            self.pool.run(['crash'])
+        out, err = self.pool.run(['get_fields', 'a.pdf'])
+        self.assertEqual(out, b'["get_fields", "a.pdf"]')
+
+    def test_worker_pool_times_out(self):
+        self.pool.timeout = 0.5
+        with self.assertRaises(pdfworkers.PDFWorkerTimeout):
+            self.pool.run(['sleep', '2'])
+        out, err = self.pool.run(['ping'])
+        self.assertEqual(out, b'pong')
+
+    def test_worker_pool_health_check(self):
+        self.pool.run(['ping'])
+        self.assertEqual(self.pool.check_health(), 0)
+        for worker in self.pool.workers:
+            worker.stop()
+        self.assertEqual(self.pool.check_health(), 0)
+        self.assertTrue(all(w.is_alive() for w in self.pool.workers))
+
+    def test_workers_run_the_compiled_extensions(self):
+        worker = pdfworkers.PDFWorker('pdfparser.jar', class_dir='classes')
+        self.assertListEqual(worker.build_command(), [
+            'java', '-cp', 'pdfparser.jar' + os.pathsep + 'classes',
+            'PdfParserWorker'])
+
+    def test_parser_uses_worker_pool(self):
+        parser = pdfparser.PDFParser(worker_pool=self.pool)
+        self.assertEqual(
+            parser.run_command(['get_fields', 'a.pdf']),
+            '["get_fields", "a.pdf"]')
+        with self.assertRaises(pdfparser.PDFParserError):
+            parser.run_command(['fail'])
+
+    def test_worker_pool_commands_record_status(self):
+        timer = pdftiming.Timer(sinks=[])
+        parser = pdfparser.PDFParser(worker_pool=self.pool, timer=timer)
+        with timer.collect() as collector:
+            parser.run_command(['get_fields', 'a.pdf'])
+            with self.assertRaises(pdfparser.PDFParserError):
+                parser.run_command(['fail'])
+            with self.assertRaises(pdfparser.PDFParserError):
+                parser.run_command(['crash'])
+        self.assertListEqual(
+            [span.status for span in collector.spans], [0, 1, 'error'])
+
+    @patch('intake.pdfparser.subprocess.Popen')
+    def test_parser_defaults_to_subprocess(self, Popen):
+        Popen.return_value.communicate.return_value = (b'{}', b'')
+        parser = pdfparser.PDFParser()
+        parser.PDFPARSER_PATH = 'pdfparser.jar'
+        self.assertEqual(parser.run_command(['get_fields', 'a.pdf']), '{}')
+        args, kwargs = Popen.call_args
+        self.assertListEqual(
+            args[0], ['java', '-jar', 'pdfparser.jar', 'get_fields', 'a.pdf'])
+
+
+class TestFillManyPDFs(TestCase):
+
+    def setUp(self):
+        self.parser = pdfparser.PDFParser(max_fill_workers=4)
+        self.field_data = {'fields': [{'name': 'Name'}]}
+        self.commands = []
+
+        def run_command(args):
+            self.commands.append(args)
+            if args[0] == 'set_fields':
+                name = json.loads(args[3])['fields'][0]['Name']
+                if name == 'broken':
+                    raise pdfparser.PDFParserError('bad pdf')
+                with open(args[2], 'w') as output:
+                    output.write(name)
+            elif args[0] == 'concat_files':
+                with open(args[-1], 'w') as output:
+                    for path in args[1:-1]:
+                        output.write(open(path).read())
+            return ''
+        self.parser.run_command = run_command
+
+    def test_output_order_matches_input(self):
+        names = [str(i) for i in range(20)]
+        result = self.parser.fill_many_pdfs(
+            b'template', [{'Name': n} for n in names],
+            field_data=self.field_data)
+        self.assertEqual(result, ''.join(names).encode('utf-8'))
+        self.assertListEqual(self.parser._tmp_files, [])
+
+    def test_output_order_matches_input_in_memory(self):
+        self.parser.in_memory = True
+        self.test_output_order_matches_input()
+        self.assertDictEqual(self.parser._tmp_fds, {})
+
+    def test_failed_fill_is_identified_and_cleaned_up(self):
+        answers = [{'Name': 'a'}, {'Name': 'broken'}, {'Name': 'c'}]
+        with self.assertRaises(pdfparser.PDFFillError) as context:
+            self.parser.fill_many_pdfs(
+                b'template', answers, field_data=self.field_data,
+                labels=['submission 1', 'submission 2', 'submission 3'])
+        self.assertEqual(context.exception.index, 1)
+        self.assertEqual(context.exception.label, 'submission 2')
+        self.assertIn('submission 2', str(context.exception))
+        self.assertListEqual(self.parser._tmp_files, [])
+        self.assertTrue(self.parser.clean_up)
+
+
+class TestPDFParserFiles(TestCase):
+
+    def test_in_memory_files_are_not_written_to_disk(self):
+        tmp_dir = tempfile.mkdtemp()
+        with pdfparser.PDFParser(tmp_path=tmp_dir, in_memory=True) as parser:
+            path = parser._coerce_to_file_path(b'%PDF-1.4 fake')
+            self.assertEqual(parser._get_file_contents(path), b'%PDF-1.4 fake')
+            self.assertFalse(path.startswith(tmp_dir))
+            self.assertListEqual(os.listdir(tmp_dir), [])
+        self.assertDictEqual(parser._tmp_fds, {})
+        self.assertListEqual(parser._tmp_files, [])
+        os.rmdir(tmp_dir)
+
+    def test_context_manager_cleans_up_after_errors(self):
+        parser = pdfparser.PDFParser()
+        with self.assertRaises(pdfparser.PDFParserError):
+            with parser:
+                path = parser._write_tmp_file(bytestring=b'contents')
+                raise pdfparser.PDFParserError('failed')
+        self.assertFalse(os.path.exists(path))
+        self.assertListEqual(parser._tmp_files, [])
+
+    def test_local_files_are_not_copied(self):
+        local_file = Mock(path=os.path.abspath(__file__))
+        remote_file = Mock(**{'read.return_value': b'contents'})
+        type(remote_file).path = PropertyMock(side_effect=NotImplementedError)
+        with pdfparser.PDFParser() as parser:
+            self.assertEqual(
+                parser._coerce_to_file_path(local_file), local_file.path)
+            self.assertListEqual(parser._tmp_files, [])
+            path = parser._coerce_to_file_path(remote_file)
+            self.assertEqual(parser._get_file_contents(path), b'contents')
+
+
+class TestJoinPDFs(TestCase):
+
+    @patch('intake.pdfparser.subprocess.Popen')
+    def test_optimized_join(self, Popen):
+        def communicate():
+            args = Popen.call_args[0][0]
+            with open(args[-1], 'wb') as output:
+                output.write(b'12345')
+            return b'', b''
+        Popen.return_value.communicate.side_effect = communicate
+        parser = pdfparser.PDFParser(optimize_joins=True)
+        parser.PDFPARSER_PATH = 'pdfparser.jar'
+        result = parser.join_pdfs([b'1234567890', b'1234567890'])
+        self.assertEqual(result, b'12345')
+        args = Popen.call_args[0][0]
+        self.assertListEqual(args[:5], [
+            'java', '-cp',
+            'pdfparser.jar' + os.pathsep + pdfparser.EXTENSIONS_CLASS_DIR,
+            'PdfParserWorker', 'concat_optimized'])
+        self.assertDictEqual(parser.last_join_stats, {
+            'files': 2, 'optimized': True,
+            'input_bytes': 20, 'output_bytes': 5})
+
+        parser.join_pdfs([b'1234567890'], optimize=False)
+        args = Popen.call_args[0][0]
+        self.assertListEqual(args[:4], [
+            'java', '-jar', 'pdfparser.jar', 'concat_files'])
+
+
+class TestPDFTiming(TestCase):
+
+    def setUp(self):
+        self.timer = pdftiming.Timer(sinks=[])
+        self.parser = pdfparser.PDFParser(timer=self.timer)
+
+        def run(args, span=None):
+            if args[0] == 'set_fields':
+                with open(args[2], 'wb') as output:
+                    output.write(b'filled')
+            if span:
+                span.status = 0
+            return b'', b''
+        self.parser._run = run
+
+    def test_fill_pdf_phases(self):
+        with self.timer.collect() as collector:
+            result = self.parser.fill_pdf(
+                b'template', {'Name': 'a'},
+                field_data={'fields': [{'name': 'Name'}]})
+        self.assertEqual(result, b'filled')
+        self.assertListEqual(collector.get_phases(), [
+            'write_tmp_file', 'set_fields', 'read_output', 'fill_pdf'])
+        set_fields = collector.spans[1]
+        self.assertEqual(set_fields.bytes_in, len(b'template'))
+        self.assertEqual(set_fields.bytes_out, len(b'filled'))
+        self.assertEqual(set_fields.status, 0)
+        self.assertGreaterEqual(set_fields.duration, 0)
+
+    def test_failed_phases_are_recorded(self):
+        self.parser._run = Mock(return_value=(b'', b'bad pdf'))
+        with self.timer.collect() as collector:
+            with self.assertRaises(pdfparser.PDFParserError):
+                self.parser.join_pdfs([b'a', b'b'])
+        breakdown = dict(collector.get_breakdown())
+        self.assertEqual(breakdown['write_tmp_file']['count'], 2)
+        self.assertEqual(breakdown['concat_files']['errors'], 1)
+        self.assertEqual(breakdown['join_pdfs']['errors'], 1)
+        self.assertListEqual(self.timer.sinks, [])
+
+    def test_logging_sink(self):
+        sink = pdftiming.LoggingSink(logger=Mock())
+        with pdftiming.Timer(sinks=[sink]).span('get_fields', bytes_in=5):
+            pass
+        args, kwargs = sink.logger.log.call_args
+        self.assertEqual(kwargs['extra']['pdf_span']['phase'], 'get_fields')
+        self.assertEqual(kwargs['extra']['pdf_span']['bytes_in'], 5)
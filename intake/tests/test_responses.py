@@ -0,0 +1,90 @@
+import io
+from datetime import datetime, timezone
+from unittest.mock import Mock
+from django.test import TestCase, RequestFactory
+
+from intake import responses
+
+
+class TestResponses(TestCase):
+
+    def test_parse_range_header(self):
+        cases = {
+            '': None,
+            'bytes=0-99': (0, 99),
+            'bytes=100-': (100, 999),
+            'bytes=-100': (900, 999),
+            'bytes=900-5000': (900, 999),
+            'bytes=0-1,5-6': None,
+            'pages=1-2': None,
+        }
+        for header, expected in cases.items():
+            self.assertEqual(
+                responses.parse_range_header(header, 1000), expected)
+        for header in ['bytes=1000-', 'bytes=50-10']:
+            with self.assertRaises(ValueError):
+                responses.parse_range_header(header, 1000)
+
+    def test_file_response_streams_ranges(self):
+        content = bytes(range(256)) * 4
+        on_close = Mock()
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=10-19')
+        response = responses.file_response(
+            request, io.BytesIO(content), len(content), on_close=on_close)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+        response.close()
+        on_close.assert_called_once_with()
+
+        request = RequestFactory().get('/')
+        response = responses.file_response(
+            request, io.BytesIO(content), len(content))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '1024')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), content)
+
+    def test_file_response_rejects_unsatisfiable_range(self):
+        on_close = Mock()
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=2000-')
+        response = responses.file_response(
+            request, io.BytesIO(b'pdf'), 3, on_close=on_close)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */3')
+        on_close.assert_called_once_with()
+
+    def test_conditional_requests(self):
+        factory = RequestFactory()
+        modified = datetime(2016, 5, 1, 12, 0, 30, tzinfo=timezone.utc)
+        cases = [
+            ({}, False),
+            ({'HTTP_IF_NONE_MATCH': '"abc"'}, True),
+            ({'HTTP_IF_NONE_MATCH': 'W/"xyz", "abc"'}, True),
+            ({'HTTP_IF_NONE_MATCH': '*'}, True),
+            ({'HTTP_IF_NONE_MATCH': '"xyz"'}, False),
+            ({'HTTP_IF_MODIFIED_SINCE': 'Sun, 01 May 2016 12:00:30 GMT'},
+             True),
+            ({'HTTP_IF_MODIFIED_SINCE': 'Sun, 01 May 2016 12:00:00 GMT'},
+             False),
+            ({'HTTP_IF_MODIFIED_SINCE': 'not a date'}, False),
+            # If-None-Match takes precedence over If-Modified-Since
+            ({'HTTP_IF_NONE_MATCH': '"xyz"',
+              'HTTP_IF_MODIFIED_SINCE': 'Sun, 01 May 2016 12:00:30 GMT'},
+             False),
+        ]
+        for headers, expected in cases:
+            self.assertEqual(
+                responses.is_not_modified(
+                    factory.get('/', **headers), 'abc', modified),
+                expected, headers)
+        self.assertFalse(responses.is_not_modified(
+            factory.post('/', HTTP_IF_NONE_MATCH='"abc"'), 'abc', modified))
+
+        response = responses.not_modified_response('abc', modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"abc"')
+        self.assertEqual(
+            response['Last-Modified'], 'Sun, 01 May 2016 12:00:30 GMT')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
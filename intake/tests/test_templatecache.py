@@ -0,0 +1,44 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock
+
+from intake import templatecache
+
+
+class TestLocalFileCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = templatecache.LocalFileCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_files_are_only_fetched_once(self):
+        opener = Mock(return_value=io.BytesIO(b'%PDF template'))
+        path = self.cache.get_path('pdfs/template.pdf:2016-07-01', opener)
+        self.assertEqual(
+            self.cache.get_path('pdfs/template.pdf:2016-07-01', opener), path)
+        opener.assert_called_once_with()
+        with open(path, 'rb') as cached:
+            self.assertEqual(cached.read(), b'%PDF template')
+
+        # a new key means a new copy
+        new_path = self.cache.get_path(
+            'pdfs/template.pdf:2016-08-01', io.BytesIO(b'%PDF new'))
+        self.assertNotEqual(new_path, path)
+
+    def test_least_recently_used_files_are_evicted(self):
+        self.cache.max_bytes = 25
+        first = self.cache.get_path('a', io.BytesIO(b'x' * 10))
+        second = self.cache.get_path('b', io.BytesIO(b'x' * 10))
+        os.utime(first, (0, 0))
+        os.utime(second, (1, 1))
+        self.cache.get_path('a', None)  # using 'a' again marks it as recent
+        third = self.cache.get_path('c', io.BytesIO(b'x' * 10))
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(os.path.exists(third))
@@ -18,6 +18,19 @@ class TestTranslators(TestCase):
         self.assertDictEqual(new_results, expected)
 
 
+    def test_clean_slate_does_not_change_answers(self):
+        old, new = pdf_fillable_models()
+        answers = dict(new.answers)
+        from intake.translators import clean_slate
+        clean_slate.translator(new)
+        self.assertDictEqual(new.answers, answers)
+
+    def test_translate_many(self):
+        old, new = pdf_fillable_models()
+        from intake.translators import clean_slate
+        results = clean_slate.translator.translate_many([old, new, old])
+        self.assertListEqual(results, [PDF_FILLABLE_DATA] * 3)
+
     def test_yes_no_radio_field(self):
         yes_inputs = [
             'yes', 'Yes', 'YES',
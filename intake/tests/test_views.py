@@ -1,3 +1,6 @@
+import io
+import json
+import zipfile
 from unittest import skipIf
 from unittest.mock import patch, Mock
 import inspect
@@ -7,7 +10,7 @@ from django.core.urlresolvers import reverse
 from django.utils import html as html_utils
 
 from intake.tests import mock
-from intake import models, forms, views
+from intake import admission, circuitbreaker, exports, models, forms, views
 
 from project.jinja2 import url_with_ids
 
@@ -82,6 +85,7 @@ class TestViews(AuthIntegrationTestCase):
             self.assertContains(response, str(total))
             self.assertContains(response, str(total - 1))
 
+    @override_settings(NOTIFICATION_OUTBOX=True)
     @patch('intake.views.models.FormSubmission.send_confirmation_notifications')
     @patch('intake.views.notifications.slack_new_submission.send')
     def test_anonymous_user_can_fill_out_app_and_reach_thanks_page(self, slack, send_confirmation):
@@ -104,13 +108,46 @@ class TestViews(AuthIntegrationTestCase):
             reverse('intake-thanks'))
         thanks_page = self.client.get(result.url)
         self.assertContains(thanks_page, "Thank")
+        # notifications are queued, and sent by the outbox worker
+        slack.assert_not_called()
+        send_confirmation.assert_not_called()
+        entries = models.NotificationOutboxEntry.objects.all()
+        self.assertEqual(entries.count(), 2)
+        models.NotificationOutboxEntry.send_pending()
         self.assert_called_once_with_types(
             slack,
             submission='FormSubmission',
-            request='WSGIRequest',
+            pdf_url='str',
             submission_count='int')
-        send_confirmation.assert_called_once_with()
+        send_confirmation.assert_called_once_with(
+            staff_name=entries.get(task='confirmations').payload['staff_name'],
+            exclude=set(), raise_outages=True)
+        self.assertEqual(
+            entries.filter(status=models.NotificationOutboxEntry.SENT).count(), 2)
 
+    @patch('intake.views.messages.success')
+    @patch('intake.views.models.FormSubmission.send_confirmation_notifications')
+    def test_confirmations_queued_while_front_is_down(self, send_confirmation, flash):
+        submission = mock.FormSubmissionFactory.create(answers={
+            'email': 'someone@gmail.com',
+            'phone_number': '+19993334444',
+            'contact_preferences': ['prefers_email', 'prefers_sms']})
+
+        def email_sent_before_sms_breaker_opened(**kwargs):
+            models.ApplicationLogEntry.log_confirmations_sent(
+                submission.id, [({'email': 'someone@gmail.com'}, 'email')])
+            raise circuitbreaker.CircuitOpenError('front-sms', 20)
+        send_confirmation.side_effect = email_sent_before_sms_breaker_opened
+        view = views.MultiStepApplicationView(request=Mock())
+        view.confirmation(submission)
+        self.assertListEqual(
+            [args[1] for args, kwargs in flash.call_args_list],
+            ["We've sent you an email at someone@gmail.com",
+             "We will send you a text message at +19993334444"])
+        self.assertTrue(models.NotificationOutboxEntry.objects.filter(
+            task='confirmations').exists())
+
+    @override_settings(NOTIFICATION_OUTBOX=False)
     @patch('intake.views.models.FormSubmission.send_confirmation_notifications')
     @patch('intake.views.notifications.slack_new_submission.send')
     def test_apply_with_name_only(self, slack, send_confirmation):
@@ -172,6 +209,53 @@ class TestViews(AuthIntegrationTestCase):
             submissions='list',
             user='User')
 
+    @patch('intake.models.notifications.slack_submissions_viewed.send')
+    def test_filled_pdf_can_be_revalidated(self, slack):
+        self.be_non_agency_user()
+        submission = self.submissions[0]
+        url = reverse('intake-filled_pdf',
+            kwargs=dict(submission_id=submission.id))
+        pdf = self.client.get(url)
+        self.assertEqual(pdf['Cache-Control'], 'private, no-cache')
+        self.assertNotIn('Last-Modified', pdf)
+        opened = models.ApplicationLogEntry.objects.filter(
+            submission=submission, event_type=models.ApplicationLogEntry.OPENED)
+        self.assertEqual(opened.count(), 1)
+
+        with patch('intake.models.FillablePDF.fill_cached') as fill_cached:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=pdf['ETag'])
+            fill_cached.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], pdf['ETag'])
+        # the open is logged, but only the first one is sent to slack
+        self.assertEqual(opened.count(), 2)
+        self.assertEqual(slack.call_count, 1)
+
+        # dates don't change with the answers or template, so they
+        # can't be used to revalidate
+        response = self.client.get(url,
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+        # changed answers change the ETag
+        changed = models.FormSubmission.objects.get(id=submission.id)
+        changed.answers['first_name'] += 'x'
+        changed.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=pdf['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], pdf['ETag'])
+
+    @patch('intake.models.FillablePDF.fill_cached')
+    def test_filled_pdf_is_unavailable_when_host_is_busy(self, fill_cached):
+        fill_cached.side_effect = admission.AdmissionError(
+            'busy', retry_after=30)
+        self.be_non_agency_user()
+        response = self.client.get(reverse('intake-filled_pdf',
+            kwargs=dict(submission_id=self.submissions[0].id)))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+
     def test_authenticated_user_can_see_list_of_submitted_apps(self):
         self.be_non_agency_user()
         index = self.client.get(reverse('intake-app_index'))
@@ -207,6 +291,53 @@ class TestViews(AuthIntegrationTestCase):
         url = url_with_ids('intake-pdf_bundle', ids)
         bundle = self.client.get(url)
         self.assertEqual(bundle.status_code, 200)
+        content = b''.join(bundle.streaming_content)
+        self.assertEqual(int(bundle['Content-Length']), len(content))
+
+        partial = self.client.get(url, HTTP_RANGE='bytes=0-99')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), content[:100])
+
+    def test_pdf_bundle_can_be_revalidated(self):
+        self.be_non_agency_user()
+        ids = [s.id for s in self.submissions]
+        bundle = self.client.get(url_with_ids('intake-pdf_bundle', ids))
+        b''.join(bundle.streaming_content)
+        etag = bundle['ETag']
+        url = url_with_ids('intake-pdf_bundle', reversed(ids))
+        with patch('intake.models.FillablePDF.open_many_cached') as open_many:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            open_many.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        other = self.client.get(url_with_ids('intake-pdf_bundle', ids[:2]))
+        b''.join(other.streaming_content)
+        self.assertNotEqual(other['ETag'], etag)
+
+    def test_bundle_jobs(self):
+        self.be_non_agency_user()
+        ids = [s.id for s in self.submissions]
+        url = url_with_ids('intake-create_pdf_bundle_job', ids)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], 'pending')
+        self.assertListEqual(job['submission_ids'], sorted(ids))
+
+        # the same ids in a different order reuse the job
+        url = url_with_ids('intake-create_pdf_bundle_job', reversed(ids))
+        self.assertEqual(self.client.post(url).json()['id'], job['id'])
+
+        models.BundleJob.run_pending()
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        pdf = self.client.get(status['pdf_url'])
+        self.assertEqual(pdf.status_code, 200)
+        self.assertTrue(b''.join(pdf.streaming_content).startswith(b'%PDF'))
+
+        # finished jobs are reused while the submissions are unchanged
+        self.assertEqual(self.client.post(url).json()['id'], job['id'])
+        self.submissions[0].save()
+        self.assertNotEqual(self.client.post(url).json()['id'], job['id'])
 
     @patch('intake.models.notifications.slack_submissions_viewed.send')
     def test_authenticated_user_can_see_app_bundle(self, slack):
@@ -220,6 +351,71 @@ class TestViews(AuthIntegrationTestCase):
             submissions='list',
             user='User')
 
+    @override_settings(PDF_BUNDLE_PART_SIZE=3)
+    @patch('intake.models.notifications.slack_submissions_viewed.send')
+    def test_large_app_bundles_are_split_into_parts(self, slack):
+        self.be_non_agency_user()
+        ids = [s.id for s in self.submissions]
+        bundle = self.client.get(url_with_ids('intake-app_bundle', ids))
+        self.assertEqual(bundle.context['part_count'], 2)
+        self.assertEqual(len(bundle.context['part_ids']), 3)
+        # opening the bundle marks every application in it as opened
+        self.assertEqual(len(slack.call_args[1]['submissions']), 4)
+        self.assertEqual(models.ApplicationLogEntry.objects.filter(
+            submission_id__in=ids,
+            event_type=models.ApplicationLogEntry.OPENED).count(), 4)
+        self.assertContains(bundle, url_with_ids('intake-pdf_bundle_zip', ids))
+        last = self.client.get(bundle.context['next_url'])
+        self.assertEqual(last.context['part'], 2)
+        self.assertEqual(len(last.context['part_ids']), 1)
+        self.assertNotIn('next_url', last.context)
+        # and later pages don't log them again
+        self.assertEqual(slack.call_count, 1)
+
+    @override_settings(PDF_BUNDLE_PART_SIZE=3)
+    def test_authenticated_user_can_download_zipped_bundle(self):
+        self.be_non_agency_user()
+        ids = [s.id for s in self.submissions]
+        response = self.client.get(url_with_ids('intake-pdf_bundle_zip', ids))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content)))
+        self.assertListEqual(archive.namelist(), [
+            'applications-1-3.pdf', 'applications-4-4.pdf'])
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b'%PDF'))
+        # every submission's pdf, and the first part, are now cached
+        self.assertEqual(models.FilledPDFCacheEntry.objects.count(), 5)
+
+    @patch('intake.models.notifications.slack_submissions_viewed.send')
+    def test_authenticated_user_can_export_apps(self, slack):
+        self.be_non_agency_user()
+        submission = self.submissions[0]
+        self.fillable.fill_cached(submission)
+        ids = [s.id for s in self.submissions[:2]]
+        response = self.client.get(
+            url_with_ids('intake-export_applications', ids))
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 2)
+        self.assertIn(exports.get_filename(submission), archive.namelist())
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b'%PDF'))
+        self.assertEqual(len(slack.call_args[1]['submissions']), 2)
+
+        date = submission.get_local_date_received('%Y-%m-%d')
+        response = self.client.get(reverse('intake-export_applications'),
+            {'start': date, 'end': date})
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIn(exports.get_filename(submission), archive.namelist())
+
+        response = self.client.get(reverse('intake-export_applications'),
+            {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
     @patch('intake.views.notifications.slack_submissions_deleted.send')
     def test_authenticated_user_can_delete_apps(self, slack):
         self.be_non_agency_user()
@@ -239,6 +435,21 @@ class TestViews(AuthIntegrationTestCase):
             submissions='list',
             user='User')
 
+    @override_settings(SLACK_DIGESTS=True, SLACK_DIGEST_WINDOW=0)
+    @patch('intake.notifications.slack_digest_rate_limiter')
+    @patch('intake.notifications.httpclient.post')
+    def test_deleted_apps_are_named_in_slack_digest(self, slack_post, rate_limiter):
+        self.be_non_agency_user()
+        deleted = self.submissions[-2:]
+        for submission in deleted:
+            self.client.fill_form(reverse('intake-delete_page',
+                kwargs={'submission_id': submission.id}))
+        self.assertEqual(len(models.SlackDigestEvent.send_due()), 1)
+        text = json.loads(slack_post.call_args[1]['data'])['text']
+        self.assertIn('?ids={},{}|'.format(*[s.id for s in deleted]), text)
+        for submission in deleted:
+            self.assertIn(str(submission), text)
+
     @patch('intake.views.MarkProcessed.notification_function')
     def test_agency_user_can_mark_apps_as_processed(self, slack):
         self.be_agency_user()
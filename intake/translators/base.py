@@ -1,3 +1,14 @@
+class AnswersProxy:
+    """Wraps an object to replace its `answers` without changing
+    the object itself. Any other attribute is read from the wrapped object
+    """
+
+    def __init__(self, data, answers):
+        self._data = data
+        self.answers = answers
+
+    def __getattr__(self, name):
+        return getattr(self._data, name)
 
 
 class FormToPDFTranslator:
@@ -5,6 +16,7 @@ class FormToPDFTranslator:
     def __init__(self, config, att_object_extractor=None):
         self.att_object_extractor = att_object_extractor
         self.config = config
+        self._plan = None
 
     def get_attribute_data(self, data, extractor):
         if self.att_object_extractor:
@@ -13,13 +25,47 @@ class FormToPDFTranslator:
         else:
             return data.get(extractor, '')
 
-
-    def __call__(self, data):
-        result = {}
+    def compile(self):
+        """Splits the config into a plan of `(key, attribute name)` pairs
+        and `(key, function)` pairs, so that the config doesn't need to be
+        inspected again for every item
+        """
+        attributes, functions = [], []
         for key, extractor in self.config.items():
-            if hasattr(extractor, '__call__'):
-                result[key] = extractor(data)
+            if callable(extractor):
+                functions.append((key, extractor))
             else:
-                result[key] = self.get_attribute_data(
-                    data, extractor)
-        return result
\ No newline at end of file
+                attributes.append((key, extractor))
+        return attributes, functions
+
+    def get_plan(self):
+        if self._plan is None:
+            self._plan = self.compile()
+        return self._plan
+
+    def prepare(self, data):
+        """Hook for subclasses to adjust each item before translating it.
+        Should not modify `data`
+        """
+        return data
+
+    def translate(self, data, plan):
+        attributes, functions = plan
+        data = self.prepare(data)
+        if self.att_object_extractor:
+            source = getattr(data, self.att_object_extractor)
+        else:
+            source = data
+        result = {key: source.get(name, '') for key, name in attributes}
+        for key, extractor in functions:
+            result[key] = extractor(data)
+        return result
+
+    def translate_many(self, data_set):
+        """Translates each item in `data_set`, in order
+        """
+        plan = self.get_plan()
+        return [self.translate(data, plan) for data in data_set]
+
+    def __call__(self, data):
+        return self.translate(data, self.get_plan())
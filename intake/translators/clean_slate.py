@@ -1,4 +1,4 @@
-from intake.translators.base import FormToPDFTranslator
+from intake.translators.base import FormToPDFTranslator, AnswersProxy
 
 from project.jinja2 import namify
 
@@ -36,16 +36,21 @@ class ClearMyRecordFormToPDFTranslator(FormToPDFTranslator):
             )
 
     def oldify(self, data):
+        """Returns a copy of `data.answers` with the nested address and
+        dob values flattened into keys such as `address_street`
+        """
+        answers = dict(data.answers)
         for key in ['address', 'dob']:
             data_dict = data.answers.get(key, {})
             for sub, val in data_dict.items():
                 new_key = '_'.join([key, sub])
-                data.answers[new_key] = val
+                answers[new_key] = val
+        return answers
 
-    def __call__(self, data):
+    def prepare(self, data):
         if self.is_new(data):
-            self.oldify(data)
-        return super().__call__(data)
+            return AnswersProxy(data, self.oldify(data))
+        return data
 
 # Places to make this clearer
 # Structure and naming
@@ -28,6 +28,26 @@ urlpatterns = [
         login_required(views.pdf_bundle),
         name='intake-pdf_bundle'),
 
+    url(r'^applications/pdfs/zip/$',
+        login_required(views.pdf_bundle_zip),
+        name='intake-pdf_bundle_zip'),
+
+    url(r'^applications/export/$',
+        login_required(views.export_applications),
+        name='intake-export_applications'),
+
+    url(r'^applications/pdfs/jobs/$',
+        login_required(views.create_bundle_job),
+        name='intake-create_pdf_bundle_job'),
+
+    url(r'^applications/pdfs/jobs/(?P<job_id>[0-9]+)/$',
+        login_required(views.bundle_job_status),
+        name='intake-pdf_bundle_job'),
+
+    url(r'^applications/pdfs/jobs/(?P<job_id>[0-9]+)/pdf/$',
+        login_required(views.bundle_job_pdf),
+        name='intake-pdf_bundle_job_pdf'),
+
     url(r'^application/(?P<submission_id>[0-9]+)/delete/$',
         login_required(views.delete_page),
         name='intake-delete_page'),
@@ -1,11 +1,15 @@
+import os
+import threading
 from django.conf import settings
+from django.db import connection, transaction
 from django.utils.translation import ugettext as _
 from django.utils.datastructures import MultiValueDict
 from django.shortcuts import render, redirect
-from django.core.urlresolvers import reverse_lazy
+from django.core.urlresolvers import reverse, reverse_lazy
 from django.contrib import messages
 
-from django.http import HttpResponseNotFound, HttpResponse
+from django.http import HttpResponseNotFound, HttpResponseBadRequest, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.views.generic import View
 from django.views.generic.base import TemplateView
 from django.views.generic.edit import FormView
@@ -14,7 +18,7 @@ from django.views.generic.edit import FormView
 
 from django.core import mail
 
-from intake import models, notifications, forms
+from intake import circuitbreaker, models, notifications, forms, responses, exports
 from project.jinja2 import url_with_ids
 
 
@@ -51,17 +55,68 @@ class MultiStepApplicationView(MultiStepFormViewBase):
         return super().form_invalid(form, *args, **kwargs)
 
     def confirmation(self, submission):
-        flash_messages = submission.send_confirmation_notifications()
+        try:
+            flash_messages = submission.send_confirmation_notifications()
+        except circuitbreaker.CircuitOpenError:
+            # front is down, so the outbox sends them once it is back
+            models.NotificationOutboxEntry.add_confirmations(submission)
+            # some may have gone out before the breaker opened
+            contact_info = submission.get_contact_info()
+            sent = submission.get_confirmations_sent()
+            flash_messages = submission.confirmation_flash_messages(
+                sorted(sent), contact_info)
+            flash_messages += submission.confirmation_flash_messages(
+                sorted(set(contact_info) - sent), contact_info, queued=True)
         for message in flash_messages:
             messages.success(self.request, message)
 
     def save_submission_and_send_notifications(self, form):
-        submission = models.FormSubmission(answers=form.data)
-        submission.save()
-        number = models.FormSubmission.objects.count()
-        notifications.slack_new_submission.send(
-            submission=submission, request=self.request, submission_count=number)
-        self.confirmation(submission)
+        if getattr(settings, 'NOTIFICATION_OUTBOX', False):
+            submission = self.save_submission_and_queue_notifications(form)
+        else:
+            submission = models.FormSubmission(answers=form.data)
+            submission.save()
+            number = models.FormSubmission.objects.count()
+            notifications.slack_new_submission.send(
+                submission=submission, request=self.request, submission_count=number)
+            self.confirmation(submission)
+        if getattr(settings, 'PRERENDER_PDFS_AFTER_SUBMIT', False):
+            self.prerender_pdf(submission)
+
+    def save_submission_and_queue_notifications(self, form):
+        """Saves the submission along with its notifications, which are
+        sent by `./manage.py send_notifications`
+        """
+        with transaction.atomic():
+            submission = models.FormSubmission(answers=form.data)
+            submission.save()
+            number = models.FormSubmission.objects.count()
+            models.NotificationOutboxEntry.add_new_submission(
+                submission,
+                pdf_url=self.request.build_absolute_uri(reverse(
+                    'intake-filled_pdf', kwargs={'submission_id': submission.id})),
+                submission_count=number)
+            models.NotificationOutboxEntry.add_confirmations(submission)
+        contact_info = submission.get_contact_info()
+        for message in submission.confirmation_flash_messages(
+                sorted(contact_info), contact_info, queued=True):
+            messages.success(self.request, message)
+        return submission
+
+    def prerender_pdf(self, submission):
+        """Fills the new submission's pdf in a background thread,
+        once the submission has been committed.
+        Anything that fails here is picked up by `./manage.py render_pdfs`
+        """
+        def render():
+            try:
+                fillable = models.FillablePDF.get_default_instance()
+                if fillable:
+                    fillable.prerender([submission])
+            finally:
+                connection.close()
+        transaction.on_commit(
+            lambda: threading.Thread(target=render, daemon=True).start())
 
     def form_valid(self, form):
         self.save_submission_and_send_notifications(form)
@@ -115,20 +170,49 @@ class PrivacyPolicy(TemplateView):
     template_name = "privacy_policy.jinja"
 
 
-class FilledPDF(View):
+class ConditionalPDFMixin:
+    """Lets browsers revalidate filled pdfs instead of downloading them
+    again. The ETag is the pdf's cache key, which changes with the
+    submissions' answers, the template pdf and the translator.
+    There is no Last-Modified, since no date changes with all of those,
+    so If-Modified-Since is ignored
+    """
+
+    def get_etag(self, fillable, submissions):
+        return fillable.get_cache_key(submissions)
+
+    def get_cache_control(self):
+        return getattr(settings, 'PDF_CACHE_CONTROL', 'private, no-cache')
+
+    def add_validators(self, response, etag):
+        return responses.set_validators(
+            response, etag, cache_control=self.get_cache_control())
+
+    def not_modified(self, etag):
+        return responses.not_modified_response(
+            etag, cache_control=self.get_cache_control())
+
+
+class FilledPDF(View, ConditionalPDFMixin):
 
     def get(self, request, submission_id):
         submission = models.FormSubmission.objects.get(id=int(submission_id))
         fillable = models.FillablePDF.get_default_instance()
-        pdf = fillable.fill(submission)
+        etag = self.get_etag(fillable, [submission])
+        if responses.is_not_modified(request, etag):
+            # the browser already has this pdf, so only log the open
+            models.FormSubmission.mark_viewed(
+                [submission], request.user, notify=False)
+            return self.not_modified(etag)
+        pdf = fillable.fill_cached(submission)
         # wrapper = FileWrapper(file(filename))
         # response = HttpResponse(wrapper, content_type='text/plain')
         # response['Content-Disposition'] = 'attachment; filename="%s"' % os.path.basename(filename)
         # response['Content-Length'] = os.path.getsize(filename)
         # return response
         models.FormSubmission.mark_viewed([submission], request.user)
-        return HttpResponse(pdf,
-            content_type="application/pdf")
+        return self.add_validators(
+            HttpResponse(pdf, content_type="application/pdf"), etag)
 
 
 class ApplicationIndex(TemplateView):
@@ -160,29 +244,171 @@ class MultiSubmissionMixin:
 
 
 class ApplicationBundle(View, MultiSubmissionMixin):
+    """Shows a bundle of applications. Bundles larger than
+    settings.PDF_BUNDLE_PART_SIZE are split into pages, each of which
+    loads the pdf of only its own applications.
+    Opening the bundle marks all of its applications as viewed, as it
+    did before bundles were split, and the later pages don't mark them
+    again
+    """
+
+    def get_page_url(self, ids, part):
+        return url_with_ids('intake-app_bundle', ids) + '&part={}'.format(part)
+
     def get(self, request):
         submission_ids = self.get_ids_from_params(request)
         submissions = list(models.FormSubmission.objects.filter(
             pk__in=submission_ids))
-        models.FormSubmission.mark_viewed(submissions, request.user)
-        return render(
-            request,
-            "app_bundle.jinja", {
-                'submissions': submissions,
-                'count': len(submissions),
-                'app_ids': submission_ids
-             })
-
+        part_size = getattr(settings, 'PDF_BUNDLE_PART_SIZE', 25)
+        part_count = max((len(submissions) - 1) // part_size + 1, 1)
+        try:
+            part = min(max(int(request.GET.get('part', 1)), 1), part_count)
+        except ValueError:
+            part = 1
+        start = (part - 1) * part_size
+        part_submissions = submissions[start:start + part_size]
+        if 'part' not in request.GET:
+            models.FormSubmission.mark_viewed(submissions, request.user)
+        context = {
+            'submissions': submissions,
+            'count': len(submissions),
+            'app_ids': submission_ids,
+            'part': part,
+            'part_count': part_count,
+            'part_start': start + 1,
+            'part_end': start + len(part_submissions),
+            'part_ids': [s.id for s in part_submissions],
+        }
+        if part_count > 1:
+            context['zip_url'] = url_with_ids(
+                'intake-pdf_bundle_zip', submission_ids)
+            if part > 1:
+                context['previous_url'] = self.get_page_url(
+                    submission_ids, part - 1)
+            if part < part_count:
+                context['next_url'] = self.get_page_url(
+                    submission_ids, part + 1)
+        return render(request, "app_bundle.jinja", context)
+
+
+class FilledPDFBundle(View, MultiSubmissionMixin, ConditionalPDFMixin):
+    def get(self, request):
+        submission_ids = self.get_ids_from_params(request)
+        submissions = list(models.FormSubmission.objects.filter(
+            pk__in=submission_ids))
+        if not submissions:
+            return HttpResponseNotFound()
+        fillable = models.FillablePDF.get_default_instance()
+        etag = self.get_etag(fillable, submissions)
+        if responses.is_not_modified(request, etag):
+            return self.not_modified(etag)
+        pdf, size, tmp_path = fillable.open_many_cached(submissions)
+        on_close = None
+        if tmp_path:
+            on_close = lambda: os.remove(tmp_path)
+        response = responses.file_response(
+            request, pdf, size, on_close=on_close)
+        return self.add_validators(response, etag)
+
+
+class FilledPDFBundleZip(View, MultiSubmissionMixin):
+    """Streams a zip of a bundle split into parts of
+    settings.PDF_BUNDLE_PART_SIZE applications, which are rendered in
+    parallel as the zip is downloaded
+    """
 
-class FilledPDFBundle(View, MultiSubmissionMixin):
     def get(self, request):
         submission_ids = self.get_ids_from_params(request)
-        submissions = models.FormSubmission.objects.filter(
-            pk__in=submission_ids)
+        submissions = list(models.FormSubmission.objects.filter(
+            pk__in=submission_ids))
+        if not submissions:
+            return HttpResponseNotFound()
         fillable = models.FillablePDF.get_default_instance()
-        pdf = fillable.fill_many(submissions)
-        return HttpResponse(pdf,
-            content_type="application/pdf")
+        parts = fillable.iter_bundle_parts(
+            submissions,
+            part_size=getattr(settings, 'PDF_BUNDLE_PART_SIZE', 25),
+            max_workers=getattr(settings, 'PDF_BUNDLE_PART_WORKERS', 2))
+        return responses.zip_response(
+            self.get_files(parts, len(submissions)), 'applications.zip')
+
+    def get_files(self, parts, count):
+        width = len(str(count))
+        start = 1
+        for part, path, is_temporary in parts:
+            end = start + len(part) - 1
+            name = 'applications-{}-{}.pdf'.format(
+                str(start).zfill(width), str(end).zfill(width))
+            on_written = None
+            if is_temporary:
+                on_written = lambda path=path: os.remove(path)
+            yield name, path, on_written
+            start = end + 1
+
+
+class ExportApplications(View):
+    """Streams a zip with one filled pdf per application, chosen by
+    `?ids=1,2,3` or by a `?start=YYYY-MM-DD&end=YYYY-MM-DD` date range
+    """
+
+    def get(self, request):
+        try:
+            ids = [int(i) for i in request.GET.get('ids', '').split(',') if i]
+            start, end = [
+                exports.parse_date(request.GET[key])
+                if request.GET.get(key) else None
+                for key in ('start', 'end')]
+        except ValueError:
+            return HttpResponseBadRequest("Invalid ids or dates")
+        if not (ids or start or end):
+            return HttpResponseBadRequest("No applications were chosen")
+        submissions = exports.get_submissions(ids=ids, start=start, end=end)
+        if not submissions:
+            return HttpResponseNotFound()
+        models.FormSubmission.mark_viewed(submissions, request.user)
+        return responses.zip_response(
+            exports.iter_files(submissions), 'applications.zip')
+
+
+class BundleJobMixin:
+
+    def serialize_job(self, job):
+        data = {
+            'id': job.id,
+            'status': job.get_status_display(),
+            'submission_ids': job.get_submission_ids(),
+            'status_url': reverse('intake-pdf_bundle_job',
+                kwargs={'job_id': job.id}),
+        }
+        if job.status == models.BundleJob.DONE:
+            data['pdf_url'] = reverse('intake-pdf_bundle_job_pdf',
+                kwargs={'job_id': job.id})
+        if job.status == models.BundleJob.FAILED:
+            data['error'] = job.error
+        return data
+
+
+class CreateBundleJob(View, MultiSubmissionMixin, BundleJobMixin):
+    """Queues a pdf bundle to be built by `./manage.py run_bundle_jobs`
+    and returns 202 with the job's status
+    """
+    def post(self, request):
+        submission_ids = self.get_ids_from_params(request)
+        job, created = models.BundleJob.get_or_create_for_ids(submission_ids)
+        return JsonResponse(self.serialize_job(job), status=202)
+
+
+class BundleJobStatus(View, BundleJobMixin):
+    def get(self, request, job_id):
+        job = get_object_or_404(models.BundleJob, pk=int(job_id))
+        return JsonResponse(self.serialize_job(job))
+
+
+class BundleJobPDF(View):
+    def get(self, request, job_id):
+        job = get_object_or_404(models.BundleJob, pk=int(job_id),
+            status=models.BundleJob.DONE)
+        job.pdf.open('rb')
+        return responses.file_response(request, job.pdf, job.pdf.size)
 
 
 class Delete(View):
@@ -200,9 +426,12 @@ class Delete(View):
             submission_id=submission_id,
             event_type=models.ApplicationLogEntry.DELETED
             )
+        # deleting clears the id, so the digest is given a copy
+        deleted = notifications.DigestSubmission(
+            id=submission.id, name=str(submission))
         submission.delete()
         notifications.slack_submissions_deleted.send(
-            submissions=[submission],
+            submissions=[deleted],
             user=request.user)
         return redirect(reverse_lazy('intake-app_index'))
 
@@ -235,6 +464,11 @@ privacy = PrivacyPolicy.as_view()
 stats = Stats.as_view()
 filled_pdf = FilledPDF.as_view()
 pdf_bundle = FilledPDFBundle.as_view()
+pdf_bundle_zip = FilledPDFBundleZip.as_view()
+export_applications = ExportApplications.as_view()
+create_bundle_job = CreateBundleJob.as_view()
+bundle_job_status = BundleJobStatus.as_view()
+bundle_job_pdf = BundleJobPDF.as_view()
 app_index = ApplicationIndex.as_view()
 app_bundle = ApplicationBundle.as_view()
 mark_processed = MarkProcessed.as_view()
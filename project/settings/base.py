@@ -39,6 +39,7 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'intake.middleware.PDFAdmissionMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -156,4 +157,100 @@ STATICFILES_DIRS = [
 ]
 STATICFILES_STORAGE = 'whitenoise.django.GzipManifestStaticFilesStorage'
 PDFPARSER_PATH = os.path.join(REPO_DIR, 'intake', 'pdfparser.jar')
+# 'subprocess' starts a new JVM for every pdfparser command
+# 'workers' keeps a pool of warm pdfparser JVMs in each process
+# both 'subprocess' and 'workers' need `make pdfparser.worker` for some commands
+# 'python' fills and joins pdfs in python, without java (intake/pdfforms.py)
+PDFPARSER_BACKEND = os.environ.get('PDFPARSER_BACKEND', 'subprocess')
+PDFPARSER_WORKERS = int(os.environ.get('PDFPARSER_WORKERS', 2))
+PDFPARSER_WORKER_TIMEOUT = int(os.environ.get('PDFPARSER_WORKER_TIMEOUT', 60))
+# how many pdfs to fill at the same time when building a bundle
+PDFPARSER_FILL_WORKERS = int(os.environ.get('PDFPARSER_FILL_WORKERS', 1))
+# keep pdfparser temporary files in memory (memfd or /dev/shm) instead of on disk
+PDFPARSER_IN_MEMORY = os.environ.get('PDFPARSER_IN_MEMORY', '') == 'True'
+# filled pdfs are cached in file storage, up to this many bytes
+FILLED_PDF_CACHE_MAX_BYTES = int(os.environ.get(
+    'FILLED_PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+# fill pdfs right after each submission, instead of on the first view
+# submissions that fail to render are retried by `./manage.py render_pdfs`
+PRERENDER_PDFS_AFTER_SUBMIT = os.environ.get(
+    'PRERENDER_PDFS_AFTER_SUBMIT', '') == 'True'
+PDF_RENDER_MAX_ATTEMPTS = 3
+# only submissions received in this many days, and not yet opened by an
+# agency, are swept by `./manage.py render_pdfs`
+PDF_PRERENDER_DAYS = 30
+# flatten forms and remove duplicate resources when joining pdf bundles
+PDFPARSER_OPTIMIZE_JOINS = os.environ.get(
+    'PDFPARSER_OPTIMIZE_JOINS', '') == 'True'
+# local copies of template pdfs kept in remote file storage
+PDF_TEMPLATE_CACHE_DIR = os.environ.get('PDF_TEMPLATE_CACHE_DIR', '')
+PDF_TEMPLATE_CACHE_MAX_BYTES = int(os.environ.get(
+    'PDF_TEMPLATE_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+# seconds before each process re-reads the default FillablePDF
+FILLABLE_PDF_REGISTRY_TTL = 60
+# host-wide limit on pdfparser commands running at the same time, 0 for none
+# requests that can't get a slot within the timeout get a 503 response
+PDF_ADMISSION_SLOTS = int(os.environ.get('PDF_ADMISSION_SLOTS', 0))
+PDF_ADMISSION_MAX_WAITING = int(os.environ.get('PDF_ADMISSION_MAX_WAITING', 10))
+PDF_ADMISSION_TIMEOUT = int(os.environ.get('PDF_ADMISSION_TIMEOUT', 20))
+PDF_ADMISSION_RETRY_AFTER = 10
+PDF_ADMISSION_LOCK_DIR = os.environ.get('PDF_ADMISSION_LOCK_DIR', '')
+# large bundles are split into parts of this many applications
+PDF_BUNDLE_PART_SIZE = int(os.environ.get('PDF_BUNDLE_PART_SIZE', 25))
+# how many parts of a zipped bundle are rendered at the same time
+PDF_BUNDLE_PART_WORKERS = int(os.environ.get('PDF_BUNDLE_PART_WORKERS', 2))
+# bundle jobs left running for this many seconds are run again, and
+# jobs and their pdfs are deleted after PDF_BUNDLE_JOB_EXPIRY seconds
+PDF_BUNDLE_JOB_LEASE = 600
+PDF_BUNDLE_JOB_EXPIRY = 24 * 60 * 60
+# filled pdfs can be kept by browsers, but not by shared caches, and are
+# revalidated with their ETag before each use
+PDF_CACHE_CONTROL = os.environ.get('PDF_CACHE_CONTROL', 'private, no-cache')
 
+# with NOTIFICATION_OUTBOX=True, new submissions queue their slack and
+# front notifications, to be sent by `./manage.py send_notifications
+# --loop`, instead of sending them before responding to the applicant.
+# Only turn it on once the Procfile's notifications process is running
+NOTIFICATION_OUTBOX = os.environ.get('NOTIFICATION_OUTBOX', '') == 'True'
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = 8
+# seconds before the first retry, doubling after each failed attempt
+NOTIFICATION_OUTBOX_BACKOFF = 30
+NOTIFICATION_OUTBOX_MAX_BACKOFF = 3600
+# entries left sending for this many seconds are picked up again
+NOTIFICATION_OUTBOX_LEASE = 300
+
+# requests to Front and Slack (intake/httpclient.py)
+HTTP_CLIENT_CONNECT_TIMEOUT = 3.05
+HTTP_CLIENT_READ_TIMEOUT = 10
+# retries after connection errors, 429s and 5xx responses
+HTTP_CLIENT_RETRIES = 2
+HTTP_CLIENT_BACKOFF = 0.5
+# longest wait before a retry, responses asking for longer are returned
+HTTP_CLIENT_MAX_BACKOFF = 10
+HTTP_CLIENT_POOL_SIZE = 10
+
+# each front channel stops sending for CIRCUIT_BREAKER_OPEN_SECONDS once
+# CIRCUIT_BREAKER_FAILURE_RATE of at least CIRCUIT_BREAKER_MINIMUM_CALLS
+# messages in CIRCUIT_BREAKER_WINDOW seconds have failed
+CIRCUIT_BREAKER_FAILURE_RATE = 0.5
+CIRCUIT_BREAKER_MINIMUM_CALLS = 5
+CIRCUIT_BREAKER_WINDOW = 60
+CIRCUIT_BREAKER_OPEN_SECONDS = 60
+
+# with SLACK_DIGESTS=True, slack messages about staff opening, processing
+# and deleting apps are queued and sent as one message for each user and
+# action, by `./manage.py send_notifications`, once the oldest has waited
+# SLACK_DIGEST_WINDOW seconds or there are SLACK_DIGEST_MAX_EVENTS.
+# Only turn it on once the Procfile's notifications process is running
+SLACK_DIGESTS = os.environ.get('SLACK_DIGESTS', '') == 'True'
+SLACK_DIGEST_WINDOW = 60
+SLACK_DIGEST_MAX_EVENTS = 25
+# most digests to look at in each pass of the worker
+SLACK_DIGEST_MAX_GROUPS = 20
+# seconds before retrying a digest, doubling after each failed attempt
+SLACK_DIGEST_BACKOFF = 30
+SLACK_DIGEST_MAX_BACKOFF = 3600
+# digests left sending for this many seconds are picked up again
+SLACK_DIGEST_LEASE = 300
+# seconds between slack digests sent by the worker
+SLACK_MESSAGE_INTERVAL = 1
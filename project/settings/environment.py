@@ -19,6 +19,10 @@ AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME', '')
 DEFAULT_FILE_STORAGE = os.environ.get('DEFAULT_FILE_STORAGE',
     'django.core.files.storage.FileSystemStorage')
 # set to 'storages.backends.s3boto.S3BotoStorage' for prod
+# filled pdfs and bundles are kept in this storage, always with a private
+# acl (see intake/storage.py)
+PRIVATE_FILE_STORAGE = os.environ.get('PRIVATE_FILE_STORAGE',
+    DEFAULT_FILE_STORAGE)
 
 if 'FileSystem' in DEFAULT_FILE_STORAGE:
     MEDIA_ROOT = os.path.join(REPO_DIR, 'project', 'media')
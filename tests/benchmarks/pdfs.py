@@ -0,0 +1,155 @@
+"""Times the pdf pipeline using tests/sample_pdfs/sample_form.pdf,
+tests/sample_translator.py and the factories in intake.tests.mock.
+
+Runs against a throwaway test database, and needs java and pdfparser.jar,
+like the rest of the pdf tests.
+
+    python -m tests.benchmarks.pdfs --output results.json
+    python -m tests.benchmarks.pdfs --compare baseline.json
+
+Each case records its wall time, the number of subprocesses started and
+the peak resident memory of this process and of its largest child, in
+kilobytes. Peak memory is the high-water mark so far, so it only grows
+from one case to the next. With `--compare`, cases that are slower than
+the baseline by more than `--threshold`, or that start more subprocesses,
+are reported as regressions and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from collections import OrderedDict
+from unittest.mock import patch
+
+
+DEFAULT_SIZES = (1, 10, 100, 500)
+
+
+def peak_rss():
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def measure(func, repeat=1):
+    """Runs `func` `repeat` times, returning the fastest wall time,
+    the subprocesses started per run, and peak memory use
+    """
+    times = []
+    with patch('subprocess.Popen', wraps=subprocess.Popen) as popen:
+        for i in range(repeat):
+            started = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - started)
+    self_rss, children_rss = peak_rss()
+    return {
+        'wall': min(times),
+        'subprocesses': popen.call_count // repeat,
+        'peak_rss_kb': self_rss,
+        'children_peak_rss_kb': children_rss,
+    }
+
+
+def run(sizes=DEFAULT_SIZES, repeat=1):
+    from intake.tests import mock
+    from intake import pdfparser
+    fillable = mock.fillable_pdf()
+    submissions = mock.FormSubmissionFactory.create_batch(max(sizes))
+    # read the field data once, as a running server would have
+    fillable.get_field_data()
+
+    cases = OrderedDict()
+    cases['fill'] = measure(
+        lambda: fillable.fill(submissions[0]), repeat)
+    for size in sizes:
+        cases['fill_many_{}'.format(size)] = measure(
+            lambda: fillable.fill_many(submissions[:size]), repeat)
+
+    filled = fillable.fill(submissions[0])
+    for size in sizes:
+        if size < 2:
+            continue
+        cases['join_pdfs_{}'.format(size)] = measure(
+            lambda: pdfparser.PDFParser().join_pdfs([filled] * size), repeat)
+
+    fillable.delete()
+    return cases
+
+
+def compare(results, baseline, threshold):
+    """Returns a list of messages describing regressions from `baseline`
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result['wall'] > before['wall'] * (1 + threshold):
+            regressions.append(
+                "{}: {:.3f}s, was {:.3f}s".format(
+                    name, result['wall'], before['wall']))
+        if result['subprocesses'] > before['subprocesses']:
+            regressions.append(
+                "{}: {} subprocesses, was {}".format(
+                    name, result['subprocesses'], before['subprocesses']))
+    return regressions
+
+
+def print_results(cases):
+    row = '{:<16} {:>10} {:>8} {:>12} {:>14}'
+    print(row.format(
+        'case', 'wall s', 'procs', 'peak rss kb', 'child rss kb'))
+    for name, case in cases.items():
+        print(row.format(
+            name, '{:.3f}'.format(case['wall']), case['subprocesses'],
+            case['peak_rss_kb'], case['children_peak_rss_kb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+        default=list(DEFAULT_SIZES),
+        help='numbers of submissions to fill with fill_many')
+    parser.add_argument('--repeat', type=int, default=1,
+        help='runs of each case, the fastest is kept')
+    parser.add_argument('--output',
+        help='write the results to this json file')
+    parser.add_argument('--compare',
+        help='a results file to check for regressions against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+        help='allowed slowdown before a case counts as a regression')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings.dev")
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        cases = run(args.sizes, args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print_results(cases)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'cases': cases}, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['cases']
+        regressions = compare(cases, baseline, args.threshold)
+        for message in regressions:
+            print("REGRESSION", message)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
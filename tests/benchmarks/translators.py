@@ -0,0 +1,69 @@
+"""Compares FormToPDFTranslator.translate_many with the old per-item path,
+which walked the config and inspected every extractor for each submission.
+
+    python -m tests.benchmarks.translators [count]
+"""
+import os
+import sys
+import timeit
+
+
+class FakeSubmission:
+
+    def __init__(self):
+        self.answers = dict(
+            address=dict(street='111 Main St.', city='Oakland',
+                state='CA', zip='94609'),
+            dob=dict(month='2', day='1', year='82'),
+            first_name='Foo', middle_name='Gaz', last_name='Bar',
+            ssn='999999999', rap_outside_sf='yes', being_charged='no',
+            currently_employed='yes', on_probation_parole='yes',
+            where_probation_or_parole='contra costa',
+            when_probation_or_parole='2017', us_citizen='yes',
+            serving_sentence='no', monthly_income='1800',
+            monthly_expenses='1800', email='someone@gmail.com',
+            phone_number='510-415-0000')
+
+    def get_local_date_received(self, fmt):
+        return '6/11/2016'
+
+
+def per_item_translate(translator, data):
+    """The translation loop as it worked before translators were compiled
+    """
+    if translator.is_new(data):
+        data.answers = translator.oldify(data)
+    result = {}
+    for key, extractor in translator.config.items():
+        if hasattr(extractor, '__call__'):
+            result[key] = extractor(data)
+        else:
+            result[key] = translator.get_attribute_data(data, extractor)
+    return result
+
+
+def run(count=500, repeat=5):
+    from intake.translators.clean_slate import translator
+    submissions = [FakeSubmission() for i in range(count)]
+
+    def per_item():
+        for submission in submissions:
+            per_item_translate(translator, submission)
+
+    def batch():
+        translator.translate_many(submissions)
+
+    results = {
+        'per_item': min(timeit.repeat(per_item, number=1, repeat=repeat)),
+        'translate_many': min(timeit.repeat(batch, number=1, repeat=repeat)),
+    }
+    for name, seconds in results.items():
+        print("{:<16} {} submissions: {:.4f}s".format(name, count, seconds))
+    return results
+
+
+if __name__ == '__main__':
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings.dev")
+    import django
+    django.setup()
+    run(*[int(arg) for arg in sys.argv[1:2]])